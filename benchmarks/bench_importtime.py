@@ -0,0 +1,123 @@
+"""Measure the import time of the scripts which WorkFlows runs for every job
+
+Every job starts a new Python interpreter which imports one of these modules,
+so slow imports (e.g. pandas, pysolar, xarray) add up over many cycles and members.
+The import time is measured with `python -X importtime`, the best of `--repeat` runs is used.
+
+Usage:
+    # record the current state
+    python benchmarks/bench_importtime.py --save benchmarks/importtime_baseline.json
+
+    # compare against it, exit code 1 if a module got slower than threshold*baseline
+    python benchmarks/bench_importtime.py --baseline benchmarks/importtime_baseline.json
+
+Run it from the repository root, or with dartwrf in PYTHONPATH.
+"""
+import os
+import sys
+import json
+import argparse
+import subprocess
+
+# modules executed as scripts by dartwrf.workflows.WorkFlows
+entry_points = ['dartwrf.assimilate',
+                'dartwrf.prep_IC_prior',
+                'dartwrf.update_IC',
+                'dartwrf.prepare_namelist',
+                'dartwrf.prepare_wrfrundir',
+                'dartwrf.create_wbubble_wrfinput',
+                'dartwrf.obs.create_obsseq_out',
+                ]
+
+dir_repo = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+def parse_importtime(stderr):
+    """Total import time of dartwrf and everything it imports
+
+    Sums the cumulative time of all top-level imports from the first dartwrf import on,
+    i.e. the interpreter startup (site, encodings) is not counted.
+
+    Returns:
+        float: import time in milliseconds
+    """
+    total_us = 0
+    started = False
+    for line in stderr.splitlines():
+        if not line.startswith('import time:') or 'cumulative' in line:
+            continue
+        _, cumulative, name = line[len('import time:'):].split('|')
+        if name.startswith('  '):  # nested import, already included in its parent
+            continue
+        if name.strip().startswith('dartwrf'):
+            started = True
+        if started:
+            total_us += int(cumulative)
+    return total_us / 1e3
+
+
+def measure(module, repeat=3):
+    """Import time of `module` in a new interpreter, best of `repeat` runs
+
+    Returns:
+        float: import time in milliseconds
+    """
+    env = dict(os.environ)
+    env['PYTHONPATH'] = dir_repo + os.pathsep + env.get('PYTHONPATH', '')
+    times = []
+    for _ in range(repeat):
+        p = subprocess.run([sys.executable, '-X', 'importtime', '-c', 'import '+module],
+                           capture_output=True, text=True, env=env)
+        if p.returncode != 0:
+            raise RuntimeError('import '+module+' failed: '+p.stderr.splitlines()[-1])
+        times.append(parse_importtime(p.stderr))
+    return min(times)
+
+
+def compare(results, baseline, threshold=1.2, min_increase_ms=20):
+    """Find modules whose import time increased by more than `threshold` times the baseline
+    (and by at least `min_increase_ms`, to ignore noise of fast imports)
+
+    Returns:
+        list of str: descriptions of regressions
+    """
+    regressions = []
+    for module, t in results.items():
+        if module not in baseline:
+            continue
+        t0 = baseline[module]
+        if t > t0*threshold and t - t0 > min_increase_ms:
+            regressions.append('{}: {:.0f} ms (baseline {:.0f} ms)'.format(module, t, t0))
+    return regressions
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Import time of DART-WRF entry-point scripts')
+    parser.add_argument('--repeat', type=int, default=3)
+    parser.add_argument('--save', help='write results to this JSON file')
+    parser.add_argument('--baseline', help='compare against this JSON file')
+    parser.add_argument('--threshold', type=float, default=1.2,
+                        help='allowed ratio to the baseline (default: 1.2)')
+    args = parser.parse_args()
+
+    results = {}
+    for module in entry_points:
+        try:
+            results[module] = measure(module, repeat=args.repeat)
+            print('{:40s} {:8.0f} ms'.format(module, results[module]))
+        except RuntimeError as e:
+            print('{:40s}  skipped ({})'.format(module, e))
+
+    if args.save:
+        with open(args.save, 'w') as f:
+            json.dump(results, f, indent=1)
+        print('saved to', args.save)
+
+    if args.baseline:
+        with open(args.baseline) as f:
+            baseline = json.load(f)
+        regressions = compare(results, baseline, threshold=args.threshold)
+        if regressions:
+            print('Import time regressions:\n  '+'\n  '.join(regressions))
+            sys.exit(1)
+        print('No import time regressions')
@@ -0,0 +1,76 @@
+"""Time writing obs_seq.in for many observations, column-wise vs. observation by observation
+
+The default case is 50000 radar observations on 7 levels.
+Both files are compared, the script exits with code 1 if they differ.
+
+Usage:
+    python benchmarks/bench_obs_seq_in.py [--n-obs 50000] [--n-levels 7]
+
+Run it from the repository root, or with dartwrf in PYTHONPATH.
+"""
+import os
+import sys
+import time
+import argparse
+import tempfile
+import datetime as dt
+
+import numpy as np
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from dartwrf.obs import create_obsseq_in as osi
+
+obs_kind_nrs = {'RADAR_REFLECTIVITY': 37}
+
+
+def write_by_observation(output_path, time_dt, obscfg):
+    """Previous implementation: one `write_section` per observation, appended to one string"""
+    time_dt = osi._add_timezone_UTC(time_dt)
+    dart_date_day, secs_thatday = osi.get_dart_date(time_dt)
+    for lat, lon in obscfg['obs_locations']:
+        assert (lat < 90) & (lat > -90), 'latitude out of bounds'
+        assert (lon < 180) & (lon > -180), 'longitude out of bounds'
+    coords = osi._append_hgt_to_coords(obscfg['obs_locations'], obscfg['heights'])
+    obserr_std = np.zeros(len(coords)) + obscfg["error_generate"]
+
+    txt = ''
+    for i_obs in range(len(coords)):
+        txt += osi.write_section(dict(i=i_obs+1, kind_nr=obs_kind_nrs[obscfg['kind']],
+                                      dart_date_day=dart_date_day, secs_thatday=secs_thatday,
+                                      lon=coords[i_obs][1], lat=coords[i_obs][0],
+                                      vert_coord=coords[i_obs][2], vert_coord_sys="3",
+                                      obserr_var=obserr_std[i_obs]**2, appendix=''),
+                                 last=(i_obs == len(coords)-1))
+    osi._write_file(osi.preamble(len(coords), [obscfg['kind']], obs_kind_nrs) + txt, output_path)
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Benchmark obs_seq.in writing')
+    parser.add_argument('--n-obs', type=int, default=50000, help='number of horizontal locations')
+    parser.add_argument('--n-levels', type=int, default=7, help='number of vertical levels')
+    args = parser.parse_args()
+
+    rng = np.random.default_rng(0)
+    locations = [(lat, lon) for lat, lon in zip(rng.uniform(40, 50, args.n_obs).astype(np.float32),
+                                                rng.uniform(-20, 20, args.n_obs).astype(np.float32))]
+    obscfg = dict(kind='RADAR_REFLECTIVITY', heights=list(range(1000, 1000*(args.n_levels+1), 1000)),
+                  error_generate=2.5, obs_locations=locations)
+    time_dt = dt.datetime(2008, 7, 30, 12)
+
+    with tempfile.TemporaryDirectory() as tmp:
+        t0 = time.perf_counter()
+        write_by_observation(tmp+'/obs_seq.in.loop', time_dt, obscfg)
+        t_loop = time.perf_counter() - t0
+
+        t0 = time.perf_counter()
+        osi.write_obs_seq_in(tmp+'/obs_seq.in', time_dt, [obscfg], obs_kind_nrs)
+        t_columns = time.perf_counter() - t0
+
+        with open(tmp+'/obs_seq.in.loop', 'rb') as f1, open(tmp+'/obs_seq.in', 'rb') as f2:
+            identical = f1.read() == f2.read()
+
+    print('observations:', args.n_obs*args.n_levels)
+    print('by observation: {:.2f} s'.format(t_loop))
+    print('column-wise:    {:.2f} s ({:.1f}x)'.format(t_columns, t_loop/t_columns))
+    print('identical:', identical)
+    sys.exit(0 if identical else 1)
@@ -6,12 +6,10 @@ import glob
 import time as time_module
 import datetime as dt
 import numpy as np
+from concurrent.futures import ThreadPoolExecutor
 
 from dartwrf.utils import Config, symlink, copy, try_remove, print, shell, write_txt, obskind_read
-from dartwrf import wrfout_add_geo
-from dartwrf.obs import error_models as err
-from dartwrf.obs import obsseq
-from dartwrf import dart_nml
+from dartwrf import dart_nml, dart_log, dart_ranks
 
 
 def prepare_DART_grid_template(cfg):
@@ -26,6 +24,7 @@ def prepare_DART_grid_template(cfg):
         copy(f_wrfout_dummy, cfg.dir_dart_run + "/wrfinput_d01")
     
         if cfg.geo_em_forecast:
+            from dartwrf import wrfout_add_geo
             wrfout_add_geo.run(cfg.geo_em_forecast, 
                                cfg.dir_dart_run + "/wrfinput_d01",
                                cfg.ncks)
@@ -76,12 +75,13 @@ def prepare_prior_ensemble(cfg, assim_time, prior_init_time, prior_valid_time, p
     write_list_of_outputfiles(cfg)
 
     print("removing preassim and filter_restart")
-    os.system("rm -rf " + cfg.dir_dart_run + "/preassim_*")
-    os.system("rm -rf " + cfg.dir_dart_run + "/filter_restart*")
-    os.system("rm -rf " + cfg.dir_dart_run + "/output_mean*")
-    os.system("rm -rf " + cfg.dir_dart_run + "/output_sd*")
-    os.system("rm -rf " + cfg.dir_dart_run + "/perfect_output_*")
-    os.system("rm -rf " + cfg.dir_dart_run + "/obs_seq.fina*")
+    for pattern in ["/preassim_*", "/filter_restart*", "/output_mean*", "/output_sd*",
+                    "/perfect_output_*", "/obs_seq.fina*"]:
+        for f in glob.glob(cfg.dir_dart_run + pattern):
+            if os.path.isdir(f) and not os.path.islink(f):
+                shutil.rmtree(f)
+            else:
+                try_remove(f)
 
 
 def use_linked_files_as_prior(cfg):
@@ -117,16 +117,91 @@ def write_list_of_outputfiles(cfg):
     write_txt(files, cfg.dir_dart_run+'/output_list.txt')
 
 
-def filter(cfg):
+def _get_dir_scratch(cfg):
+    """Node-local directory for DART input/output, e.g. '/tmp/<exp>/' or '$TMPDIR/<exp>/'
+    """
+    return os.path.expandvars(cfg.dir_dart_scratch.replace('<exp>', cfg.name))
+
+
+def stage_prior_to_scratch(cfg):
+    """Copy the prior ensemble to node-local scratch and let DART read/write there
+
+    Copies run in parallel. Afterwards, `input_list.txt` and `output_list.txt`
+    point to the scratch directory; all other files (obs_seq.*, input.nml, logs)
+    stay in `cfg.dir_dart_run`.
+    """
+    dir_scratch = _get_dir_scratch(cfg)
+    print('staging prior ensemble to', dir_scratch)
+
+    def _stage(iens):
+        f_src = os.path.realpath(cfg.dir_dart_run + "/prior_ens" + str(iens) + "/wrfout_d01")
+        f_dst = dir_scratch + "/prior_ens" + str(iens) + "/wrfout_d01"
+        os.makedirs(os.path.dirname(f_dst), exist_ok=True)
+        copy(f_src, f_dst, skip_if_identical=True)
+        try_remove(dir_scratch + "/filter_restart_d01." + str(iens).zfill(4))
+        return f_dst
+
+    n_threads = min(cfg.ensemble_size, getattr(cfg, 'max_copy_threads', 8))
+    with ThreadPoolExecutor(max_workers=n_threads) as executor:
+        files_in = list(executor.map(_stage, range(1, cfg.ensemble_size+1)))
+
+    files_out = [dir_scratch + "/filter_restart_d01." + str(iens).zfill(4)
+                 for iens in range(1, cfg.ensemble_size+1)]
+    write_txt(files_in, cfg.dir_dart_run+'/input_list.txt')
+    write_txt(files_out, cfg.dir_dart_run+'/output_list.txt')
+
+
+def fetch_filter_output_from_scratch(cfg):
+    """Move `filter_restart` files from node-local scratch back to `cfg.dir_dart_run`
+
+    Files are moved asynchronously, call `.result()` on the returned futures to wait.
+
+    Returns:
+        list of concurrent.futures.Future
+    """
+    dir_scratch = _get_dir_scratch(cfg)
+
+    def _fetch(iens):
+        fname = "/filter_restart_d01." + str(iens).zfill(4)
+        copy(dir_scratch + fname, cfg.dir_dart_run + fname)
+        try_remove(dir_scratch + fname)
+        try_remove(dir_scratch + "/prior_ens" + str(iens) + "/wrfout_d01")
+
+    n_threads = min(cfg.ensemble_size, getattr(cfg, 'max_copy_threads', 8))
+    executor = ThreadPoolExecutor(max_workers=n_threads)
+    futures = [executor.submit(_fetch, iens) for iens in range(1, cfg.ensemble_size+1)]
+    executor.shutdown(wait=False)  # pending copies continue in the background
+    return futures
+
+
+def unstage_scratch(cfg):
+    """Point `input_list.txt` and `output_list.txt` back to `cfg.dir_dart_run` and remove the scratch directory
+
+    Used if ./filter failed, so that later calls do not read from a scratch directory
+    which may not exist anymore (e.g. on another node).
+    """
+    use_linked_files_as_prior(cfg)
+    write_list_of_outputfiles(cfg)
+    shutil.rmtree(_get_dir_scratch(cfg), ignore_errors=True)
+
+
+def select_nproc(cfg, just_prior_values=False):
+    """Number of MPI tasks for ./filter with the obs_seq.out in run_DART, None unless `cfg.auto_nproc`"""
+    n_obs = dart_log.count_obs(cfg.dir_dart_run + "/obs_seq.out")
+    return dart_ranks.select_nproc(cfg, 'filter', n_obs, just_prior_values=just_prior_values)
+
+
+def filter(cfg, nproc=None, just_prior_values=False):
     """Calls DART ./filter program
 
     Args:
-        nproc (int): number of cores for use in ./filter call
+        nproc (int): number of cores for use in ./filter call, default: `cfg.max_nproc`
+        just_prior_values (bool): the namelist only evaluates the prior (for the performance history)
 
     Returns:
         None    (writes to file)
     """
-    nproc = cfg.max_nproc
+    nproc = nproc or cfg.max_nproc
         
     print("time now", dt.datetime.now())
     print("running filter")
@@ -136,11 +211,15 @@ def filter(cfg):
     t = time_module.time()
     if nproc > 1:
         # -genv I_MPI_PIN_PROCESSOR_LIST=0-"+str(int(nproc) - 1)
-        shell(cfg.dart_modules+"; mpirun -np " +
-              str(int(nproc))+" ./filter > log.filter")
+        cmd = cfg.dart_modules+"; mpirun -np "+str(int(nproc))+" ./filter"
     else:
-        shell(cfg.dart_modules+"; ./filter > log.filter")
+        cmd = cfg.dart_modules+"; ./filter"
+    shell(cmd, cwd=cfg.dir_dart_run, log_file=cfg.dir_dart_run+"/log.filter",
+          timeout=getattr(cfg, 'timeout_dart_s', None), 
+          metrics_file=cfg.dir_log+'/process_metrics.jsonl', name='filter')
     print("./filter took", int(time_module.time() - t), "seconds")
+    dart_log.record_run(cfg, 'filter', cfg.dir_dart_run+"/log.filter", cfg.dir_dart_run+"/obs_seq.out",
+                        nproc=nproc, wall_s=time_module.time() - t, just_prior_values=just_prior_values)
 
     if not os.path.isfile(cfg.dir_dart_run + "/obs_seq.final"):
         raise RuntimeError(
@@ -150,6 +229,10 @@ def filter(cfg):
 
 def archive_filteroutput(cfg, time):
     """Archive filter output files (filter_restart, preassim, postassim, output_mean, output_sd)
+
+    Note:
+        If `cfg.archive_increments` is True, compressed increments (posterior minus prior)
+        are archived instead of full `filter_restart` files.
     """
     # archive diagnostics
     dir_out = cfg.dir_archive + time.strftime(cfg.pattern_init_time)
@@ -158,12 +241,17 @@ def archive_filteroutput(cfg, time):
     # copy input.nml to archive
     copy(cfg.dir_dart_run + "/input.nml", dir_out + "/input.nml")
 
-    # copy filter_restart files to archive (initial condition for next run)
-    for iens in range(1, cfg.ensemble_size + 1):  # single members
-        copy(
-            cfg.dir_dart_run + "/filter_restart_d01." + str(iens).zfill(4),
-            dir_out + "/filter_restart_d01." + str(iens).zfill(4),
-        )
+    if getattr(cfg, 'archive_increments', False):
+        # archive increments (initial condition for next run = prior + increment)
+        from dartwrf import increments
+        increments.archive_increments(cfg, time)
+    else:
+        # copy filter_restart files to archive (initial condition for next run)
+        for iens in range(1, cfg.ensemble_size + 1):  # single members
+            copy(
+                cfg.dir_dart_run + "/filter_restart_d01." + str(iens).zfill(4),
+                dir_out + "/filter_restart_d01." + str(iens).zfill(4),
+            )
 
     # copy preassim/postassim files to archive (not necessary for next forecast run)
     for f in ["preassim_mean.nc", "preassim_sd.nc",
@@ -196,6 +284,8 @@ def get_parametrized_error(obscfg, osf_prior) -> np.ndarray: # type: ignore
     Returns:
         np.array: observation error std-dev for assimilation
     """
+    from dartwrf.obs import error_models as err
+
     Hx_prior = osf_prior.get_prior_Hx().T
     Hx_truth = osf_prior.get_truth_Hx()
 
@@ -254,6 +344,7 @@ def set_obserr_assimilate_in_obsseqout(cfg, oso, outfile="./obs_seq.out"):
                         evaluate(cfg, cfg.time, f_out_pattern=f_osf)
 
                     # read prior (obs_seq.final)
+                    from dartwrf.obs import obsseq
                     osf_prior = obsseq.ObsSeq(f_osf)
                     where_osf_iskind = osf_prior.df.kind == kind
 
@@ -282,6 +373,7 @@ def reject_small_FGD(cfg, time, oso):
         The pre-existing obs_seq.out will be archived.
         The new obs_seq.out will be written to the DART run directory.
     """
+    from dartwrf.obs import obsseq
     osf_prior = obsseq.ObsSeq(cfg.dir_dart_run + "/obs_seq.final")
 
     # obs should be superobbed already!
@@ -381,8 +473,9 @@ def evaluate(cfg, assim_time,
             raise RuntimeError(cfg.dir_dart_run +
                                '/obs_seq.out does not exist')
 
-    dart_nml.write_namelist(cfg, just_prior_values=True)
-    filter(cfg)
+    nproc = select_nproc(cfg, just_prior_values=True)
+    dart_nml.write_namelist(cfg, just_prior_values=True, nproc=nproc)
+    filter(cfg, nproc=nproc, just_prior_values=True)
     archive_filter_diagnostics(cfg, assim_time, f_out_pattern)
 
 
@@ -402,9 +495,9 @@ def txtlink_to_prior(cfg, time, prior_init_time, prior_path_exp):
     """
     os.makedirs(cfg.dir_archive +
                 time.strftime('/%Y-%m-%d_%H:%M/'), exist_ok=True)
-    os.system('echo "'+prior_path_exp+'\n'+prior_init_time.strftime('/%Y-%m-%d_%H:%M/')
-              + '\n'+time.strftime('/wrfrst_d01_%Y-%m-%d_%H:%M:%S')+'" > '
-                + cfg.dir_archive + time.strftime('/%Y-%m-%d_%H:%M/')+'link_to_prior.txt')
+    write_txt([prior_path_exp, prior_init_time.strftime('/%Y-%m-%d_%H:%M/'),
+               time.strftime('/wrfrst_d01_%Y-%m-%d_%H:%M:%S')],
+              cfg.dir_archive + time.strftime('/%Y-%m-%d_%H:%M/')+'link_to_prior.txt')
 
 
 def prepare_adapt_inflation(cfg, time, prior_init_time):
@@ -506,7 +599,8 @@ def prepare_run_DART_folder(cfg: Config):
     # remove any remains of a previous run
     os.makedirs(cfg.dir_dart_run, exist_ok=True)
     os.chdir(cfg.dir_dart_run)
-    os.system("rm -f input.nml obs_seq.in obs_seq.out-orig obs_seq.final")
+    for f in ["input.nml", "obs_seq.in", "obs_seq.out-orig", "obs_seq.final"]:
+        try_remove(cfg.dir_dart_run + '/' + f)
     
     __link_DART_exe()
     
@@ -559,7 +653,8 @@ def get_obsseq_out(cfg, time, prior_path_exp, prior_init_time, prior_valid_time)
         CF_config = cfg.CF_config.copy()
         f_prior_pattern = CF_config.pop('first_guess_pattern')
         f_obs_pattern = time.strftime(CF_config.pop('f_obs_pattern'))
-        f_obs = glob.glob(f_obs_pattern)
+        from dartwrf import catalog
+        f_obs = catalog.find_files(cfg, f_obs_pattern)
         if len(f_obs) == 0:
             raise FileNotFoundError(f_obs_pattern + ' not found')
         f_obs = f_obs[0]
@@ -591,6 +686,7 @@ def get_obsseq_out(cfg, time, prior_path_exp, prior_init_time, prior_valid_time)
 
     # read so that we can return it
     if oso is None:
+        from dartwrf.obs import obsseq
         oso = obsseq.ObsSeq(cfg.dir_dart_run + "/obs_seq.out")
     return oso
 
@@ -653,13 +749,33 @@ def main(cfg: Config):
     if prior_inflation_type != '0':
         prepare_adapt_inflation(cfg, time, prior_init_time)
 
+    # stage DART input/output to node-local scratch?
+    use_scratch = bool(getattr(cfg, 'dir_dart_scratch', False))
+
     print(" run filter ")
-    dart_nml.write_namelist(cfg)
-    filter(cfg)
-    archive_filteroutput(cfg, time)
+    nproc = select_nproc(cfg)
+    dart_nml.write_namelist(cfg, nproc=nproc)
+    try:
+        if use_scratch:
+            stage_prior_to_scratch(cfg)
+        filter(cfg, nproc=nproc)
+    except BaseException:
+        if use_scratch:
+            unstage_scratch(cfg)
+        raise
+    if use_scratch:
+        fetching = fetch_filter_output_from_scratch(cfg)
+
     archive_filter_diagnostics(cfg, time, cfg.pattern_obs_seq_final)
     txtlink_to_prior(cfg, time, prior_init_time, prior_path_exp)
 
+    if use_scratch:
+        for future in fetching:
+            future.result()  # wait until filter output is back in run_DART
+        use_linked_files_as_prior(cfg)
+        write_list_of_outputfiles(cfg)
+    archive_filteroutput(cfg, time)
+
     if prior_inflation_type != '0':
         archive_adapt_inflation(cfg, time)
 
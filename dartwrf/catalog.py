@@ -0,0 +1,254 @@
+"""Catalog of archive files in SQLite, instead of globbing on the parallel filesystem
+
+Directories are scanned once, later scans only list directories whose modification time changed
+(a directory's mtime changes when files are added or removed).
+For every file, the experiment, initialization time, member, valid time and file type are parsed from
+the path as in `sim_archive/<experiment>/<init time>/<member>/wrfout_d01_<valid time>`.
+
+With `cfg.catalog_db` set (e.g. `~/.cache/dartwrf/catalog.sqlite`), `find_files` answers glob patterns
+from the catalog; if nothing matches, the directory is rescanned and finally globbed as before.
+
+Example:
+    >>> cat = Catalog('catalog.sqlite')
+    >>> cat.scan('/jetfs/home/lkugler/data/sim_archive/nat_250m_obs1km')
+    >>> cat.query(valid_time=dt.datetime(2008, 7, 30, 12), file_type='wrfout_d01')
+
+Usage:
+    python -m dartwrf.catalog <db> <directory> [<directory> ...]
+"""
+import os
+import re
+import sys
+import glob
+import time
+import sqlite3
+import fnmatch
+import datetime as dt
+
+default_db = os.path.join(os.environ.get('XDG_CACHE_HOME', os.path.expanduser('~/.cache')),
+                          'dartwrf', 'catalog.sqlite')
+
+time_fmt = '%Y-%m-%d_%H:%M:%S'
+re_time = re.compile(r'(\d{4}-\d{2}-\d{2})_(\d{2})[:_](\d{2})(?:[:_](\d{2}))?')
+
+
+def _parse_time(s):
+    match = re_time.search(s)
+    if not match:
+        return None
+    day, hour, minute, second = match.groups()
+    return day + '_' + hour + ':' + minute + ':' + (second or '00')
+
+
+def parse_path(root, path):
+    """Experiment, init time, member, valid time and file type from a path in the archive
+
+    Returns:
+        tuple of str/int or None for each field that is not in the path
+    """
+    parts = os.path.relpath(path, root).split('/')
+    dirs, name = parts[:-1], parts[-1]
+    experiment = dirs[0] if dirs and _parse_time(dirs[0]) is None else os.path.basename(root)
+    init_time = next((_parse_time(d) for d in dirs if _parse_time(d)), None)
+    member = next((int(d) for d in dirs if d.isdigit()), None)
+    valid_time = _parse_time(name)
+    match = re_time.search(name)
+    file_type = name[:match.start()].rstrip('_.') if match else name.split('.')[0]
+    return experiment, init_time, member, valid_time, file_type or name
+
+
+def _static_prefix(pattern):
+    """Directory part of a glob pattern without wildcards"""
+    parts = pattern.split('/')
+    for i, part in enumerate(parts):
+        if glob.has_magic(part):
+            return '/'.join(parts[:i]) or '/'
+    return os.path.dirname(pattern)
+
+
+def _match(pattern, path):
+    """Like glob: wildcards do not match across directories"""
+    pattern_parts, path_parts = pattern.split('/'), path.split('/')
+    return len(pattern_parts) == len(path_parts) and all(
+        fnmatch.fnmatchcase(p, q) for q, p in zip(pattern_parts, path_parts))
+
+
+class Catalog(object):
+    """SQLite index of files below one or more root directories
+
+    Args:
+        f_db (str): path to the database file, created if it does not exist
+    """
+    def __init__(self, f_db=default_db):
+        self.f_db = f_db
+        os.makedirs(os.path.dirname(os.path.abspath(f_db)), exist_ok=True)
+        con = self._connect()
+        try:
+            with con:
+                con.execute("""CREATE TABLE IF NOT EXISTS dirs (
+                                   path TEXT PRIMARY KEY, parent TEXT, mtime_ns INTEGER)""")
+                con.execute("""CREATE TABLE IF NOT EXISTS files (
+                                   path TEXT PRIMARY KEY, dir TEXT, experiment TEXT, init_time TEXT,
+                                   member INTEGER, valid_time TEXT, file_type TEXT,
+                                   size INTEGER, mtime REAL)""")
+                con.execute('CREATE INDEX IF NOT EXISTS files_valid_time ON files (valid_time)')
+                con.execute('CREATE INDEX IF NOT EXISTS files_dir ON files (dir)')
+                con.execute("""CREATE TABLE IF NOT EXISTS roots (
+                                   path TEXT PRIMARY KEY, scanned REAL)""")
+        finally:
+            con.close()
+
+    def _connect(self):
+        return sqlite3.connect(self.f_db, timeout=120)
+
+    def scan(self, root):
+        """Add or update all files below `root`, listing only directories which changed
+
+        Returns:
+            int: number of directories listed
+        """
+        root = os.path.abspath(root)
+        con = self._connect()
+        n_listed = 0
+        try:
+            with con:
+                stack = [root]
+                while stack:
+                    d = stack.pop()
+                    try:
+                        mtime_ns = os.stat(d).st_mtime_ns
+                    except FileNotFoundError:
+                        self._forget(con, d)
+                        continue
+                    row = con.execute('SELECT mtime_ns FROM dirs WHERE path=?', (d,)).fetchone()
+                    if row and row[0] == mtime_ns:
+                        # unchanged, but files in subdirectories may have changed
+                        stack.extend(p for (p,) in con.execute('SELECT path FROM dirs WHERE parent=?', (d,)))
+                        continue
+
+                    n_listed += 1
+                    subdirs, files = [], []
+                    for entry in os.scandir(d):
+                        try:
+                            if entry.is_dir(follow_symlinks=False):
+                                subdirs.append(entry.path)
+                            elif entry.is_file():
+                                st = entry.stat()
+                                files.append((entry.path, d) + parse_path(root, entry.path)
+                                             + (st.st_size, st.st_mtime))
+                        except FileNotFoundError:
+                            continue  # removed while scanning
+
+                    for (p,) in con.execute('SELECT path FROM dirs WHERE parent=?', (d,)).fetchall():
+                        if p not in subdirs:
+                            self._forget(con, p)
+                    con.execute('DELETE FROM files WHERE dir=?', (d,))
+                    con.executemany('INSERT OR REPLACE INTO files VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)', files)
+                    con.execute('INSERT OR REPLACE INTO dirs VALUES (?, ?, ?)',
+                                (d, os.path.dirname(d), mtime_ns))
+                    stack.extend(subdirs)
+                con.execute('INSERT OR REPLACE INTO roots VALUES (?, ?)', (root, time.time()))
+        finally:
+            con.close()
+        return n_listed
+
+    def _forget(self, con, d):
+        """Remove a directory and everything below it from the catalog"""
+        like = d.replace('%', r'\%').replace('_', r'\_') + '/%'
+        con.execute("DELETE FROM files WHERE dir=? OR dir LIKE ? ESCAPE '\\'", (d, like))
+        con.execute("DELETE FROM dirs WHERE path=? OR path LIKE ? ESCAPE '\\'", (d, like))
+
+    def last_scan(self, root):
+        """Time (seconds since epoch) of the last scan of `root` or of a directory containing it, or None"""
+        root = os.path.abspath(root)
+        con = self._connect()
+        try:
+            rows = con.execute('SELECT path, scanned FROM roots').fetchall()
+        finally:
+            con.close()
+        times = [scanned for path, scanned in rows if root == path or root.startswith(path.rstrip('/')+'/')]
+        return max(times) if times else None
+
+    def query(self, valid_time=None, init_time=None, experiment=None, member=None, file_type=None, below=None):
+        """Paths of files matching all given criteria
+
+        Args:
+            valid_time, init_time (dt.datetime)
+            below (str): only files below this directory
+
+        Returns:
+            list of str, sorted
+        """
+        where, params = [], []
+        for column, value in [('valid_time', valid_time), ('init_time', init_time), ('experiment', experiment),
+                              ('member', member), ('file_type', file_type)]:
+            if value is not None:
+                where.append(column+'=?')
+                params.append(value.strftime(time_fmt) if isinstance(value, dt.datetime) else value)
+        if below:
+            below = os.path.abspath(below).rstrip('/')
+            where.append("(path LIKE ? ESCAPE '\\')")
+            params.append(below.replace('%', r'\%').replace('_', r'\_') + '/%')
+        sql = 'SELECT path FROM files' + (' WHERE ' + ' AND '.join(where) if where else '')
+        con = self._connect()
+        try:
+            return sorted(p for (p,) in con.execute(sql, params))
+        finally:
+            con.close()
+
+    def glob(self, pattern, max_age_s=None):
+        """Files matching a glob pattern, from the catalog
+
+        The directory part of `pattern` without wildcards is scanned if it was never scanned,
+        if the last scan is older than `max_age_s`, if no file matches
+        or if a matching file does not exist anymore (deleted or moved).
+
+        Returns:
+            list of str, sorted
+        """
+        pattern = os.path.abspath(pattern)
+        root = _static_prefix(pattern)
+        last = self.last_scan(root)
+        if last is None or (max_age_s is not None and time.time() - last > max_age_s):
+            self.scan(root)
+
+        valid_time = _parse_time(os.path.basename(pattern))
+        if valid_time and glob.has_magic(os.path.basename(pattern)):
+            valid_time = None  # the time could be partly a wildcard
+        matches = [p for p in self._candidates(root, valid_time) if _match(pattern, p)]
+        if last is not None and (not matches or not all(os.path.exists(p) for p in matches)):
+            self.scan(root)
+            matches = [p for p in self._candidates(root, valid_time) if _match(pattern, p)]
+        return [p for p in matches if os.path.exists(p)]
+
+    def _candidates(self, root, valid_time):
+        if root == '/':
+            return self.query(valid_time=valid_time)
+        return self.query(valid_time=valid_time, below=root)
+
+
+def find_files(cfg, pattern):
+    """Files matching a glob pattern, from the catalog `cfg.catalog_db` if set, otherwise by glob
+
+    Falls back to glob if the catalog does not know any matching file.
+    Only existing files are returned.
+
+    Returns:
+        list of str, sorted
+    """
+    f_db = getattr(cfg, 'catalog_db', False)
+    if f_db:
+        try:
+            matches = Catalog(f_db).glob(pattern, max_age_s=getattr(cfg, 'catalog_max_age_s', None))
+            if matches:
+                return matches
+        except sqlite3.Error as e:
+            print('could not use catalog', f_db, ':', e)
+    return sorted(glob.glob(pattern))
+
+
+if __name__ == '__main__':
+    catalog = Catalog(sys.argv[1])
+    for root in sys.argv[2:]:
+        n_listed = catalog.scan(root)
+        print('scanned', root, ':', n_listed, 'directories listed')
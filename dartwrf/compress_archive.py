@@ -0,0 +1,70 @@
+"""Compress netCDF files in the archive of one cycle (deflate level 1, netCDF4 format)
+
+Files are compressed with `ncks -4 -L 1` into a temporary file which then replaces the original,
+so other jobs reading a file at the same time see either the old or the new file.
+Files which are already in netCDF4 format are skipped.
+
+Usage:
+    python compress_archive.py <path to config file>
+
+    compresses files matching `cfg.compress_patterns` in `cfg.dir_archive + cfg.time.strftime(cfg.pattern_init_time)`
+"""
+import os
+import sys
+import glob
+from concurrent.futures import ThreadPoolExecutor
+
+from dartwrf.utils import Config, print, run_process, try_remove
+
+# relative to the archive directory of one cycle
+default_patterns = ['*/wrfout_d0*', 'preassim_*.nc', 'postassim_*.nc', 'output_*.nc']
+
+
+def is_compressed(f):
+    """True if `f` is in netCDF4/HDF5 format"""
+    with open(f, 'rb') as fh:
+        return fh.read(4) == b'\x89HDF'
+
+
+def compress_file(f, ncks='ncks', deflate_level=1):
+    """Compress a netCDF file in place
+
+    Returns:
+        int: bytes saved
+    """
+    size_before = os.path.getsize(f)
+    f_tmp = f + '.compress.tmp'
+    try:
+        run_process(ncks+' -O -4 -L '+str(deflate_level)+' '+f+' '+f_tmp)
+        os.replace(f_tmp, f)
+    finally:
+        try_remove(f_tmp)
+    return size_before - os.path.getsize(f)
+
+
+def compress_archive(cfg: Config):
+    """Compress netCDF files of the cycle at `cfg.time`
+
+    Options in `cfg`:
+        compress_patterns (list of str): glob patterns relative to the archive directory of the cycle
+        compress_deflate_level (int): default 1
+        max_copy_threads (int): number of files compressed at the same time
+    """
+    dir_cycle = cfg.dir_archive + cfg.time.strftime(cfg.pattern_init_time)
+    patterns = getattr(cfg, 'compress_patterns', default_patterns)
+    files = sorted(set(f for p in patterns for f in glob.glob(dir_cycle + '/' + p)))
+    files = [f for f in files if not is_compressed(f)]
+    if not files:
+        print('nothing to compress in', dir_cycle)
+        return
+
+    ncks = getattr(cfg, 'ncks', 'ncks')
+    level = getattr(cfg, 'compress_deflate_level', 1)
+    with ThreadPoolExecutor(max_workers=getattr(cfg, 'max_copy_threads', 8)) as pool:
+        saved = sum(pool.map(lambda f: compress_file(f, ncks, level), files))
+    print('compressed', len(files), 'files in', dir_cycle, ', saved', int(saved/1e6), 'MB')
+
+
+if __name__ == '__main__':
+    cfg = Config.from_file(sys.argv[1])
+    compress_archive(cfg)
@@ -0,0 +1,154 @@
+"""Record which stages of which cycle finished, to resume an experiment after a failure
+
+The state is stored in an SQLite database `<dir_archive>/cycle_state.sqlite`
+with one row per (cycle time, stage, ensemble member), where member 0 stands for the whole stage.
+For each finished stage, the output files are recorded with a checksum
+(size + hash of head, middle and tail), so that `WorkFlows.resume()` only skips stages
+whose outputs still exist unchanged.
+
+Jobs mark themselves as done when they finished successfully:
+    python -m dartwrf.cycle_state <db> <time> <stage> [<member>] [--outputs <glob> ...]
+
+Check if a stage (of a member) is done, exit code 0 if yes:
+    python -m dartwrf.cycle_state --check <db> <time> <stage> [<member>]
+"""
+import os
+import sys
+import glob
+import json
+import sqlite3
+import argparse
+import datetime as dt
+
+from dartwrf.utils import _hash_sample
+
+time_fmt = '%Y-%m-%d_%H:%M'
+
+
+def file_checksum(f):
+    """Checksum of a file: size and a hash of head, middle and tail (fast also for large files)"""
+    size = os.path.getsize(f)
+    return str(size) + '-' + _hash_sample(f, size)
+
+
+class CycleState(object):
+    """Stages finished per cycle, stored in SQLite
+
+    Args:
+        f_db (str): path to the database file, created if it does not exist
+    """
+    def __init__(self, f_db):
+        self.f_db = f_db
+        os.makedirs(os.path.dirname(os.path.abspath(f_db)), exist_ok=True)
+        self._execute("""CREATE TABLE IF NOT EXISTS stages (
+                             time TEXT, stage TEXT, member INTEGER, status TEXT,
+                             finished TEXT, outputs TEXT,
+                             PRIMARY KEY (time, stage, member))""")
+
+    def _execute(self, sql, params=()):
+        # jobs of an ensemble may finish at the same time, wait for the lock
+        con = sqlite3.connect(self.f_db, timeout=120)
+        try:
+            with con:
+                return con.execute(sql, params).fetchall()
+        finally:
+            con.close()
+
+    def mark(self, time, stage, member=0, status='done', outputs=None):
+        """Record the status of a stage
+
+        Args:
+            time (dt.datetime or str): cycle time
+            stage (str): e.g. 'assimilate'
+            member (int): ensemble member of array jobs, 0 for the whole stage
+            status (str): 'done' or 'failed'
+            outputs (list of str): glob patterns of output files to record checksums of
+        """
+        if isinstance(time, dt.datetime):
+            time = time.strftime(time_fmt)
+        files = sorted(set(f for pattern in (outputs or []) for f in glob.glob(pattern)))
+        checksums = {f: file_checksum(f) for f in files}
+        self._execute('INSERT OR REPLACE INTO stages VALUES (?, ?, ?, ?, ?, ?)',
+                      (time, stage, int(member), status,
+                       dt.datetime.now().isoformat(timespec='seconds'), json.dumps(checksums)))
+
+    def is_done(self, time, stage, n_members=None, verify=True):
+        """Check if a stage finished, optionally for all members 1..n_members
+
+        Args:
+            verify (bool): also check that the recorded outputs exist and did not change
+
+        Returns:
+            bool
+        """
+        if isinstance(time, dt.datetime):
+            time = time.strftime(time_fmt)
+        rows = self._execute("SELECT member, outputs FROM stages WHERE time=? AND stage=? AND status='done'",
+                             (time, stage))
+        members = {member for member, _ in rows}
+        if n_members:
+            if not set(range(1, n_members+1)) <= members:
+                return False
+        elif 0 not in members:
+            return False
+
+        if verify:
+            for _, outputs in rows:
+                for f, checksum in json.loads(outputs).items():
+                    if not os.path.exists(f) or file_checksum(f) != checksum:
+                        return False
+        return True
+
+    def members_done(self, time, stage):
+        """Ensemble members (array indices) for which a stage finished
+
+        Returns:
+            set of int
+        """
+        if isinstance(time, dt.datetime):
+            time = time.strftime(time_fmt)
+        rows = self._execute("SELECT member FROM stages WHERE time=? AND stage=? AND status='done'",
+                             (time, stage))
+        return {member for (member,) in rows}
+
+    def summary(self):
+        """Status of all stages, as list of (time, stage, member, status, finished)"""
+        return self._execute('SELECT time, stage, member, status, finished FROM stages '
+                             'ORDER BY time, finished')
+
+
+def mark_command(python, f_db, time, stage, array=False, outputs=None):
+    """Bash command which records a stage as done if the previous command succeeded
+
+    Args:
+        python (str): python command (with PYTHONPATH)
+        array (bool): record per member, using $SLURM_ARRAY_TASK_ID
+        outputs (list of str): glob patterns of output files, may contain $SLURM_ARRAY_TASK_ID
+
+    Returns:
+        str
+    """
+    cmd = ' '.join([python, '-m dartwrf.cycle_state', f_db, time.strftime(time_fmt), stage])
+    if array:
+        cmd += ' $SLURM_ARRAY_TASK_ID'
+    if outputs:
+        cmd += ' --outputs ' + ' '.join('"'+p+'"' for p in outputs)
+    return '\n[ $? -eq 0 ] && (' + cmd + ')'
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Mark a stage of a cycle as done')
+    parser.add_argument('f_db')
+    parser.add_argument('time', help='cycle time, '+time_fmt.replace('%', '%%'))
+    parser.add_argument('stage')
+    parser.add_argument('member', nargs='?', type=int, default=0)
+    parser.add_argument('--outputs', nargs='*', default=[])
+    parser.add_argument('--check', action='store_true', help='only check if the stage is done')
+    args = parser.parse_args()
+
+    state = CycleState(args.f_db)
+    if args.check:
+        if args.member:
+            sys.exit(0 if args.member in state.members_done(args.time, args.stage) else 1)
+        sys.exit(0 if state.is_done(args.time, args.stage) else 1)
+    state.mark(args.time, args.stage, member=args.member, outputs=args.outputs)
@@ -0,0 +1,179 @@
+"""Timing of DART programs (filter, perfect_model_obs) from their log files
+
+With `output_timestamps = .true.` in `&filter_nml` and `&perfect_model_obs_nml`,
+DART writes lines like
+    TIME: 2024/05/13 10:12:01 Before reading in ensemble restart files
+    TIME: 2024/05/13 10:12:09 After  reading in ensemble restart files
+from which the duration of each stage is computed.
+The number of MPI tasks is read from the log, the number of observations from the header of the obs_seq file.
+
+One record per run is appended to a history file (JSON lines, default: `~/.cache/dartwrf/dart_performance.jsonl`,
+shared by all experiments of a user), to see how the cost scales with observations, members and MPI tasks.
+
+Usage:
+    python -m dartwrf.dart_log <log file> [<obs_seq file>]
+"""
+import os
+import re
+import sys
+import json
+import datetime as dt
+
+default_history = os.path.join(os.environ.get('XDG_CACHE_HOME', os.path.expanduser('~/.cache')),
+                               'dartwrf', 'dart_performance.jsonl')
+
+re_time = re.compile(r'TIME:\s*(\d{4}/\d{2}/\d{2}\s+\d{2}:\d{2}:\d{2})\S*\s*(.*)')
+re_mpi = re.compile(r'Running with\s+(\d+)\s+MPI processes')
+
+# stage names (lower case, without 'Before'/'After') containing these words => category
+categories = [('restart', 'read'),
+              ('observation values', 'forward_operators'),
+              ('forward operator', 'forward_operators'),
+              ('assimilation', 'assimilation'),
+              ('writ', 'write'),
+              ('output', 'write'),
+              ]
+
+
+def _category(stage):
+    for words, category in categories:
+        if words in stage:
+            return category
+    return 'other'
+
+
+def parse_log(text):
+    """Stage durations and MPI tasks from a DART log
+
+    Args:
+        text (str): content of e.g. log.filter
+
+    Returns:
+        dict: with keys
+            stages (dict): stage => seconds, summed if a stage runs more than once
+            categories (dict): 'read', 'forward_operators', 'assimilation', 'write', 'other' => seconds
+            n_mpi_tasks (int or None)
+            total_s (float or None): from the first to the last timestamp
+    """
+    stages, started = {}, {}
+    n_mpi_tasks = None
+    first = last = None
+
+    for line in text.splitlines():
+        match = re_mpi.search(line)
+        if match:
+            n_mpi_tasks = int(match.group(1))
+            continue
+        match = re_time.search(line)
+        if not match:
+            continue
+        t = dt.datetime.strptime(' '.join(match.group(1).split()), '%Y/%m/%d %H:%M:%S')
+        first = first or t
+        last = t
+
+        message = ' '.join(match.group(2).split()).lower()
+        if message.startswith('before '):
+            started[message[7:]] = t
+        elif message.startswith('after ') and message[6:] in started:
+            stage = message[6:]
+            stages[stage] = stages.get(stage, 0.) + (t - started.pop(stage)).total_seconds()
+
+    by_category = {}
+    for stage, seconds in stages.items():
+        category = _category(stage)
+        by_category[category] = by_category.get(category, 0.) + seconds
+
+    return dict(stages=stages, categories=by_category, n_mpi_tasks=n_mpi_tasks,
+                total_s=(last - first).total_seconds() if first else None)
+
+
+def count_obs(f_obsseq):
+    """Number of observations from the header of an obs_seq file, None if not found"""
+    try:
+        with open(f_obsseq) as f:
+            for i, line in enumerate(f):
+                if 'num_obs:' in line:
+                    return int(line.split()[1])
+                if i > 1000:  # header has one line per obs type
+                    break
+    except (OSError, ValueError, IndexError):
+        pass
+    return None
+
+
+def performance_record(cfg, program, f_log, f_obsseq=None, nproc=None, wall_s=None, just_prior_values=False):
+    """Structured record of one run of a DART program
+
+    Args:
+        program (str): 'filter' or 'perfect_model_obs'
+        f_log (str): log file of the run
+        f_obsseq (str): obs_seq file with the observations of the run (input)
+        nproc (int): requested MPI tasks (if not found in the log)
+        wall_s (float): runtime measured outside of DART
+        just_prior_values (bool): filter only evaluated the prior
+
+    Returns:
+        dict
+    """
+    with open(f_log, errors='replace') as f:
+        parsed = parse_log(f.read())
+
+    time = getattr(cfg, 'time', None)
+    return dict(experiment=getattr(cfg, 'name', None),
+                time=time.strftime('%Y-%m-%d_%H:%M') if isinstance(time, dt.datetime) else None,
+                program=program,
+                just_prior_values=just_prior_values,
+                finished=dt.datetime.now().isoformat(timespec='seconds'),
+                ensemble_size=getattr(cfg, 'ensemble_size', None),
+                n_obs=count_obs(f_obsseq) if f_obsseq else None,
+                n_mpi_tasks=parsed['n_mpi_tasks'] or nproc,
+                wall_s=round(wall_s, 1) if wall_s is not None else parsed['total_s'],
+                categories=parsed['categories'],
+                stages=parsed['stages'])
+
+
+def append_history(record, f_history=default_history):
+    os.makedirs(os.path.dirname(os.path.abspath(f_history)), exist_ok=True)
+    with open(f_history, 'a') as f:
+        f.write(json.dumps(record) + '\n')
+
+
+def read_history(f_history=default_history, program=None):
+    """Records of previous runs, optionally only of one program
+
+    Returns:
+        list of dict
+    """
+    records = []
+    if not os.path.exists(f_history):
+        return records
+    with open(f_history) as f:
+        for line in f:
+            try:
+                record = json.loads(line)
+            except ValueError:
+                continue  # e.g. incomplete line of a killed job
+            if program is None or record.get('program') == program:
+                records.append(record)
+    return records
+
+
+def record_run(cfg, program, f_log, f_obsseq=None, nproc=None, wall_s=None, just_prior_values=False):
+    """Append the performance of a finished run to `cfg.dart_performance_history`
+
+    Never raises, a failure to record must not fail the experiment.
+    """
+    try:
+        record = performance_record(cfg, program, f_log, f_obsseq, nproc=nproc, wall_s=wall_s,
+                                    just_prior_values=just_prior_values)
+        append_history(record, getattr(cfg, 'dart_performance_history', default_history))
+        print(program, 'stages [s]:', record['categories'])
+    except Exception as e:
+        print('could not record performance of', program, ':', e)
+
+
+if __name__ == '__main__':
+    parsed = parse_log(open(sys.argv[1], errors='replace').read())
+    if len(sys.argv) > 2:
+        parsed['n_obs'] = count_obs(sys.argv[2])
+    print(json.dumps(parsed, indent=1))
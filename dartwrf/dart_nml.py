@@ -1,3 +1,4 @@
+import os
 import sys
 import warnings
 import numpy as np
@@ -295,7 +296,7 @@ def _get_vertical_localization(cfg: Config):
     return l_obstypes_vert, vert_norm_heights, vert_norm_scale_heights, vert_norm_levels, vert_norm_pressures
 
 
-def write_namelist(cfg: Config, just_prior_values=False) -> dict:
+def write_namelist(cfg: Config, just_prior_values=False, nproc=None, dir_dart_run=None) -> dict:
     """Write a DART namelist file ('input.nml')
 
     1. Uses the default namelist (from the DART source code)
@@ -308,6 +309,9 @@ def write_namelist(cfg: Config, just_prior_values=False) -> dict:
 
     Args:
         just_prior_values (bool, optional): If True, only compute prior values, not posterior. Defaults to False.
+        nproc (int, optional): Number of MPI tasks, sets `layout` and `tasks_per_node` in `&ensemble_manager_nml`.
+        dir_dart_run (str, optional): Directory to write 'input.nml' to, default: `cfg.dir_dart_run`.
+            A symbolic link 'input.nml' there is replaced, the file it points to is not changed.
 
     Raises:
         ValueError: If both height and scale-height localization are requested
@@ -347,6 +351,11 @@ def write_namelist(cfg: Config, just_prior_values=False) -> dict:
         nml['&location_nml']['special_vert_normalization_pressures'] = [
             vert_norm_pressures]
 
+    # timestamps of the stages in log.filter (see dart_log.py), can be switched off in cfg.dart_nml
+    for section in ['&filter_nml', '&perfect_model_obs_nml']:
+        if section in nml:
+            nml[section]['output_timestamps'] = [['.true.']]
+
     # we start out with the default namelist from the DART source code
     # then we read the configuration file of the experiment
     # and overwrite the default values where necessary
@@ -386,6 +395,13 @@ def write_namelist(cfg: Config, just_prior_values=False) -> dict:
             # every entry in this list is one line
             nml[section][parameter] = value
 
+    if nproc is not None:
+        from dartwrf.dart_ranks import ensemble_manager_nml
+        section = nml.setdefault('&ensemble_manager_nml', {})
+        tasks_per_node = getattr(cfg, 'cores_per_node', None) or section.get('tasks_per_node', [[nproc]])[0][0]
+        for parameter, value in ensemble_manager_nml(nproc, tasks_per_node).items():
+            section[parameter] = [[value]]
+
     # necessary options if we dont compute posterior but only evaluate prior
     if just_prior_values:
         nml['&obs_kind_nml']['assimilate_these_obs_types'] = [[]]
@@ -410,7 +426,9 @@ def write_namelist(cfg: Config, just_prior_values=False) -> dict:
                     "Selected vertical localization, but observations contain satellite obs -> Bug in DART.")
 
     # write to file
-    dir_dart_run = cfg.dir_dart_run.replace('<exp>', cfg.name)
+    dir_dart_run = (dir_dart_run or cfg.dir_dart_run).replace('<exp>', cfg.name)
+    if os.path.islink(dir_dart_run + "/input.nml"):
+        os.remove(dir_dart_run + "/input.nml")  # shared with other runs
     write_namelist_from_dict(nml, dir_dart_run + "/input.nml")
     print('Wrote namelist to', dir_dart_run + "/input.nml")
 
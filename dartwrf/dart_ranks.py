@@ -0,0 +1,130 @@
+"""Choose the number of MPI tasks for DART programs (filter, perfect_model_obs)
+
+With `cfg.auto_nproc = True`, DART programs do not always use `cfg.max_nproc` tasks.
+Evaluating a few observations is faster with few tasks (less MPI startup and communication),
+assimilating many satellite observations may profit from all available tasks.
+
+1. If the performance history (see `dart_log.py`) contains runs of the same program with
+   a similar number of observations and the same ensemble size for at least two task counts,
+   the fastest task count is used (or fewer tasks, if they are at most `cfg.nproc_tolerance` slower).
+2. Otherwise, the task count is estimated from the amount of work
+   (observations times members, `cfg.dart_work_per_task`)
+   and the memory needed for the ensemble state (`cfg.dart_mem_per_task_GB`).
+
+In both cases, the result is limited to 1..`cfg.max_nproc`.
+"""
+import math
+from collections import defaultdict
+
+import numpy as np
+
+from dartwrf.utils import print
+from dartwrf import dart_log
+
+
+def similar(n, n_ref, factor=1.5):
+    return n is not None and n_ref/factor <= n <= n_ref*factor
+
+
+def nproc_from_history(records, n_obs, ensemble_size, min_samples=2, tolerance=0.1):
+    """Fastest task count of previous runs with similar observation count and equal ensemble size
+
+    Args:
+        records (list of dict): from `dart_log.read_history`
+        tolerance (float): use fewer tasks if they are at most this fraction slower
+
+    Returns:
+        int or None: None if less than two task counts have `min_samples` runs each
+    """
+    wall_s = defaultdict(list)
+    for r in records:
+        if (r.get('ensemble_size') == ensemble_size and similar(r.get('n_obs'), n_obs)
+                and r.get('n_mpi_tasks') and r.get('wall_s')):
+            wall_s[int(r['n_mpi_tasks'])].append(r['wall_s'])
+
+    median_wall_s = {nproc: float(np.median(times)) for nproc, times in wall_s.items()
+                     if len(times) >= min_samples}
+    if len(median_wall_s) < 2:
+        return None
+    fastest = min(median_wall_s.values())
+    return min(nproc for nproc, t in median_wall_s.items() if t <= fastest*(1+tolerance))
+
+
+def estimate_nproc(n_obs, ensemble_size, state_size=None, just_prior_values=False,
+                   work_per_task=5e4, mem_per_task_GB=2.):
+    """Task count from the amount of work and memory
+
+    Args:
+        n_obs (int): number of observations
+        state_size (int or None): number of state variables of one member
+        just_prior_values (bool): forward operators only, they run in parallel over members
+
+    Returns:
+        int
+    """
+    nproc = math.ceil(n_obs*ensemble_size/work_per_task)
+    if just_prior_values:
+        nproc = min(nproc, ensemble_size)
+    if state_size:
+        nproc = max(nproc, math.ceil(state_size*ensemble_size*8/(mem_per_task_GB*1e9)))
+    return max(1, nproc)
+
+
+def state_size(cfg):
+    """Number of state variables of one member (grid points times updated variables), or None"""
+    from dartwrf.resources import wrf_grid
+    grid = wrf_grid(cfg)
+    if grid is None:
+        return None
+    n_points = 1
+    for n in grid.split('x'):
+        n_points *= int(n)
+    return n_points*len(getattr(cfg, 'update_vars', [])) or None
+
+
+def select_nproc(cfg, program, n_obs, just_prior_values=False):
+    """Number of MPI tasks for a DART program
+
+    Args:
+        program (str): 'filter' or 'perfect_model_obs'
+        n_obs (int or None): number of observations to process
+        just_prior_values (bool): filter only evaluates the prior
+
+    Returns:
+        int or None: None unless `cfg.auto_nproc` is True, i.e. use `cfg.max_nproc` and the namelist as configured
+    """
+    if not getattr(cfg, 'auto_nproc', False):
+        return None
+    max_nproc = int(cfg.max_nproc)
+    if not n_obs:
+        return max_nproc
+
+    ensemble_size = 1 if program == 'perfect_model_obs' else cfg.ensemble_size
+    records = [r for r in dart_log.read_history(getattr(cfg, 'dart_performance_history', dart_log.default_history),
+                                                program=program)
+               if r.get('just_prior_values', False) == just_prior_values]
+    nproc = nproc_from_history(records, n_obs, ensemble_size,
+                               tolerance=getattr(cfg, 'nproc_tolerance', 0.1))
+    source = 'history'
+    if nproc is None:
+        nproc = estimate_nproc(n_obs, ensemble_size, state_size(cfg), just_prior_values,
+                               work_per_task=getattr(cfg, 'dart_work_per_task', 5e4),
+                               mem_per_task_GB=getattr(cfg, 'dart_mem_per_task_GB', 2.))
+        source = 'estimate'
+    nproc = min(max(1, nproc), max_nproc)
+    print(program+': using', nproc, 'MPI tasks for', n_obs, 'observations (from '+source+')')
+    return nproc
+
+
+def ensemble_manager_nml(nproc, tasks_per_node):
+    """`&ensemble_manager_nml` settings for `nproc` tasks
+
+    With more tasks than fit on one node, tasks are distributed round-robin over the nodes (layout=2),
+    so that task 0 (which needs more memory) does not share a node with many other tasks.
+
+    Returns:
+        dict: parameter => value, as in `cfg.dart_nml`
+    """
+    tasks_per_node = min(int(nproc), int(tasks_per_node))
+    return dict(layout=2 if nproc > tasks_per_node else 1,
+                tasks_per_node=tasks_per_node)
@@ -0,0 +1,141 @@
+"""Analysis increments (posterior minus prior) instead of full posterior files
+
+Increments are computed once per member after ./filter,
+stored as compressed float32 netCDF files in the archive
+and added to the wrfrst files in the WRF run directories.
+
+This makes the archived DA product much smaller than copies of `filter_restart` files
+and allows to re-apply (or scale) increments without running ./filter again.
+
+Example call (re-apply scaled increment to a wrfrst file):
+    python increments.py increment_d01.0001.nc wrfrst_d01_2008-07-30_12:00:00 0.5
+"""
+import os, sys
+import numpy as np
+import netCDF4 as nc
+from dartwrf.utils import Config, print
+
+increment_fmt = '/increment_d01.{iens:04d}.nc'
+
+
+def increment_file(cfg: Config, time, iens: int) -> str:
+    """Path of the archived increment of member `iens` for the assimilation at `time`
+    """
+    return cfg.dir_archive.replace('<exp>', cfg.name) + time.strftime(cfg.pattern_init_time) \
+        + increment_fmt.format(iens=iens)
+
+
+def write_increment(f_prior: str, f_posterior: str, f_out: str, update_vars: list, complevel: int = 4) -> None:
+    """Write the difference posterior minus prior to a compressed netCDF file
+
+    Args:
+        f_prior (str): prior state, e.g. run_DART/prior_ens1/wrfout_d01
+        f_posterior (str): posterior state, e.g. run_DART/filter_restart_d01.0001
+        f_out (str): output file
+        update_vars (list of str): variables to store, e.g. ['U', 'V', 'THM']
+        complevel (int): zlib compression level
+
+    Returns:
+        None
+    """
+    f_tmp = f_out + '.tmp'
+    with nc.Dataset(f_prior, 'r') as ds_prior, \
+         nc.Dataset(f_posterior, 'r') as ds_post, \
+         nc.Dataset(f_tmp, 'w', format='NETCDF4') as ds_inc:
+
+        ds_inc.prior_file = os.path.realpath(f_prior)
+        ds_inc.posterior_file = os.path.realpath(f_posterior)
+
+        for var in update_vars:
+            if var == 'Times' or var not in ds_post.variables:
+                continue
+            v_post = ds_post.variables[var]
+            for dim in v_post.dimensions:
+                if dim not in ds_inc.dimensions:
+                    ds_inc.createDimension(dim, len(ds_post.dimensions[dim]))
+
+            inc = np.ma.getdata(v_post[:]).astype(np.float64) \
+                - np.ma.getdata(ds_prior.variables[var][:]).astype(np.float64)
+
+            v_inc = ds_inc.createVariable(var, 'f4', v_post.dimensions,
+                                          zlib=True, complevel=complevel, shuffle=True)
+            v_inc[:] = inc.astype(np.float32)
+
+    os.replace(f_tmp, f_out)
+
+
+def add_increment(f_increment: str, f_wrf: str, scale: float = 1.) -> bool:
+    """Add an increment to a WRF file in place
+
+    Variables with two time levels in wrfrst files (e.g. THM_1, THM_2)
+    get the same increment on both levels.
+
+    The global attributes `increment_applied` and `increment_scale` of `f_wrf`
+    record the increment file and the scale.
+    If the same increment was added with the same scale, the file is not changed,
+    so that running update_IC again (e.g. after a failure or with `WorkFlows.resume`)
+    does not add the increment twice. To apply it with another scale, start from the prior file.
+
+    Args:
+        f_increment (str): output of `write_increment`
+        f_wrf (str): wrfrst/wrfinput file, opened in 'r+' mode
+        scale (float): factor by which the increment is multiplied
+
+    Returns:
+        bool: False if the increment had been added before
+
+    Raises:
+        ValueError: if the increment was added before with a different scale
+    """
+    tag = os.path.realpath(f_increment)
+    with nc.Dataset(f_increment, 'r') as ds_inc, nc.Dataset(f_wrf, 'r+') as ds_wrf:
+        if getattr(ds_wrf, 'increment_applied', None) == tag:
+            scale_applied = float(getattr(ds_wrf, 'increment_scale', 1.))
+            if scale_applied != float(scale):
+                raise ValueError(f_increment+' was added to '+f_wrf+' with scale '+str(scale_applied)
+                                 + ', can not add it with scale '+str(scale)+', start from the prior file')
+            print('increment already added to', f_wrf, ', not changing it')
+            return False
+
+        for var in ds_inc.variables:
+            inc = np.ma.getdata(ds_inc.variables[var][:])
+            if not np.any(inc):
+                print('zero increment, not changing', var)
+                continue
+
+            if var in ds_wrf.variables:
+                targets = [var,]
+            else:
+                targets = [var+var_suffix for var_suffix in ['_1', '_2']]
+
+            for target in targets:
+                v = ds_wrf.variables[target]
+                v[:] = np.ma.getdata(v[:]) + scale*inc
+                print('added increment to', target)
+
+        ds_wrf.increment_applied = tag
+        ds_wrf.increment_scale = float(scale)
+    return True
+
+
+def archive_increments(cfg: Config, time) -> None:
+    """Compute increments for all members in run_DART and write them to the archive
+
+    Args:
+        time (dt.datetime): time of assimilation
+    """
+    for iens in range(1, cfg.ensemble_size + 1):
+        f_prior = cfg.dir_dart_run + '/prior_ens' + str(iens) + '/wrfout_d01'
+        f_post = cfg.dir_dart_run + '/filter_restart_d01.' + str(iens).zfill(4)
+        f_out = increment_file(cfg, time, iens)
+        os.makedirs(os.path.dirname(f_out), exist_ok=True)
+        write_increment(f_prior, f_post, f_out, cfg.update_vars)
+        print(f_out, 'saved.')
+
+
+if __name__ == '__main__':
+    f_increment = sys.argv[1]
+    f_wrf = sys.argv[2]
+    scale = float(sys.argv[3]) if len(sys.argv) > 3 else 1.
+
+    add_increment(f_increment, f_wrf, scale=scale)
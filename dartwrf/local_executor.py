@@ -0,0 +1,214 @@
+"""Run WorkFlows jobs on the local machine without SLURM
+
+Jobs are started as soon as the jobs they depend on have finished
+and enough CPUs and memory are free, so independent jobs
+(e.g. RTTOV for every member, verification of the previous cycle) run concurrently.
+
+The state of all jobs is saved in `<dir_log>/local_jobs.json`.
+If the driver script is restarted, jobs which already finished successfully
+(same command, same dependencies) are not run again.
+
+Usage:
+    Set `use_local_executor=True` in the Config,
+    optionally with `local_cpus` and `local_mem_GB` (default: all of this machine).
+"""
+import os
+import json
+import atexit
+import hashlib
+import threading
+
+from dartwrf.utils import print, run_process
+
+
+def _parse_mem_GB(mem):
+    """Convert SLURM memory specification (e.g. '200G', '500M') to GB
+    """
+    if mem is None:
+        return 0.
+    mem = str(mem).strip().upper()
+    units = {'K': 1e-6, 'M': 1e-3, 'G': 1., 'T': 1e3}
+    if mem[-1] in units:
+        return float(mem[:-1])*units[mem[-1]]
+    return float(mem)*1e-3  # SLURM default unit is MB
+
+
+def _parse_array(array):
+    """Convert SLURM array specification (e.g. '1-40', '1,3,5', '1-40%4') to a list of indices
+    """
+    if array is None:
+        return [None,]
+    indices = []
+    for part in str(array).split('%')[0].split(','):
+        if '-' in part:
+            first, last = part.split('-')
+            indices.extend(range(int(first), int(last)+1))
+        else:
+            indices.append(int(part))
+    return indices
+
+
+def _total_mem_GB():
+    try:
+        return os.sysconf('SC_PAGE_SIZE')*os.sysconf('SC_PHYS_PAGES')/1e9
+    except (ValueError, OSError):
+        return float('inf')
+
+
+class LocalExecutor(object):
+    """Runs jobs locally in dependency order, within a budget of CPUs and memory
+
+    Args:
+        dir_state (str): directory for the job state file and job logs
+        n_cpus (int, optional): number of CPUs to use, default: all
+        mem_GB (float, optional): memory to use, default: all
+    """
+    def __init__(self, dir_state, n_cpus=None, mem_GB=None):
+        self.dir_state = dir_state
+        self.f_state = dir_state + '/local_jobs.json'
+        self.n_cpus = int(n_cpus or os.cpu_count())
+        self.mem_GB = float(mem_GB or _total_mem_GB())
+        os.makedirs(dir_state, exist_ok=True)
+
+        self.jobs = {}  # id -> job (dict)
+        self._lock = threading.Condition()
+        self._cpus_free = self.n_cpus
+        self._mem_free = self.mem_GB
+
+        # jobs which finished in a previous run of the driver script
+        self._done_before = set()
+        if os.path.exists(self.f_state):
+            with open(self.f_state) as f:
+                for job in json.load(f).values():
+                    if job['status'] == 'done':
+                        self._done_before.add(job['key'])
+
+        self._scheduler = threading.Thread(target=self._schedule, daemon=True)
+        self._scheduler.start()
+        atexit.register(self.wait)
+
+    def submit(self, cmd, name, depends_on=None, ntasks=1, mem=None, array=None, depends_how='afterok'):
+        """Add a job
+
+        Args:
+            cmd (str): bash command(s); for array jobs, `$SLURM_ARRAY_TASK_ID` is set
+            name (str): name of the job (for logs)
+            depends_on (list of int or None): IDs of jobs which must finish before
+            ntasks (int or str): number of CPUs needed (per array task)
+            mem (str): memory needed (per array task), e.g. '20G'
+            array (str, optional): SLURM-style array, e.g. '1-40'
+            depends_how (str): 'afterok' (start if dependencies succeeded) 
+                or 'afterany' (start when dependencies finished, also if they failed)
+
+        Returns:
+            int: job ID
+        """
+        depends_on = [d for d in (depends_on or []) if d is not None]
+
+        with self._lock:
+            for d in depends_on:
+                if d not in self.jobs:
+                    raise ValueError('unknown job ID '+str(d))
+            key = hashlib.sha1('\n'.join([cmd, str(array)]
+                                         + [self.jobs[d]['key'] for d in depends_on]
+                                         ).encode()).hexdigest()
+            job_id = len(self.jobs) + 1
+            job = dict(id=job_id, name=name, cmd=cmd, key=key, depends_on=depends_on,
+                       depends_how=depends_how,
+                       ntasks=min(int(ntasks or 1), self.n_cpus),
+                       mem_GB=min(_parse_mem_GB(mem), self.mem_GB),
+                       tasks_todo=_parse_array(array), n_tasks_running=0,
+                       n_tasks_failed=0, status='pending')
+            if key in self._done_before:
+                print('> local job', name, 'finished in a previous run, skipping')
+                job['status'] = 'done'
+                job['tasks_todo'] = []
+            else:
+                print('> local job', job_id, ':', name)
+            self.jobs[job_id] = job
+            self._save_state()
+            self._lock.notify_all()
+        return job_id
+
+    def wait(self, ids=None):
+        """Wait until jobs have finished, raise an error if any of them failed
+
+        Args:
+            ids (list of int, optional): wait for these jobs, default: all jobs
+        """
+        with self._lock:
+            while True:
+                jobs = [self.jobs[i] for i in ids] if ids else list(self.jobs.values())
+                if all(job['status'] in ('done', 'failed', 'cancelled') for job in jobs):
+                    break
+                self._lock.wait()
+        failed = [job['name'] for job in jobs if job['status'] != 'done']
+        if failed:
+            raise RuntimeError('Local jobs failed or were cancelled: '+', '.join(failed)
+                               + '; see logs in '+self.dir_state)
+
+    def _save_state(self):
+        f_tmp = self.f_state + '.tmp'
+        with open(f_tmp, 'w') as f:
+            json.dump({str(k): v for k, v in self.jobs.items()}, f, indent=1)
+        os.replace(f_tmp, self.f_state)
+
+    def _schedule(self):
+        """Start tasks of jobs whose dependencies are done, as long as resources are free
+        """
+        with self._lock:
+            while True:
+                for job in self.jobs.values():
+                    if job['status'] not in ('pending', 'running'):
+                        continue
+                    deps = [self.jobs[d]['status'] for d in job['depends_on']]
+                    if job.get('depends_how') == 'afterany':
+                        # failed dependencies count as finished
+                        deps = ['done' if s in ('failed', 'cancelled') else s for s in deps]
+                    if any(s in ('failed', 'cancelled') for s in deps):
+                        job['status'] = 'cancelled'
+                        job['tasks_todo'] = []
+                        print('> local job', job['name'], 'cancelled (dependency failed)')
+                        self._save_state()
+                        self._lock.notify_all()
+                        continue
+                    if not all(s == 'done' for s in deps):
+                        continue
+
+                    while job['tasks_todo'] and job['ntasks'] <= self._cpus_free \
+                            and job['mem_GB'] <= self._mem_free:
+                        index = job['tasks_todo'].pop(0)
+                        self._cpus_free -= job['ntasks']
+                        self._mem_free -= job['mem_GB']
+                        job['n_tasks_running'] += 1
+                        if job['status'] == 'pending':
+                            job['status'] = 'running'
+                            self._save_state()
+                        threading.Thread(target=self._run_task, args=(job, index), daemon=True).start()
+                self._lock.wait()
+
+    def _run_task(self, job, index):
+        cmd = job['cmd']
+        f_log = self.dir_state + '/' + job['name'].replace(':', '') + '-' + str(job['id'])
+        if index is not None:
+            cmd = 'export SLURM_ARRAY_TASK_ID='+str(index)+'; '+cmd
+            f_log += '_' + str(index)
+        try:
+            returncode = run_process(cmd, log_file=f_log+'.log', name=job['name'], check=False,
+                                     metrics_file=self.dir_state+'/process_metrics.jsonl')
+        except Exception as e:
+            print('> local job', job['name'], 'could not be run:', e)
+            returncode = -1
+
+        with self._lock:
+            self._cpus_free += job['ntasks']
+            self._mem_free += job['mem_GB']
+            job['n_tasks_running'] -= 1
+            if returncode != 0:
+                job['n_tasks_failed'] += 1
+                print('> local job', job['name'], 'failed, see', f_log+'.log')
+            if job['n_tasks_running'] == 0 and not job['tasks_todo']:
+                job['status'] = 'failed' if job['n_tasks_failed'] else 'done'
+                print('> local job', job['name'], job['status'])
+            self._save_state()
+            self._lock.notify_all()
@@ -0,0 +1,184 @@
+"""Monitor running WRF ensemble members from their rsl.out.0000 files
+
+For every member, the end of `rsl.out.0000` in the run directory is parsed for lines like
+    Timing for main: time 2008-07-30_11:05:00 on domain   1:    0.41234 elapsed seconds
+which give the simulated time and the wallclock time of each time step.
+From these, the speed (simulated seconds per wallclock second) and the remaining time (ETA) are computed.
+
+Members are flagged as
+    - 'stalled' if `rsl.out.0000` was not written for `stall_s` seconds,
+    - 'slow' if their speed is below `slow_factor` times the median speed of all running members.
+
+Usage:
+    python -m dartwrf.monitor <path to config file> [--json status.json] [--watch 60]
+"""
+import os
+import json
+import time
+import argparse
+import datetime as dt
+
+import numpy as np
+
+from dartwrf.utils import Config, print
+
+re_timing = 'Timing for main: time '
+success_msg = 'SUCCESS COMPLETE WRF'
+
+
+def _read_tail(f, n_bytes=1 << 16):
+    with open(f, 'rb') as fh:
+        fh.seek(0, os.SEEK_END)
+        size = fh.tell()
+        fh.seek(max(0, size - n_bytes))
+        return fh.read().decode(errors='replace')
+
+
+def parse_rsl(text):
+    """Parse timing lines of rsl.out.0000
+
+    Args:
+        text (str): (the end of) rsl.out.0000
+
+    Returns:
+        list of (dt.datetime, float): simulated time and elapsed wallclock seconds of each time step
+    """
+    steps = []
+    for line in text.splitlines():
+        if not line.startswith(re_timing):
+            continue
+        try:
+            model_time = dt.datetime.strptime(line[len(re_timing):].split()[0], '%Y-%m-%d_%H:%M:%S')
+            elapsed = float(line.split(':')[-1].split()[0])
+        except (ValueError, IndexError):
+            continue  # e.g. truncated line
+        steps.append((model_time, elapsed))
+    return steps
+
+
+def member_status(dir_wrf_run, start, end, stall_s=600, n_steps=50, now=None):
+    """Progress of one member
+
+    Args:
+        dir_wrf_run (str): WRF run directory of the member
+        start, end (dt.datetime): simulated period
+        stall_s (float): flag the member as stalled if rsl.out.0000 is older than this
+        n_steps (int): compute the speed from the last `n_steps` time steps
+
+    Returns:
+        dict: with keys status, model_time, progress (0..1), speed (simulated s / wallclock s),
+            eta_s (remaining wallclock seconds), age_s (seconds since rsl.out.0000 was written)
+    """
+    now = now or time.time()
+    f_rsl = dir_wrf_run + '/rsl.out.0000'
+    result = dict(dir=dir_wrf_run, status='not started', model_time=None, progress=0.,
+                  speed=None, eta_s=None, age_s=None)
+    if not os.path.exists(f_rsl):
+        return result
+
+    text = _read_tail(f_rsl)
+    result['age_s'] = round(now - os.path.getmtime(f_rsl), 1)
+    steps = parse_rsl(text)
+
+    if steps:
+        model_time = steps[-1][0]
+        result['model_time'] = model_time.strftime('%Y-%m-%d_%H:%M:%S')
+        total_s = (end - start).total_seconds() if start and end else 0
+        if total_s > 0:
+            result['progress'] = round(min(1., (model_time - start).total_seconds()/total_s), 4)
+
+        last = steps[-n_steps:]
+        if len(last) >= 2:
+            simulated_s = (last[-1][0] - last[0][0]).total_seconds()
+            wall_s = sum(elapsed for _, elapsed in last[1:])
+            if wall_s > 0 and simulated_s > 0:
+                result['speed'] = round(simulated_s/wall_s, 3)
+                if end:
+                    result['eta_s'] = round((end - model_time).total_seconds()/result['speed'], 1)
+
+    if success_msg in text:
+        result['status'] = 'complete'
+        result['progress'] = 1.
+        result['eta_s'] = 0.
+    elif result['age_s'] > stall_s:
+        result['status'] = 'stalled'
+    else:
+        result['status'] = 'running'
+    return result
+
+
+def _simulated_period(cfg, dir_wrf_run):
+    """Start and end of the simulation from the member's namelist.input, or WRF_start/WRF_end"""
+    f_nml = dir_wrf_run + '/namelist.input'
+    if os.path.exists(f_nml):
+        try:
+            from dartwrf.namelist_handler import WRF_namelist
+            nml = WRF_namelist()
+            nml.read(f_nml)
+            tc = nml.namelist['time_control']
+
+            def _time(prefix):
+                values = [tc[prefix+'_'+unit] for unit in ['year', 'month', 'day', 'hour', 'minute', 'second']]
+                values = [int(v[0] if isinstance(v, (tuple, list)) else v) for v in values]
+                return dt.datetime(*values)
+            return _time('start'), _time('end')
+        except Exception:
+            pass
+    return getattr(cfg, 'WRF_start', None), getattr(cfg, 'WRF_end', None)
+
+
+def ensemble_status(cfg, stall_s=600, slow_factor=0.5):
+    """Progress of all members in `cfg.dir_wrf_run`
+
+    Returns:
+        dict: member number => member status (see `member_status`)
+    """
+    status = {}
+    for iens in range(1, cfg.ensemble_size+1):
+        dir_wrf_run = cfg.dir_wrf_run.replace('<exp>', cfg.name).replace('<ens>', str(iens))
+        start, end = _simulated_period(cfg, dir_wrf_run)
+        status[iens] = member_status(dir_wrf_run, start, end, stall_s=stall_s)
+
+    speeds = [s['speed'] for s in status.values() if s['status'] == 'running' and s['speed']]
+    if speeds:
+        median_speed = float(np.median(speeds))
+        for s in status.values():
+            if s['status'] == 'running' and s['speed'] and s['speed'] < slow_factor*median_speed:
+                s['status'] = 'slow'
+    return status
+
+
+def print_status(status):
+    print('member  status        model time            progress   speed   ETA [min]')
+    for iens, s in status.items():
+        eta = '' if s['eta_s'] is None else str(round(s['eta_s']/60, 1))
+        speed = '' if s['speed'] is None else str(s['speed'])
+        print('{:6d}  {:12s}  {:20s}  {:7.1f}%  {:>6s}  {:>8s}'.format(
+            iens, s['status'], s['model_time'] or '', 100*s['progress'], speed, eta))
+    flagged = [iens for iens, s in status.items() if s['status'] in ('stalled', 'slow')]
+    if flagged:
+        print('stalled or slow members:', flagged)
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Progress of running WRF ensemble members')
+    parser.add_argument('f_cfg', help='path to config file')
+    parser.add_argument('--json', help='write the status to this file')
+    parser.add_argument('--stall-s', type=float, default=600,
+                        help='seconds without output until a member counts as stalled')
+    parser.add_argument('--slow-factor', type=float, default=0.5,
+                        help='members slower than this times the median speed count as slow')
+    parser.add_argument('--watch', type=float, help='repeat every WATCH seconds until all members finished')
+    args = parser.parse_args()
+
+    cfg = Config.from_file(args.f_cfg)
+    while True:
+        status = ensemble_status(cfg, stall_s=args.stall_s, slow_factor=args.slow_factor)
+        print_status(status)
+        if args.json:
+            with open(args.json+'.tmp', 'w') as f:
+                json.dump(status, f, indent=1)
+            os.replace(args.json+'.tmp', args.json)
+        if not args.watch or all(s['status'] == 'complete' for s in status.values()):
+            break
+        time.sleep(args.watch)
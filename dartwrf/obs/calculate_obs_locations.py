@@ -5,8 +5,8 @@ according to which observations are generated and subsequently assimilated.
 import os
 import sys
 import warnings
+import functools
 import numpy as np
-import xarray as xr
 
 #####################
 # Global variables
@@ -47,16 +47,20 @@ def square_array_from_domaincenter(n_obs, distance_between_obs_km):
     return coords
 
 
+@functools.lru_cache(maxsize=16)
 def evenly_on_grid(f_geo_em_nature: str, 
                    km_between_obs, skip_border_km=0):
     """Observations spread evenly over domain
 
     skip_border_km : no observations within this distance to the border
 
+    The result is cached, the locations are computed once per process (do not modify the returned list).
+
     Returns
         tuple of (lat, lon) coordinates of observed gridpoints in degrees
     """
     fcoords = f_geo_em_nature
+    import xarray as xr
     ds = xr.open_dataset(fcoords)
 
     lons = ds.XLONG_M.isel(Time=0).values
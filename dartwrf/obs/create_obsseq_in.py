@@ -7,7 +7,6 @@ import sys
 import warnings
 import numpy as np
 import datetime as dt
-from pysolar.solar import get_altitude, get_azimuth
 
 from dartwrf import utils
 from dartwrf.utils import Config
@@ -25,14 +24,30 @@ def degr_to_rad(degr):
     2*pi = 360 degrees
 
     Args:
-        degr (float) : degrees east of Greenwich
+        degr (float or np.ndarray) : degrees east of Greenwich
 
     Returns 
-        float
+        float or np.ndarray
     """
-    if degr < 0:
-        degr += 360
-    return degr/360*2*np.pi
+    if np.ndim(degr) == 0:
+        if degr < 0:
+            degr += 360
+        return degr/360*2*np.pi
+    degr = np.asarray(degr)
+    return np.where(degr < 0, degr + 360, degr)/360*2*np.pi
+
+
+def _rad_str(values):
+    """str() of `degr_to_rad` of each value, as for a single observation
+
+    Arrays are converted at once if this gives the same numbers (same type for all values, 
+    with numpy < 2 only double precision), otherwise value by value.
+    """
+    types = {type(v) for v in values}
+    if len(types) == 1 and (np.lib.NumpyVersion(np.__version__) >= '2.0.0'
+                            or types <= {float, int, np.float64}):
+        return [str(v) for v in degr_to_rad(np.asarray(values))]
+    return [str(degr_to_rad(v)) for v in values]
 
 
 def round_to_day(dtobj):
@@ -151,18 +166,45 @@ def write_sat_angle_appendix(sat_channel, lat0, lon0, time_dt):
         str
     """
     if sat_channel:
+        from pysolar.solar import get_altitude, get_azimuth  # slow to import
+
         sun_az = str(get_azimuth(lat0, lon0, time_dt))
         sun_zen = str(90. - get_altitude(lat0, lon0, time_dt))
         print('sunzen', sun_zen, 'sunazi', sun_az)
 
-        return """visir
+        return _visir_appendix(sat_channel, sat_az, sat_zen, sun_az, sun_zen)
+    else:
+        return ''
+
+
+def _visir_appendix(sat_channel, sat_az, sat_zen, sun_az, sun_zen):
+    """visir metadata with the angles as str"""
+    return """visir
     """+sat_az+"""        """+sat_zen+"""        """+sun_az+"""
     """+sun_zen+"""
             12           4          21           """+str(sat_channel)+"""
     -888888.000000000
             1"""
-    else:
-        return ''
+
+
+def write_sat_angle_appendices(sat_channel, lats, lons, time_dt, sat_lon=0.):
+    """Metadata str of each observation location, with its own sun and satellite angles
+
+    Args:
+        sat_channel (int): satellite channel
+        lats, lons (list of float): locations in degrees north/east
+        time_dt (dt.datetime): time of observation
+        sat_lon (float): longitude of the geostationary satellite
+
+    Returns:
+        list of str
+    """
+    from dartwrf.obs.sat_geometry import viewing_geometry
+
+    angles = viewing_geometry(time_dt, lats, lons, sat_lon)
+    angles = {name: ['{:.4f}'.format(v) for v in values.tolist()] for name, values in angles.items()}
+    return [_visir_appendix(sat_channel, *a) for a in zip(angles['sat_az'], angles['sat_zen'],
+                                                          angles['sun_az'], angles['sun_zen'])]
 
 
 def write_section(obs, last=False):
@@ -212,19 +254,32 @@ def create_obs_seq_in(cfg: Config, output_path='./obs_seq.in'):
             - error_assimilate (np.array or False) : False -> parameterized
             - cov_loc_radius_km (float)
     """
-    time_dt = cfg.time
-    list_obscfg = cfg.assimilate_these_observations
-    
-    os.makedirs(os.path.dirname(output_path), exist_ok=True)
-    
     obs_kind_nrs = utils.obskind_read(cfg.dir_dart_src)
+    write_obs_seq_in(output_path, cfg.time, cfg.assimilate_these_observations, obs_kind_nrs,
+                     geo_em=cfg.geo_em_nature)
+
+
+def write_obs_seq_in(output_path, time_dt, list_obscfg, obs_kind_nrs, geo_em=None, chunk_size=10000):
+    """Write obs_seq.in, see `create_obs_seq_in`
+
+    The text of all observations of a type is formatted column by column 
+    and written in chunks of `chunk_size` observations.
+    The file is identical to joining `write_section` of every observation.
+
+    Args:
+        time_dt (dt.datetime): time of observation
+        list_obscfg (list of dict): configuration for observation types
+        obs_kind_nrs (dict): observation type => DART ID number
+        geo_em (str): geo_em file, for observations on the default grid
+    """
+    os.makedirs(os.path.dirname(output_path), exist_ok=True)
 
     print('creating obs_seq.in:')
     time_dt = _add_timezone_UTC(time_dt)
     dart_date_day, secs_thatday = get_dart_date(time_dt)
 
-    txt = ''
-    i_obs_total = 0
+    # locations and metadata of all types first, the header needs the total number
+    obstypes = []
     for i_cfg, obscfg in enumerate(list_obscfg):
 
         # obstypes with precomputed FO do not need obs_seq.in
@@ -238,7 +293,7 @@ def create_obs_seq_in(cfg: Config, output_path='./obs_seq.in'):
 
         if obs_locations == 'DEFAULT_GRID':
             # compute as a square_array_evenly_on_grid
-            coords = col.evenly_on_grid(cfg.geo_em_nature,
+            coords = col.evenly_on_grid(geo_em,
                                         obscfg['km_between_obs'],
                                         obscfg['skip_border_km'])
         else:
@@ -246,9 +301,10 @@ def create_obs_seq_in(cfg: Config, output_path='./obs_seq.in'):
             coords = obscfg['obs_locations']
 
         # check if lon/lat within bounds
-        for lat, lon in coords:
-            assert (lat < 90) & (lat > -90), 'latitude out of bounds'
-            assert (lon < 180) & (lon > -180), 'longitude out of bounds'
+        lats = [lat for lat, lon in coords]
+        lons = [lon for lat, lon in coords]
+        assert np.all((np.asarray(lats) < 90) & (np.asarray(lats) > -90)), 'latitude out of bounds'
+        assert np.all((np.asarray(lons) < 180) & (np.asarray(lons) > -180)), 'longitude out of bounds'
 
         kind = obscfg['kind']
         print('obstype', kind)
@@ -257,43 +313,76 @@ def create_obs_seq_in(cfg: Config, output_path='./obs_seq.in'):
         # add observation locations in the vertical at different levels
         vert_coord_sys, vert_coords = _determine_vert_coords(
             sat_channel, kind, obscfg)
-        coords = _append_hgt_to_coords(coords, vert_coords)
-        n_obs_3d_thistype = len(coords)
+        try:
+            len(vert_coords)  # fails with scalar
+        except TypeError:
+            vert_coords = [vert_coords, ]
+        n_levels = len(vert_coords)
+        n_obs_3d_thistype = len(coords)*n_levels
+        print('effective number of observations (with vertical levels):', n_obs_3d_thistype,
+              ' on each level:', len(coords))
 
         # user defined generation error
         obserr_std = np.zeros(n_obs_3d_thistype) + obscfg["error_generate"]
 
-        sat_info = write_sat_angle_appendix(sat_channel, lat0, lon0, time_dt)
-
-        for i_obs in range(n_obs_3d_thistype):
-            i_obs_total += 1
-            last = False
-
-            is_last_obs_in_type = (i_obs == int(n_obs_3d_thistype)-1)
-            is_last_obstype = (i_cfg == len(list_obscfg)-1)
-
-            if is_last_obs_in_type and is_last_obstype:
-                last = True
+        # satellite metadata, one str for all locations or one per location
+        if sat_channel and obscfg.get('per_obs_geometry', False):
+            appendix = write_sat_angle_appendices(sat_channel, lats, lons, time_dt,
+                                                  obscfg.get('sat_lon', 0.))
+        else:
+            appendix = write_sat_angle_appendix(sat_channel, lat0, lon0, time_dt)
 
-            txt += write_section(dict(i=i_obs_total,
-                                      kind_nr=obs_kind_nrs[kind],
-                                      dart_date_day=dart_date_day,
-                                      secs_thatday=secs_thatday,
-                                      lon=coords[i_obs][1],
-                                      lat=coords[i_obs][0],
-                                      vert_coord=coords[i_obs][2],
-                                      vert_coord_sys=vert_coord_sys,
-                                      obserr_var=obserr_std[i_obs]**2,
-                                      appendix=sat_info),
-                                 last=last)
+        obstypes.append(dict(i_cfg=i_cfg, lat_rad=_rad_str(lats), lon_rad=_rad_str(lons), 
+                             vert_coords=[str(v) for v in vert_coords], vert_coord_sys=vert_coord_sys,
+                             kind_nr=str(obs_kind_nrs[kind]), obserr_var=obserr_std**2,
+                             appendix=appendix))
 
-    n_obs_total = i_obs_total
+    n_obs_total = sum(len(t['obserr_var']) for t in obstypes)
     list_kinds = [a['kind'] for a in list_obscfg]
-    pretxt = preamble(n_obs_total, list_kinds, obs_kind_nrs)
 
-    alltxt = pretxt + txt
-    _write_file(alltxt, output_path=output_path)
+    try:
+        os.remove(output_path)
+    except OSError:
+        pass
 
+    with open(output_path, 'w', buffering=1 << 20) as f:
+        f.write(preamble(n_obs_total, list_kinds, obs_kind_nrs))
+
+        i_obs_total = 0
+        for t in obstypes:
+            is_last_obstype = (t['i_cfg'] == len(list_obscfg)-1)
+            # everything except observation number, links, location and error
+            middle = ("\nobdef\nloc3d\n     ", 
+                      "     "+t['vert_coord_sys']+"\nkind\n         "+t['kind_nr']+"\n",
+                      "\n"+secs_thatday+"     "+dart_date_day+"\n")
+            appendix = t['appendix']
+            if isinstance(appendix, str):
+                appendix = [appendix]*len(t['lat_rad'])
+            n_levels = len(t['vert_coords'])
+            obserr_var = t['obserr_var']
+            if len(obserr_var) and np.all(obserr_var == obserr_var[0]):
+                obserr_var_str = [str(obserr_var[0])]*len(obserr_var)  # usually one error for all
+            else:
+                obserr_var_str = [str(v) for v in obserr_var]
+
+            chunk = []
+            for i_obs in range(len(obserr_var)):
+                i_obs_total += 1
+                i_coord, i_level = divmod(i_obs, n_levels)
+                if is_last_obstype and i_obs == len(obserr_var)-1:
+                    line_link = "          "+str(i_obs_total-1)+"           -1          -1"
+                else:
+                    line_link = "        -1           "+str(i_obs_total+1)+"          -1"
+
+                chunk.append("\n OBS            "+str(i_obs_total)+"\n"+line_link+middle[0]
+                             + t['lon_rad'][i_coord]+"        "+t['lat_rad'][i_coord]+"        "
+                             + t['vert_coords'][i_level]+middle[1]+appendix[i_coord]+middle[2]
+                             + obserr_var_str[i_obs])
+                if len(chunk) == chunk_size:
+                    f.write(''.join(chunk))
+                    chunk = []
+            f.write(''.join(chunk))
+    print(output_path, 'saved.')
 
 if __name__ == '__main__':
     
@@ -1,81 +1,140 @@
 import os, sys
 import shutil
-import glob
 import warnings
+import time as time_module
+from copy import copy as shallow_copy
+from concurrent.futures import ThreadPoolExecutor
 
 from dartwrf.utils import Config, try_remove, print, shell, symlink, copy, obskind_read
 import dartwrf.obs.create_obsseq_in as osi
-from dartwrf.obs import obsseq
-from dartwrf import wrfout_add_geo
+from dartwrf.obs import obsseq, obs_cache, nature_cache
+from dartwrf import wrfout_add_geo, dart_log, dart_ranks, catalog
 
 
-def prepare_nature_dart(cfg: Config):
+def find_nature(cfg: Config, time):
+    """Find the path to the nature file for the given time
+
+    Uses the archive catalog `cfg.catalog_db` if set (see `dartwrf.catalog`), otherwise glob.
+    """
+    glob_pattern = time.strftime(cfg.nature_wrfout_pattern)
+    print('searching for nature in pattern:', glob_pattern)
+    try:
+        f_nat = catalog.find_files(cfg, glob_pattern)[0]  # find the nature wrfout-file
+    except IndexError:
+        raise IOError("no nature found with pattern "+glob_pattern)
+
+    # check user input
+    if not 'wrfout' in f_nat.split('/')[-1]:
+        warnings.warn(
+            f_nat+" does not contain 'wrfout' in filename, are you sure this is a valid nature file?")
+
+    if not os.path.exists(f_nat):
+        raise IOError(f_nat+" does not exist -> no nature found")
+    
+    print('using nature:', f_nat)
+    return f_nat
+
+
+def prepare_nature_dart(cfg: Config, dir_dart_run=None):
     """Prepares DART nature (wrfout_d01) if available
 
+    With `cfg.dir_nature_cache`, the nature file with added coordinates is taken from the cache
+    and linked (see `nature_cache`), instead of copied and modified every time.
+
     Args:
-        time (dt.datetime): Time at which observations will be made
+        dir_dart_run (str, optional): directory to prepare the nature in, default: `cfg.dir_dart_run`
+
+    Returns:
+        str: path of the nature file
     """
     time = cfg.time
-    
-    def _find_nature(time):
-        """Find the path to the nature file for the given time
-        """
-        glob_pattern = time.strftime(cfg.nature_wrfout_pattern)
-        print('searching for nature in pattern:', glob_pattern)
-        try:
-            f_nat = glob.glob(glob_pattern)[0]  # find the nature wrfout-file
-        except IndexError:
-            raise IOError("no nature found with pattern "+glob_pattern)
-
-        # check user input
-        if not 'wrfout' in f_nat.split('/')[-1]:
-            warnings.warn(
-                f_nat+" does not contain 'wrfout' in filename, are you sure this is a valid nature file?")
-
-        if not os.path.exists(f_nat):
-            raise IOError(f_nat+" does not exist -> no nature found")
-        
-        print('using nature:', f_nat)
-        return f_nat
+    dir_dart_run = dir_dart_run or cfg.dir_dart_run
     
     print("prepare nature")
-    f_nat = _find_nature(time)
-    # link nature wrfout to DART directory
-    copy(f_nat, cfg.dir_dart_run + "/wrfout_d01")
+    f_nat = find_nature(cfg, time)
+
+    if cfg.geo_em_nature and getattr(cfg, 'dir_nature_cache', False):
+        f_prepared = nature_cache.prepared_nature(f_nat, cfg.geo_em_nature, cfg.dir_nature_cache,
+                                                  ncks=getattr(cfg, 'ncks', 'ncks'),
+                                                  max_GB=getattr(cfg, 'nature_cache_max_GB', 200))
+        symlink(f_prepared, dir_dart_run + "/wrfout_d01")
+    else:
+        # copy nature wrfout to DART directory
+        copy(f_nat, dir_dart_run + "/wrfout_d01")
 
-    # add coordinates if necessary
-    if cfg.geo_em_nature:
-        wrfout_add_geo.run(cfg, cfg.geo_em_nature, cfg.dir_dart_run + "/wrfout_d01")
+        # add coordinates if necessary
+        if cfg.geo_em_nature:
+            wrfout_add_geo.run(cfg.geo_em_nature, dir_dart_run + "/wrfout_d01", cfg.ncks)
         
     # as a grid template
-    symlink(cfg.dir_dart_run + "/wrfout_d01", cfg.dir_dart_run + "/wrfinput_d01")
-    
+    symlink(dir_dart_run + "/wrfout_d01", dir_dart_run + "/wrfinput_d01")
+    return f_nat
 
 
-def run_perfect_model_obs(cfg: Config):
+def run_perfect_model_obs(cfg: Config, dir_dart_run=None, nproc=None):
     """Run the ./perfect_model_obs program
 
     Args:
-        nproc (int): number of processors to use
+        dir_dart_run (str, optional): directory to run in, default: `cfg.dir_dart_run`
+        nproc (int, optional): number of processors, default: `cfg.max_nproc`
+            or as many as `dart_ranks.select_nproc` chooses if `cfg.auto_nproc`
 
     Returns:
         None, creates obs_seq.out
     """
-    print("running ./perfect_model_obs")
-    os.chdir(cfg.dir_dart_run)
-    nproc = cfg.max_nproc
+    dir_dart_run = dir_dart_run or cfg.dir_dart_run
+    print("running ./perfect_model_obs in", dir_dart_run)
 
-    try_remove(cfg.dir_dart_run + "/obs_seq.out")
-    if not os.path.exists(cfg.dir_dart_run + "/obs_seq.in"):
-        raise RuntimeError("obs_seq.in does not exist in " + cfg.dir_dart_run)
+    try_remove(dir_dart_run + "/obs_seq.out")
+    if not os.path.exists(dir_dart_run + "/obs_seq.in"):
+        raise RuntimeError("obs_seq.in does not exist in " + dir_dart_run)
+
+    if nproc is None:
+        nproc = dart_ranks.select_nproc(cfg, 'perfect_model_obs', dart_log.count_obs(dir_dart_run + "/obs_seq.in"))
+        if nproc is None:
+            nproc = cfg.max_nproc
+        else:
+            from dartwrf import dart_nml
+            dart_nml.write_namelist(cfg, nproc=nproc, dir_dart_run=dir_dart_run)
     
-    shell(cfg.dart_modules+'; mpirun -np '+str(nproc) +
-          " ./perfect_model_obs &> log.perfect_model_obs")
+    t = time_module.time()
+    shell(cfg.dart_modules+'; mpirun -np '+str(nproc)+" ./perfect_model_obs",
+          cwd=dir_dart_run, log_file=dir_dart_run+"/log.perfect_model_obs",
+          timeout=getattr(cfg, 'timeout_dart_s', None),
+          metrics_file=cfg.dir_log+'/process_metrics.jsonl', name='perfect_model_obs')
+    dart_log.record_run(cfg, 'perfect_model_obs', dir_dart_run+"/log.perfect_model_obs",
+                        dir_dart_run+"/obs_seq.in", nproc=nproc, wall_s=time_module.time() - t)
     
-    if not os.path.exists(cfg.dir_dart_run + "/obs_seq.out"):
+    if not os.path.exists(dir_dart_run + "/obs_seq.out"):
         raise RuntimeError(
-            "obs_seq.out does not exist in " + cfg.dir_dart_run,
-            ". See "+cfg.dir_dart_run + "/log.perfect_model_obs")
+            "obs_seq.out does not exist in " + dir_dart_run,
+            ". See "+dir_dart_run + "/log.perfect_model_obs")
+
+
+def force_obs_in_physical_range(cfg: Config, oso, f_out):
+    """ Set values smaller than surface albedo to surface albedo
+    Highly hacky. Your albedo might be different.
+    """
+    print(" removing obs below surface albedo ")
+    clearsky_albedo = 0.2928  # custom value
+    obs_kind_nrs = obskind_read(cfg.dir_dart_src)
+
+    if_vis_obs = oso.df['kind'].values == obs_kind_nrs['MSG_4_SEVIRI_BDRF']
+    if_obs_below_surface_albedo = oso.df['observations'].values < clearsky_albedo
+    oso.df.loc[if_vis_obs & if_obs_below_surface_albedo,
+            ('observations')] = clearsky_albedo
+    oso.to_dart(f=f_out)
+    return oso
+
+
+def provide_obs_seq_in(cfg: Config, f_out):
+    if hasattr(cfg, 'use_this_obs_seq_in'):
+        # custom definition of an obs_seq.in file
+        print("using obs_seq.in:", cfg.use_this_obs_seq_in)
+        copy(cfg.use_this_obs_seq_in, f_out)
+    else:
+        # create file from scratch
+        osi.create_obs_seq_in(cfg, f_out)
 
 
 def generate_new_obsseq_out(cfg: Config):
@@ -84,6 +143,9 @@ def generate_new_obsseq_out(cfg: Config):
 
     Note:
         Combining precomputed FO with regular observations is not supported!
+        With `cfg.dir_obs_cache`, observations are taken from the cache if possible (see `obs_cache`).
+        The nature file is prepared in any case, `assimilate.prepare_prior_ensemble` 
+        takes the time of the prior from it.
 
     Args:
         time (datetime): time of the observations
@@ -93,38 +155,21 @@ def generate_new_obsseq_out(cfg: Config):
         obsseq.ObsSeq: obs_seq.out representation
     """
     time = cfg.time
-    
-    def __force_obs_in_physical_range(oso):
-        """ Set values smaller than surface albedo to surface albedo
-        Highly hacky. Your albedo might be different.
-        """
-        print(" removing obs below surface albedo ")
-        clearsky_albedo = 0.2928  # custom value
-        obs_kind_nrs = obskind_read(cfg.dir_dart_src)
-
-        if_vis_obs = oso.df['kind'].values == obs_kind_nrs['MSG_4_SEVIRI_BDRF']
-        if_obs_below_surface_albedo = oso.df['observations'].values < clearsky_albedo
-        oso.df.loc[if_vis_obs & if_obs_below_surface_albedo,
-                ('observations')] = clearsky_albedo
-        oso.to_dart(f=cfg.dir_dart_run + "/obs_seq.out")
-        return oso
-
-    def __provide_obs_seq_in(cfg: Config):
-        if hasattr(cfg, 'use_this_obs_seq_in'):
-            # custom definition of an obs_seq.in file
-            print("using obs_seq.in:", cfg.use_this_obs_seq_in)
-            copy(cfg.use_this_obs_seq_in, cfg.dir_dart_run+'/obs_seq.in')
-        else:
-            # create file from scratch
-            osi.create_obs_seq_in(cfg, cfg.dir_dart_run+'/obs_seq.in')  
-    
-    ##############################
-    __provide_obs_seq_in(cfg)
-    prepare_nature_dart(cfg)
-    run_perfect_model_obs(cfg)
+    f_out = cfg.dir_dart_run + "/obs_seq.out"
+
+    f_nat = prepare_nature_dart(cfg)
 
-    oso = obsseq.ObsSeq(cfg.dir_dart_run + "/obs_seq.out")
-    oso = __force_obs_in_physical_range(oso)
+    key = obs_cache.cache_key(cfg, time, f_nat) if obs_cache.enabled(cfg) else None
+    if key and obs_cache.fetch(cfg, key, f_out):
+        oso = obsseq.ObsSeq(f_out)
+    else:
+        provide_obs_seq_in(cfg, cfg.dir_dart_run+'/obs_seq.in')
+        run_perfect_model_obs(cfg)
+
+        oso = obsseq.ObsSeq(f_out)
+        oso = force_obs_in_physical_range(cfg, oso, f_out)
+        if key:
+            obs_cache.store(cfg, key, f_out)
     
     f_dest = time.strftime(cfg.pattern_obs_seq_out)
     os.makedirs(os.path.dirname(f_dest), exist_ok=True)
@@ -132,26 +177,87 @@ def generate_new_obsseq_out(cfg: Config):
     return oso
 
 
-if __name__ == '__main__':
-    """Generate obs_seq.out files from any wrfout files
-    Make sure that the nature & obs info is complete in the config file.
+def generate_obsseq_out_batch(cfg: Config, times):
+    """Generate obs_seq.out files for several times at once
 
-    Usage:
-        python create_obsseq_out.py exp_hires.py jet.py 2008-07-30_12:00,2008-07-30_12:01 /jetfs/home/lkugler/data/HiResNature_obs
+    perfect_model_obs can not advance WRF to the next observation time,
+    therefore one obs_seq.in covering all times can not be used and each time needs its own run.
+    Instead of running them one after another, the runs of all times share `cfg.max_nproc` processors
+    and run at the same time, each in its own subdirectory of run_DART.
+    Observation locations are computed only once (see `calculate_obs_locations.evenly_on_grid`).
+
+    Options in `cfg`:
+        obs_batch_parallel (int): number of perfect_model_obs runs at the same time, default: all
 
     Args:
-        times (str): comma-separated list of times of the observations
+        times (list of dt.datetime): observation times
 
     Returns:
-        None, creates obs_seq.out in cluster.archivedir
+        None, creates `time.strftime(cfg.pattern_obs_seq_out)` for each time
     """
-    # cfg = Config.from_file(sys.argv[1])
+    n_parallel = min(len(times), int(getattr(cfg, 'obs_batch_parallel', len(times))), int(cfg.max_nproc))
+    nproc = max(1, int(cfg.max_nproc) // n_parallel)
+    print('generating observations for', len(times), 'times,', n_parallel, 'runs with', nproc, 'processors each')
 
-    # aso.prepare_run_DART_folder()
-    # nml = dart_nml.write_namelist()
+    # executables, namelist and RTTOV coefficients prepared in run_DART
+    shared_files = ['input.nml'] + [f for f in os.listdir(cfg.dir_dart_run)
+                                    if os.path.islink(cfg.dir_dart_run + '/' + f)
+                                    and not f.startswith(('wrf', 'obs_seq'))]
 
-    # for time in times:
-    #     print("time", time)
-    #     time = dt.datetime.strptime(time, '%Y-%m-%d_%H:%M')
-    #     generate_new_obsseq_out(time)
-        
+    def _generate(time):
+        cfg_t = shallow_copy(cfg)
+        cfg_t.time = time
+        dir_run = cfg.dir_dart_run + time.strftime('/obs_%Y-%m-%d_%H:%M')
+        os.makedirs(dir_run, exist_ok=True)
+
+        key = obs_cache.cache_key(cfg_t, time, find_nature(cfg_t, time)) if obs_cache.enabled(cfg) else None
+        if not (key and obs_cache.fetch(cfg_t, key, dir_run + "/obs_seq.out")):
+            for f in shared_files:
+                symlink(cfg.dir_dart_run + '/' + f, dir_run + '/' + f)
+
+            provide_obs_seq_in(cfg_t, dir_run + '/obs_seq.in')
+            prepare_nature_dart(cfg_t, dir_run)
+            run_perfect_model_obs(cfg_t, dir_run, nproc=nproc)
+
+            oso = obsseq.ObsSeq(dir_run + "/obs_seq.out")
+            force_obs_in_physical_range(cfg_t, oso, dir_run + "/obs_seq.out")
+            if key:
+                obs_cache.store(cfg_t, key, dir_run + "/obs_seq.out")
+
+        f_dest = time.strftime(cfg.pattern_obs_seq_out)
+        os.makedirs(os.path.dirname(f_dest), exist_ok=True)
+        shutil.copy(dir_run + '/obs_seq.out', f_dest)
+        print(f_dest, 'saved')
+
+    with ThreadPoolExecutor(max_workers=n_parallel) as pool:
+        for future in [pool.submit(_generate, time) for time in times]:
+            future.result()  # raise errors
+
+
+def main(cfg: Config):
+    """Prepare the run_DART folder and generate an obs_seq.out file for `cfg.time`,
+    or for all times in `cfg.obs_times` if it is set
+    """
+    from dartwrf import assimilate as aso
+    from dartwrf import dart_nml
+
+    aso.prepare_run_DART_folder(cfg)
+    dart_nml.write_namelist(cfg)
+    if getattr(cfg, 'obs_times', None):
+        generate_obsseq_out_batch(cfg, cfg.obs_times)
+    else:
+        generate_new_obsseq_out(cfg)
+
+
+if __name__ == '__main__':
+    """Generate obs_seq.out files from any wrfout files
+    Make sure that the nature & obs info is complete in the config file.
+
+    Usage:
+        python create_obsseq_out.py <path to config file>
+
+    Returns:
+        None, creates obs_seq.out in cfg.pattern_obs_seq_out
+    """
+    cfg = Config.from_file(sys.argv[1])
+    main(cfg)
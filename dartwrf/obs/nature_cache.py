@@ -0,0 +1,63 @@
+"""Cache of nature files prepared for DART (with coordinates from geo_em)
+
+`create_obsseq_out.prepare_nature_dart` needs the nature wrfout with the coordinates of `cfg.geo_em_nature`.
+Copying and patching a large nature file every cycle of every experiment is slow.
+With `cfg.dir_nature_cache` set, the prepared file is created once per (nature file, geo_em file)
+and then only linked into the run directory.
+
+Cached files are created under a temporary name and renamed when complete,
+so jobs running at the same time never use a half-written file.
+They are read-only, DART only reads them (`write_output_state_to_file = .false.`).
+The cache is limited to `cfg.nature_cache_max_GB` (default 200), the least recently used files are removed first.
+"""
+import os
+import stat
+import hashlib
+
+from dartwrf.utils import copy, try_remove, print
+from dartwrf.obs.obs_cache import evict
+
+
+def cache_key(f_nature, f_geo_em):
+    """Key of a prepared nature file: path, size and modification time of both files"""
+    parts = []
+    for f in (f_nature, f_geo_em):
+        st = os.stat(f)
+        parts += [os.path.realpath(f), str(st.st_size), str(st.st_mtime_ns)]
+    return hashlib.sha1('\n'.join(parts).encode()).hexdigest()[:16]
+
+
+def prepared_nature(f_nature, f_geo_em, dir_cache, ncks='ncks', max_GB=200):
+    """Path of the nature file with coordinates from `f_geo_em`, created if not yet in the cache
+
+    Args:
+        f_nature (str): nature wrfout file
+        f_geo_em (str): geo_em file with the coordinates
+        dir_cache (str): cache directory
+
+    Returns:
+        str
+    """
+    from dartwrf import wrfout_add_geo
+
+    f_cached = dir_cache + '/' + os.path.basename(f_nature) + '.' + cache_key(f_nature, f_geo_em) + '.nature'
+    if os.path.isfile(f_cached):
+        os.utime(f_cached)  # mark as recently used
+        print('using prepared nature from cache:', f_cached)
+        return f_cached
+
+    os.makedirs(dir_cache, exist_ok=True)
+    f_tmp = f_cached + '.tmp' + str(os.getpid())
+    try:
+        copy(f_nature, f_tmp)
+        os.chmod(f_tmp, os.stat(f_tmp).st_mode | stat.S_IWUSR)
+        wrfout_add_geo.run(f_geo_em, f_tmp, ncks)
+        os.chmod(f_tmp, stat.S_IRUSR | stat.S_IRGRP | stat.S_IROTH)
+        os.replace(f_tmp, f_cached)
+        os.utime(f_cached)
+    finally:
+        try_remove(f_tmp)
+    print('prepared nature saved in cache:', f_cached)
+
+    evict(dir_cache, max_GB*1e9, pattern='*.nature')
+    return f_cached
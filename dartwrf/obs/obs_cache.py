@@ -0,0 +1,133 @@
+"""Cache of generated observations (obs_seq.out), shared by experiments
+
+Experiments which differ only in assimilation settings (e.g. localization, `error_assimilate`)
+generate the same synthetic observations from the same nature run.
+With `cfg.dir_obs_cache` set, the obs_seq.out generated by `create_obsseq_out`
+is stored in that directory and reused by other experiments.
+
+The key of a cached file is a hash of
+    - the nature file (path, size, modification time) and `cfg.geo_em_nature`,
+    - the fields of `cfg.assimilate_these_observations` which change the generated observations
+      (kind, channel, locations, heights, `error_generate`, ...),
+    - `cfg.use_this_obs_seq_in` (path, size, modification time) if set,
+    - the sections of `cfg.dart_nml` which configure the forward operators
+      (`&obs_def_*`, `&obs_kind_nml`) and the content of `cfg.rttov_nml`,
+    - the DART build directory, the observation time and `cfg.obs_seed`.
+Set different `cfg.obs_seed` values to keep the observations of experiments apart.
+
+The cache is limited to `cfg.obs_cache_max_GB` (default 10),
+the least recently used files are removed first.
+"""
+import os
+import json
+import glob
+import hashlib
+
+from dartwrf.utils import copy, try_remove, print
+
+# namelist sections which change the forward operators of perfect_model_obs
+nml_section_prefixes = ('&obs_def', '&obs_kind')
+
+# fields of an observation config which determine the generated observations
+generation_fields = ['kind', 'sat_channel', 'obs_locations', 'km_between_obs', 'skip_border_km', 'n_obs',
+                     'height', 'heights', 'error_generate', 'precomputed_FO', 'per_obs_geometry', 'sat_lon']
+
+
+def enabled(cfg):
+    return bool(getattr(cfg, 'dir_obs_cache', False))
+
+
+def _file_identity(f):
+    if not f:
+        return None
+    st = os.stat(f)
+    return [os.path.realpath(f), st.st_size, st.st_mtime_ns]
+
+
+def _file_content_hash(f):
+    if not f:
+        return None
+    with open(f, 'rb') as fh:
+        return hashlib.sha1(fh.read()).hexdigest()
+
+
+def cache_key(cfg, time, f_nature):
+    """Key of the observations generated at `time` from `f_nature`
+
+    Returns:
+        str
+    """
+    obs = [{field: obscfg[field] for field in generation_fields if field in obscfg}
+           for obscfg in cfg.assimilate_these_observations]
+    d = dict(nature=_file_identity(f_nature),
+             geo_em=_file_identity(getattr(cfg, 'geo_em_nature', None)),
+             obs_seq_in=_file_identity(getattr(cfg, 'use_this_obs_seq_in', None)),
+             nml={section: values for section, values in getattr(cfg, 'dart_nml', {}).items()
+                  if section.startswith(nml_section_prefixes)},
+             rttov_nml=_file_content_hash(getattr(cfg, 'rttov_nml', None)),
+             dart=os.path.realpath(cfg.dir_dart_src),
+             obs=obs,
+             time=time.strftime('%Y-%m-%d_%H:%M:%S'),
+             seed=getattr(cfg, 'obs_seed', None))
+    return hashlib.sha1(json.dumps(d, sort_keys=True, default=str).encode()).hexdigest()
+
+
+def _path(cfg, key):
+    return cfg.dir_obs_cache + '/' + key + '.obs_seq.out'
+
+
+def fetch(cfg, key, f_out):
+    """Copy cached observations to `f_out`
+
+    Returns:
+        bool: True if the observations were in the cache
+    """
+    f_cached = _path(cfg, key)
+    if not os.path.isfile(f_cached):
+        return False
+    copy(f_cached, f_out)
+    os.utime(f_cached)  # mark as recently used
+    print('observations from cache:', f_cached)
+    return True
+
+
+def store(cfg, key, f_obsseq):
+    """Add an obs_seq.out file to the cache, then remove old files if the cache is too large"""
+    os.makedirs(cfg.dir_obs_cache, exist_ok=True)
+    f_cached = _path(cfg, key)
+    f_tmp = f_cached + '.tmp' + str(os.getpid())
+    try:
+        copy(f_obsseq, f_tmp)
+        os.replace(f_tmp, f_cached)  # other experiments never see incomplete files
+        os.utime(f_cached)
+    finally:
+        try_remove(f_tmp)
+    evict(cfg.dir_obs_cache, getattr(cfg, 'obs_cache_max_GB', 10)*1e9)
+
+
+def evict(dir_cache, max_bytes, pattern='*.obs_seq.out'):
+    """Remove the least recently used files until the cache is smaller than `max_bytes`
+
+    Args:
+        pattern (str): glob pattern of the cached files in `dir_cache`
+
+    Returns:
+        int: number of removed files
+    """
+    entries = []
+    for f in glob.glob(dir_cache + '/' + pattern):
+        try:
+            st = os.stat(f)
+        except FileNotFoundError:
+            continue  # removed by another job
+        entries.append((st.st_mtime, st.st_size, f))
+
+    total = sum(size for _, size, _ in entries)
+    n_removed = 0
+    for _, size, f in sorted(entries):
+        if total <= max_bytes:
+            break
+        try_remove(f)
+        total -= size
+        n_removed += 1
+    return n_removed
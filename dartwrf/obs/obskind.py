@@ -0,0 +1,109 @@
+"""Observation types ("kinds") defined in DART and their ID numbers
+
+The table is parsed from DART's `obs_kind_mod.f90` once per DART source tree
+and cached as JSON in `~/.cache/dartwrf/` (or `$XDG_CACHE_HOME/dartwrf/`).
+The cache is used as long as the modification time and size of `obs_kind_mod.f90` did not change.
+
+Example:
+    >>> kinds = read(cfg.dir_dart_src)
+    >>> kinds['MSG_4_SEVIRI_TB']
+    261
+    >>> kinds.name(261)
+    'MSG_4_SEVIRI_TB'
+"""
+import os
+import json
+import hashlib
+
+dir_cache = os.path.join(os.environ.get('XDG_CACHE_HOME', os.path.expanduser('~/.cache')), 'dartwrf')
+
+# registries read in this process, key: (path, mtime, size)
+_memo = {}
+
+
+class ObsKindRegistry(dict):
+    """Dictionary of observation type (str) => ID number (int),
+    with the inverse mapping in `name()`
+    """
+    def __init__(self, kinds):
+        super().__init__(kinds)
+        self.names = {nr: kind for kind, nr in kinds.items()}
+
+    def name(self, kind_nr):
+        """Observation type (str) of an ID number, e.g. 261 => 'MSG_4_SEVIRI_TB'"""
+        return self.names[int(kind_nr)]
+
+
+def definition_file(dart_srcdir: str) -> str:
+    """Path to `obs_kind_mod.f90`, given the DART build directory (cfg.dir_dart_src)"""
+    return dart_srcdir + '/../../../assimilation_code/modules/observations/obs_kind_mod.f90'
+
+
+def parse_obs_kind_mod(definitionfile: str) -> dict:
+    """Read observation types + ID numbers from DART's obs_kind_mod.f90
+
+    Returns:
+        dict: observation type (str) => ID number (int)
+    """
+    with open(definitionfile, 'r') as f:
+        kind_def_f = f.readlines()
+
+    obskind_nrs = {}
+    for i, line in enumerate(kind_def_f):
+        if 'Integer definitions for DART OBS TYPES' in line:
+            # data starts below this line
+            i_start = i
+            break
+    for line in kind_def_f[i_start+1:]:
+        if 'MAX_DEFINED_TYPES_OF_OBS' in line:
+            # end of data
+            break
+        if '::' in line:
+            # a line looks like this
+            # integer, parameter, public ::       MSG_4_SEVIRI_TB =   261
+            data = line.split('::')[-1].split('=')
+            kind_str = data[0].strip()
+            kind_nr = int(data[1].strip())
+            obskind_nrs[kind_str] = kind_nr
+    return obskind_nrs
+
+
+def read(dart_srcdir: str) -> ObsKindRegistry:
+    """Observation types of a DART source tree, from cache if possible
+
+    Args:
+        dart_srcdir (str): DART build directory, e.g. cfg.dir_dart_src
+
+    Returns:
+        ObsKindRegistry
+    """
+    definitionfile = os.path.realpath(definition_file(dart_srcdir))
+    stat = os.stat(definitionfile)
+    key = (definitionfile, stat.st_mtime_ns, stat.st_size)
+    if key in _memo:
+        return _memo[key]
+
+    f_cache = os.path.join(dir_cache, 'obskind_'
+                           + hashlib.sha1(definitionfile.encode()).hexdigest()[:16] + '.json')
+    kinds = None
+    try:
+        with open(f_cache) as f:
+            cached = json.load(f)
+        if [cached['file'], cached['mtime_ns'], cached['size']] == list(key):
+            kinds = cached['kinds']
+    except (OSError, ValueError, KeyError):
+        pass
+
+    if kinds is None:
+        kinds = parse_obs_kind_mod(definitionfile)
+        try:
+            os.makedirs(dir_cache, exist_ok=True)
+            f_tmp = f_cache + '.' + str(os.getpid()) + '.tmp'
+            with open(f_tmp, 'w') as f:
+                json.dump(dict(file=key[0], mtime_ns=key[1], size=key[2], kinds=kinds), f)
+            os.replace(f_tmp, f_cache)
+        except OSError:
+            pass  # e.g. read-only home directory, parse again next time
+
+    _memo[key] = ObsKindRegistry(kinds)
+    return _memo[key]
@@ -619,11 +619,13 @@ class ObsSeq(object):
         list_of_obsdict = obs_list_to_dict(obs_list)
         return list_of_obsdict
 
-    def append_obsseq(self, list_of_obsseq):
+    def append_obsseq(self, list_of_obsseq, obs_kinds=None):
         """Append a list of ObsSeq objects
 
         Args:
             list_of_obsseq (list of ObsSeq())
+            obs_kinds (dict, optional): observation type => ID number, e.g. utils.obskind_read(cfg.dir_dart_src)
+                only needed if an observation type is not declared in the headers of the inputs
 
         Example:
             Combine two ObsSeq() objects
@@ -634,13 +636,17 @@ class ObsSeq(object):
         Returns:
             ObsSeq() with combined data
         """
-        from dartwrf.obs.obskind import obs_kind_nrs  # dictionary string => DART internal indices
-        inverted_obs_kind_nrs = {v: k for k, v in obs_kind_nrs.items()}
-
         for a in list_of_obsseq:
             if not isinstance(a, ObsSeq):
                 raise ValueError('Input must be of type ObsSeq!')
 
+        # DART internal indices => string, from the headers of all inputs
+        inverted_obs_kind_nrs = {}
+        if obs_kinds:
+            inverted_obs_kind_nrs.update({nr: kind for kind, nr in obs_kinds.items()})
+        for a in [self,] + list(list_of_obsseq):
+            inverted_obs_kind_nrs.update({int(nr): kind for nr, kind in a.obstypes})
+
         # combine data of all inputs + self
         list_of_obsseq_df = [self.df,]
         list_of_obsseq_df.extend([a.df for a in list_of_obsseq])
@@ -661,12 +667,14 @@ class ObsSeq(object):
         oso3.obstypes = obstypes
         return oso3
 
-    def remove_obs_of_type(self, kind_str=False, kind=False):
+    def remove_obs_of_type(self, kind_str=False, kind=False, obs_kinds=None):
         """Remove all observations of a certain type
 
         Args:
             kind_str (str):     observation type as string
             kind (int):         observation type as integer
+            obs_kinds (dict, optional): observation type => ID number, e.g. utils.obskind_read(cfg.dir_dart_src)
+                only needed if `kind_str` is not declared in the header of this obs_seq
 
         Returns:
             self
@@ -674,10 +682,15 @@ class ObsSeq(object):
 
         if kind_str != False:
             # dictionary string => DART internal indices
-            from dartwrf.obs.obskind import obs_kind_nrs
-            kind_remove = obs_kind_nrs[kind_str]
+            obs_kind_nrs = {kindstr: int(nr) for nr, kindstr in self.obstypes}
+            if kind_str in obs_kind_nrs:
+                kind_remove = obs_kind_nrs[kind_str]
+            elif obs_kinds:
+                kind_remove = obs_kinds[kind_str]
+            else:
+                return self  # no observations of this type
         if kind != False:
-            kind_remove = kind
+            kind_remove = int(kind)
 
         # remove data from table
         self.df = self.df[self.df.kind != kind_remove]
@@ -686,7 +699,7 @@ class ObsSeq(object):
         obstypes = self.obstypes
         obstypes_new = []
         for kind, kindstr in obstypes:
-            if kind != kind_remove:
+            if int(kind) != kind_remove:
                 obstypes_new.append((kind, kindstr))
         self.obstypes = obstypes_new
         return self
@@ -0,0 +1,117 @@
+"""Sun and satellite angles for many observation locations at once
+
+`write_sat_angle_appendix` uses one sun position (pysolar, at `lat0, lon0`) and fixed satellite angles
+for all observations. With `per_obs_geometry=True` in an observation config,
+`create_obsseq_in` writes the angles of each location instead, computed here with NumPy:
+
+- sun position: NOAA solar position algorithm (without atmospheric refraction),
+  within a few tenths of a degree of pysolar
+- satellite position: geostationary satellite at longitude `sat_lon` (`obscfg['sat_lon']`, default 0),
+  on a spherical earth
+
+Angles are in degrees, azimuths clockwise from north (0..360), as RTTOV expects.
+Results are cached per (time, locations, satellite longitude).
+"""
+import hashlib
+import datetime as dt
+from collections import OrderedDict
+
+import numpy as np
+
+radius_earth_m = 6.371e6
+height_geostationary_m = 35786e3
+
+_cache = OrderedDict()
+_cache_size = 32
+
+
+def solar_position(time_dt, lats, lons):
+    """Sun azimuth and zenith angle (NOAA solar position algorithm)
+
+    Args:
+        time_dt (dt.datetime): time in UTC
+        lats, lons (np.ndarray): degrees north/east
+
+    Returns:
+        (np.ndarray, np.ndarray): azimuth (clockwise from north) and zenith angle in degrees
+    """
+    lats, lons = np.asarray(lats, dtype=float), np.asarray(lons, dtype=float)
+    if time_dt.tzinfo is not None:
+        time_dt = time_dt.astimezone(dt.timezone.utc).replace(tzinfo=None)
+
+    # fractional year in radians
+    day_of_year = time_dt.timetuple().tm_yday
+    hours = time_dt.hour + time_dt.minute/60 + time_dt.second/3600
+    days_in_year = 366 if (time_dt.year % 4 == 0 and (time_dt.year % 100 != 0 or time_dt.year % 400 == 0)) else 365
+    gamma = 2*np.pi/days_in_year*(day_of_year - 1 + (hours - 12)/24)
+
+    # equation of time (minutes) and declination (radians)
+    eqtime = 229.18*(0.000075 + 0.001868*np.cos(gamma) - 0.032077*np.sin(gamma)
+                     - 0.014615*np.cos(2*gamma) - 0.040849*np.sin(2*gamma))
+    decl = (0.006918 - 0.399912*np.cos(gamma) + 0.070257*np.sin(gamma)
+            - 0.006758*np.cos(2*gamma) + 0.000907*np.sin(2*gamma)
+            - 0.002697*np.cos(3*gamma) + 0.00148*np.sin(3*gamma))
+
+    # true solar time (minutes) and hour angle (radians)
+    true_solar_time = hours*60 + eqtime + 4*lons
+    hour_angle = np.radians(true_solar_time/4 - 180)
+
+    lat_rad = np.radians(lats)
+    cos_zen = np.sin(lat_rad)*np.sin(decl) + np.cos(lat_rad)*np.cos(decl)*np.cos(hour_angle)
+    zenith = np.arccos(np.clip(cos_zen, -1, 1))
+
+    # azimuth clockwise from north
+    azimuth = np.arctan2(np.sin(hour_angle),
+                         np.cos(hour_angle)*np.sin(lat_rad) - np.tan(decl)*np.cos(lat_rad))
+    azimuth = (np.degrees(azimuth) + 180) % 360
+    return azimuth, np.degrees(zenith)
+
+
+def geostationary_view(lats, lons, sat_lon=0.):
+    """Satellite azimuth and zenith angle seen from the observation locations
+
+    Args:
+        lats, lons (np.ndarray): degrees north/east
+        sat_lon (float): longitude of the geostationary satellite, degrees east
+
+    Returns:
+        (np.ndarray, np.ndarray): azimuth (clockwise from north) and zenith angle in degrees
+    """
+    lat, lon = np.radians(np.asarray(lats, dtype=float)), np.radians(np.asarray(lons, dtype=float))
+    sat_lon = np.radians(sat_lon)
+
+    # vector from the location to the satellite, earth-centered coordinates
+    r_sat = radius_earth_m + height_geostationary_m
+    vx = r_sat*np.cos(sat_lon) - radius_earth_m*np.cos(lat)*np.cos(lon)
+    vy = r_sat*np.sin(sat_lon) - radius_earth_m*np.cos(lat)*np.sin(lon)
+    vz = -radius_earth_m*np.sin(lat)
+
+    # components in local east, north, up
+    east = -np.sin(lon)*vx + np.cos(lon)*vy
+    north = -np.sin(lat)*np.cos(lon)*vx - np.sin(lat)*np.sin(lon)*vy + np.cos(lat)*vz
+    up = np.cos(lat)*np.cos(lon)*vx + np.cos(lat)*np.sin(lon)*vy + np.sin(lat)*vz
+
+    zenith = np.degrees(np.arccos(np.clip(up/np.sqrt(vx**2 + vy**2 + vz**2), -1, 1)))
+    azimuth = np.degrees(np.arctan2(east, north)) % 360
+    return azimuth, zenith
+
+
+def viewing_geometry(time_dt, lats, lons, sat_lon=0.):
+    """Satellite and sun angles for all locations, cached
+
+    Returns:
+        dict: with keys sat_az, sat_zen, sun_az, sun_zen (np.ndarray, degrees)
+    """
+    lats, lons = np.asarray(lats, dtype=float), np.asarray(lons, dtype=float)
+    key = (time_dt.isoformat(), float(sat_lon),
+           hashlib.sha1(lats.tobytes() + lons.tobytes()).hexdigest())
+    if key in _cache:
+        _cache.move_to_end(key)
+        return _cache[key]
+
+    sat_az, sat_zen = geostationary_view(lats, lons, sat_lon)
+    sun_az, sun_zen = solar_position(time_dt, lats, lons)
+    _cache[key] = dict(sat_az=sat_az, sat_zen=sat_zen, sun_az=sun_az, sun_zen=sun_zen)
+    if len(_cache) > _cache_size:
+        _cache.popitem(last=False)
+    return _cache[key]
@@ -1,6 +1,7 @@
-import os, sys, glob
+import sys, glob
 import datetime as dt
-from dartwrf.utils import copy, Config, symlink
+from concurrent.futures import ThreadPoolExecutor
+from dartwrf.utils import copy, Config, symlink, shell
 
 """
 Sets initial condition data (wrfinput/wrfrst file) in the run_WRF directory for each ensemble member 
@@ -18,8 +19,11 @@ Ad 2: copies wrfrst to run_WRF directory
 def create_wrfrst_in_WRF_rundir(cfg, time: dt.datetime, prior_init_time: dt.datetime, prior_path_exp: str) -> None:
     """Copy WRF restart files to run_WRF directory 
     These files will be used as initial conditions for the next WRF run
+
+    All members are copied concurrently. Copies are skipped if the run directory 
+    already contains an unmodified copy of the prior (see `dartwrf.utils.copy`).
     """
-    for iens in range(1, cfg.ensemble_size+1):
+    def _copy_member(iens):
         dir_wrf_run = cfg.dir_wrf_run.replace('<exp>', cfg.name).replace('<ens>', str(iens))
     
         prior_wrfrst = prior_path_exp + prior_init_time.strftime('/%Y-%m-%d_%H:%M/') \
@@ -28,7 +32,12 @@ def create_wrfrst_in_WRF_rundir(cfg, time: dt.datetime, prior_init_time: dt.date
         # we need a temporary copy of the wrfrst file, because there could be multiple experiments
         # accessing the same file at the same time
         print('copying prior (wrfrst)', prior_wrfrst, 'to', wrfrst)
-        copy(prior_wrfrst, wrfrst)
+        copy(prior_wrfrst, wrfrst, skip_if_identical=True)
+
+    n_threads = min(cfg.ensemble_size, getattr(cfg, 'max_copy_threads', 8))
+    with ThreadPoolExecutor(max_workers=n_threads) as executor:
+        # list() to raise exceptions of any member
+        list(executor.map(_copy_member, range(1, cfg.ensemble_size+1)))
 
         
 
@@ -58,7 +67,7 @@ def create_updated_wrfinput_from_wrfout(cfg, time: dt.datetime, prior_init_time:
 
         template_time = prior_path_exp + new_start_time.strftime('/%Y-%m-%d_%H:%M/') \
                        +str(iens)+new_start_time.strftime('/wrfout_d01_%Y-%m-%d_%H:%M:%S')
-        os.system('ncks -A -v XTIME,Times '+template_time+' '+new_start_wrfinput)
+        shell('ncks -A -v XTIME,Times '+template_time+' '+new_start_wrfinput)
         print('overwritten times from', template_time)
 
 def main(cfg):
@@ -0,0 +1,300 @@
+"""Predict walltime and memory of SLURM jobs from previous runs
+
+Each job of a known type (e.g. 'run_WRF', 'assimilate') records its runtime and peak memory
+in an SQLite database, together with the features that determine its cost
+(ensemble size, number of processes, grid, observations, ...).
+Later jobs with the same features request a high quantile of the recorded values plus a margin,
+instead of fixed values which are usually too high (longer queue wait) or sometimes too low (failed jobs).
+Without enough history, the fixed default values are used.
+
+Failed jobs are recorded with their exit state. If a job ran out of time ('TIMEOUT') 
+or memory ('OUT_OF_MEMORY'), the following jobs request more than the limit it had 
+(`limit_factor` times the limit), also if the quantile of successful jobs is lower.
+
+The database is `cfg.resource_db`, default: `~/.cache/dartwrf/resources.sqlite`,
+so that all experiments of a user share their history.
+
+Jobs are wrapped like this (see `wrap_command`):
+    python -m dartwrf.resources <db> <job type> '<features as JSON>' <scale> <time limit s> <mem limit MB> <<'EOF'
+    <job commands>
+    EOF
+"""
+import os
+import sys
+import json
+import math
+import time
+import signal
+import sqlite3
+import resource
+import subprocess
+import datetime as dt
+
+import numpy as np
+
+default_db = os.path.join(os.environ.get('XDG_CACHE_HOME', os.path.expanduser('~/.cache')),
+                          'dartwrf', 'resources.sqlite')
+
+# exit states of jobs which failed because they requested too little
+limit_states = ('TIMEOUT', 'OUT_OF_MEMORY')
+
+
+def _execute(f_db, sql, params=()):
+    os.makedirs(os.path.dirname(os.path.abspath(f_db)), exist_ok=True)
+    con = sqlite3.connect(f_db, timeout=120)
+    try:
+        with con:
+            con.execute("""CREATE TABLE IF NOT EXISTS runs (
+                               job_type TEXT, features TEXT, wall_s_per_unit REAL, maxrss_MB REAL,
+                               finished TEXT, exit_state TEXT DEFAULT 'COMPLETED')""")
+            columns = [row[1] for row in con.execute('PRAGMA table_info(runs)')]
+            if 'exit_state' not in columns:  # database from before failures were recorded
+                con.execute("ALTER TABLE runs ADD COLUMN exit_state TEXT DEFAULT 'COMPLETED'")
+            return con.execute(sql, params).fetchall()
+    finally:
+        con.close()
+
+
+def _key(features):
+    return json.dumps(features, sort_keys=True)
+
+
+def record(f_db, job_type, features, wall_s, maxrss_MB, scale=1., exit_state='COMPLETED'):
+    """Add a finished job to the history
+
+    Args:
+        job_type (str): e.g. 'run_WRF'
+        features (dict): what the cost depends on, e.g. dict(ensemble_size=40, nproc=20)
+        wall_s (float): runtime in seconds, for 'TIMEOUT' the time limit
+        maxrss_MB (float): peak memory in MB, for 'OUT_OF_MEMORY' the memory limit
+        scale (float): amount of work the runtime is proportional to, e.g. simulated hours for WRF
+        exit_state (str): 'COMPLETED', 'TIMEOUT', 'OUT_OF_MEMORY' or 'FAILED'
+    """
+    _execute(f_db, 'INSERT INTO runs VALUES (?, ?, ?, ?, ?, ?)',
+             (job_type, _key(features), wall_s/scale, maxrss_MB,
+              dt.datetime.now().isoformat(timespec='seconds'), exit_state))
+
+
+def predict(f_db, job_type, features, scale=1., quantile=0.95, min_samples=3, n_last=50,
+            limit_factor=1.5):
+    """Predict runtime and peak memory from the last `n_last` jobs with equal type and features
+
+    The prediction is at least `limit_factor` times the limit of a job among them 
+    which ran out of time or memory.
+
+    Returns:
+        (float, float): runtime in seconds and peak memory in MB, each None if unknown,
+        or None if there are less than `min_samples` successful jobs and no job failed due to a limit
+    """
+    if not os.path.exists(f_db):
+        return None
+    rows = _execute(f_db, 'SELECT wall_s_per_unit, maxrss_MB, exit_state FROM runs '
+                    'WHERE job_type=? AND features=? ORDER BY finished DESC LIMIT ?',
+                    (job_type, _key(features), n_last))
+    completed = np.array([r[:2] for r in rows if r[2] == 'COMPLETED'], dtype=float).reshape(-1, 2)
+    timeouts = [r[0] for r in rows if r[2] == 'TIMEOUT']
+    ooms = [r[1] for r in rows if r[2] == 'OUT_OF_MEMORY']
+
+    if len(completed) >= min_samples:
+        wall_s = float(np.quantile(completed[:, 0], quantile))*scale
+        maxrss_MB = float(np.quantile(completed[:, 1], quantile))
+    elif timeouts or ooms:
+        wall_s, maxrss_MB = None, None
+    else:
+        return None
+
+    if timeouts:
+        wall_s = max(wall_s or 0, max(timeouts)*scale*limit_factor)
+    if ooms:
+        maxrss_MB = max(maxrss_MB or 0, max(ooms)*limit_factor)
+    return wall_s, maxrss_MB
+
+
+def slurm_resources(f_db, job_type, features, default_time_min, default_mem, scale=1.,
+                    margin=1.3, min_time_min=5):
+    """SLURM `time` and `mem` for a job, predicted from the history or the given defaults
+
+    Args:
+        default_time_min (int or None): walltime in minutes if there is no history
+        default_mem (str or None): memory if there is no history, e.g. '110G'
+        margin (float): factor on the predicted values
+
+    Returns:
+        dict: with keys 'time' (minutes) and 'mem', to update the SLURM kwargs with
+            (without the keys whose default is None, if there is no history)
+    """
+    try:
+        prediction = predict(f_db, job_type, features, scale=scale)
+    except sqlite3.Error as e:
+        print('could not read resource history', f_db, ':', e)
+        prediction = None
+
+    wall_s, maxrss_MB = prediction or (None, None)
+    sized = {}
+    if wall_s is not None:
+        sized['time'] = str(max(min_time_min, math.ceil(wall_s*margin/60)))
+    elif default_time_min is not None:
+        sized['time'] = str(int(default_time_min))
+    if maxrss_MB is not None:
+        sized['mem'] = str(max(1, math.ceil(maxrss_MB*margin/1e3)))+'G'
+    elif default_mem is not None:
+        sized['mem'] = default_mem
+    if prediction is not None:
+        print('predicted resources for', job_type, ':', sized.get('time'), 'min,', sized.get('mem'))
+    return sized
+
+
+def obs_signature(cfg):
+    """Short description of the observations which determine the cost of assimilation,
+    e.g. 'MSG_4_SEVIRI_TB:12km:1' (type, spacing or number of obs, number of levels)
+    """
+    parts = []
+    for obscfg in getattr(cfg, 'assimilate_these_observations', []):
+        if 'n_obs' in obscfg:
+            density = 'n'+str(obscfg['n_obs'])
+        else:
+            density = str(obscfg.get('km_between_obs', ''))+'km'
+        n_levels = len(obscfg['heights']) if 'heights' in obscfg else 1
+        parts.append(':'.join([obscfg['kind'], density, str(n_levels)]))
+    return ','.join(parts)
+
+
+def wrf_grid(cfg):
+    """Grid size of domain 1 as 'e_we x e_sn x e_vert' from the WRF namelist template, or None"""
+    try:
+        from dartwrf.namelist_handler import WRF_namelist
+        nml = WRF_namelist()
+        nml.read(cfg.WRF_namelist_template)
+        dims = []
+        for key in ('e_we', 'e_sn', 'e_vert'):
+            value = nml.namelist['domains'][key]
+            dims.append(str(value[0] if isinstance(value, (tuple, list)) else value))
+        return 'x'.join(dims)
+    except Exception:
+        return None
+
+
+def _peak_memory_MB():
+    """Peak memory of this job on this node
+
+    Read from the cgroup of the job (as SLURM sets up with cgroups),
+    otherwise estimated as the largest child process times the number of SLURM tasks.
+    """
+    try:
+        with open('/proc/self/cgroup') as f:
+            for line in f:
+                hierarchy, controllers, path = line.strip().split(':', 2)
+                if hierarchy == '0':  # cgroup v2
+                    f_peak = '/sys/fs/cgroup' + path + '/memory.peak'
+                elif 'memory' in controllers.split(','):  # cgroup v1
+                    f_peak = '/sys/fs/cgroup/memory' + path + '/memory.max_usage_in_bytes'
+                else:
+                    continue
+                if os.path.exists(f_peak):
+                    with open(f_peak) as fp:
+                        return int(fp.read())/1e6
+    except (OSError, ValueError):
+        pass
+    maxrss_MB = resource.getrusage(resource.RUSAGE_CHILDREN).ru_maxrss/1e3  # kB on Linux
+    return maxrss_MB*int(os.environ.get('SLURM_NTASKS', 1))
+
+
+def _oom_killed():
+    """Check if the kernel killed a process of this job (cgroup) for using too much memory"""
+    try:
+        with open('/proc/self/cgroup') as f:
+            for line in f:
+                hierarchy, controllers, path = line.strip().split(':', 2)
+                if hierarchy == '0':  # cgroup v2
+                    f_events = '/sys/fs/cgroup' + path + '/memory.events'
+                elif 'memory' in controllers.split(','):  # cgroup v1
+                    f_events = '/sys/fs/cgroup/memory' + path + '/memory.oom_control'
+                else:
+                    continue
+                if os.path.exists(f_events):
+                    with open(f_events) as fe:
+                        for event in fe:
+                            name, _, value = event.partition(' ')
+                            if name == 'oom_kill' and int(value) > 0:
+                                return True
+    except (OSError, ValueError):
+        pass
+    return False
+
+
+def exit_state(returncode, wall_s, maxrss_MB, time_limit_s=None, mem_limit_MB=None, oom_killed=False):
+    """Why a job ended: 'COMPLETED', 'TIMEOUT', 'OUT_OF_MEMORY' or 'FAILED'
+
+    Args:
+        returncode (int): of the job commands; SLURM and the OOM killer end jobs with a signal
+        time_limit_s, mem_limit_MB (float or None): resources the job requested
+        oom_killed (bool): the kernel reported an OOM kill (see `_oom_killed`)
+    """
+    if returncode == 0:
+        return 'COMPLETED'
+    if time_limit_s and wall_s >= 0.95*time_limit_s:
+        return 'TIMEOUT'
+    killed = returncode in (-signal.SIGKILL, 128+signal.SIGKILL)
+    if killed and (oom_killed or (mem_limit_MB and maxrss_MB >= 0.9*mem_limit_MB)):
+        return 'OUT_OF_MEMORY'
+    return 'FAILED'
+
+
+def wrap_command(python, f_db, job_type, features, cmd, scale=1., time_min=None, mem=None):
+    """Bash command which runs `cmd` and records its runtime, peak memory and exit state
+
+    Args:
+        python (str): python command (with PYTHONPATH)
+        time_min (str or int, optional): SLURM time limit of the job in minutes
+        mem (str, optional): SLURM memory of the job, e.g. '20G'
+
+    Returns:
+        str
+    """
+    from dartwrf.local_executor import _parse_mem_GB
+    try:
+        time_limit_s = str(int(time_min)*60)
+    except (TypeError, ValueError):  # not given, or not in minutes (e.g. '1:00:00')
+        time_limit_s = '-'
+    mem_limit_MB = str(int(_parse_mem_GB(mem)*1e3)) if mem else '-'
+    return (' '.join([python, '-m dartwrf.resources', f_db, job_type, "'"+_key(features)+"'", str(scale),
+                      time_limit_s, mem_limit_MB])
+            + " <<'DARTWRF_JOB_EOF'\n" + cmd + "\nDARTWRF_JOB_EOF")
+
+
+def _record_exit(f_db, job_type, features, scale, returncode, wall_s, time_limit_s, mem_limit_MB):
+    maxrss_MB = _peak_memory_MB()
+    state = exit_state(returncode, wall_s, maxrss_MB, time_limit_s, mem_limit_MB,
+                       oom_killed=returncode != 0 and _oom_killed())
+    if state == 'TIMEOUT':
+        wall_s = time_limit_s
+    elif state == 'OUT_OF_MEMORY':
+        maxrss_MB = mem_limit_MB or maxrss_MB
+    try:
+        record(f_db, job_type, features, wall_s, maxrss_MB, scale=scale, exit_state=state)
+    except sqlite3.Error as e:
+        print('could not record resources in', f_db, ':', e)
+
+
+if __name__ == '__main__':
+    """Run the bash commands from stdin, record runtime, peak memory and exit state, exit with their exit code"""
+    f_db, job_type, features, scale = sys.argv[1], sys.argv[2], json.loads(sys.argv[3]), float(sys.argv[4])
+    limits = [float(a) if a != '-' else None for a in sys.argv[5:7]]
+    time_limit_s, mem_limit_MB = limits + [None]*(2 - len(limits))
+    cmd = sys.stdin.read()
+
+    t_start = time.time()
+    child = subprocess.Popen(cmd, shell=True, executable='/bin/bash', stdin=subprocess.DEVNULL)
+
+    def _on_sigterm(signum, frame):
+        # SLURM sends SIGTERM when the time limit is reached
+        child.terminate()
+        _record_exit(f_db, job_type, features, scale, -signal.SIGTERM, time.time() - t_start,
+                     time_limit_s, mem_limit_MB)
+        sys.exit(128 + signal.SIGTERM)
+    signal.signal(signal.SIGTERM, _on_sigterm)
+
+    returncode = child.wait()
+    _record_exit(f_db, job_type, features, scale, returncode, time.time() - t_start,
+                 time_limit_s, mem_limit_MB)
+    sys.exit(returncode)
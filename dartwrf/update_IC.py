@@ -1,30 +1,96 @@
 
 import os, sys
+import numpy as np
 import netCDF4 as nc
 from dartwrf.utils import Config
+from dartwrf import increments
+
+def _blocks_equal(a, b, tolerance=0.):
+    """Check whether two blocks of data are equal (up to `tolerance`)
+    """
+    if a.shape != b.shape:
+        return False
+    if np.issubdtype(a.dtype, np.floating):
+        if tolerance > 0:
+            return bool(np.nanmax(np.abs(a - b)) <= tolerance)
+        return np.array_equal(a, b, equal_nan=True)
+    return np.array_equal(a, b)
+
+
+def write_changed_blocks(var_new, data, tolerance=0.):
+    """Write `data` into a netCDF variable, but skip blocks which are unchanged
+
+    Blocks are slices along the first dimension after time (model levels for 3D fields).
+    Variables with less than 3 dimensions are compared as one block.
+
+    Args:
+        var_new (netCDF4.Variable): destination variable (opened in 'r+' mode)
+        data (np.ndarray): new values
+        tolerance (float): maximum absolute difference to consider a block unchanged
+
+    Returns:
+        (int, int): number of bytes written, number of bytes skipped
+    """
+    data = np.ma.getdata(data)
+    if data.ndim < 3:
+        old = np.ma.getdata(var_new[:])
+        if _blocks_equal(old, data, tolerance):
+            return 0, data.nbytes
+        var_new[:] = data
+        return data.nbytes, 0
+
+    n_written, n_skipped = 0, 0
+    for k in range(data.shape[1]):
+        block = data[:, k]
+        old = np.ma.getdata(var_new[:, k])
+        if _blocks_equal(old, block, tolerance):
+            n_skipped += block.nbytes
+        else:
+            var_new[:, k] = block
+            n_written += block.nbytes
+    return n_written, n_skipped
+
 
 def update_initials_in_WRF_rundir(cfg: Config) -> None:
-    """Updates wrfrst-files in `/run_WRF/` directory 
+    """Updates wrfrst-files in `/run_WRF/` directory
     with posterior state from ./filter output, e.g. filter_restart_d01.0001
+
+    Note:
+        If `cfg.update_IC_skip_unchanged` is True, blocks of data which did not change
+        (e.g. variables with NO_COPY_BACK or zero increment) are not rewritten.
+        `cfg.update_IC_tolerance` (float, default 0) sets the max. absolute difference
+        of a block to be considered unchanged.
+
+        If `cfg.archive_increments` is True, the archived increments are added to the wrfrst files
+        instead, multiplied by `cfg.increment_scale` (default 1).
     """
     time = cfg.time  # dt.datetime
-    
+    skip_unchanged = getattr(cfg, 'update_IC_skip_unchanged', False)
+    use_increments = getattr(cfg, 'archive_increments', False)
+    tolerance = getattr(cfg, 'update_IC_tolerance', 0.)
+
     use_wrfrst = True  # if wrfrst is used to restart (recommended)
     if use_wrfrst:
         initials_fmt = '/wrfrst_d01_%Y-%m-%d_%H:%M:%S'
     else:
-        initials_fmt = '/wrfinput_d01' 
+        initials_fmt = '/wrfinput_d01'
 
     # which WRF variables will be updated?
     update_vars = ['Times',]
     update_vars.extend(cfg.update_vars)
 
+    bytes_written, bytes_skipped = 0, 0
     for iens in range(1, cfg.ensemble_size+1):
         ic_file = cfg.dir_wrf_run.replace('<exp>', cfg.name
                                           ).replace('<ens>', str(iens)
                                                     )+time.strftime(initials_fmt)
         if not os.path.isfile(ic_file):
             raise IOError(ic_file+' does not exist, updating impossible!')
+        elif use_increments:
+            # add posterior minus prior to the prior wrfrst
+            f_inc = increments.increment_file(cfg, time, iens)
+            if increments.add_increment(f_inc, ic_file, scale=getattr(cfg, 'increment_scale', 1.)):
+                print(ic_file, 'created, updated from', f_inc)
         else:
             # overwrite DA updated variables
             filter_out = cfg.dir_archive.replace('<exp>', cfg.name) \
@@ -37,18 +103,32 @@ def update_initials_in_WRF_rundir(cfg: Config) -> None:
                     for var in update_vars:
                         if var in ds_new.variables:
                             # regular case
-                            ds_new.variables[var][:] = ds_filter.variables[var][:]
-                            print('updated', var)
+                            targets = [var,]
                         else:
                             # special case, where a variable has 2 time levels, e.g. THM_1, THM_2
-                            for var_suffix in ['_1', '_2']:
-                                ds_new.variables[var+var_suffix][:] = ds_filter.variables[var][:]
-                                print('updated', var+var_suffix)
+                            targets = [var+var_suffix for var_suffix in ['_1', '_2']]
+
+                        data = ds_filter.variables[var][:]
+                        for target in targets:
+                            if skip_unchanged:
+                                n_w, n_s = write_changed_blocks(ds_new.variables[target], data, tolerance)
+                                bytes_written += n_w
+                                bytes_skipped += n_s
+                                if n_w == 0:
+                                    print('unchanged', target)
+                                    continue
+                            else:
+                                ds_new.variables[target][:] = data
+                            print('updated', target)
 
                 print(ic_file, 'created, updated from', filter_out)
 
+    if skip_unchanged:
+        print('update_IC: wrote', round(bytes_written/1e6, 1), 'MB, skipped writing',
+              round(bytes_skipped/1e6, 1), 'MB of unchanged data')
+
 
 if __name__ == '__main__':
     cfg = Config.from_file(sys.argv[1])
-    
+
     update_initials_in_WRF_rundir(cfg)
@@ -5,6 +5,7 @@ because loading this would lead to a circular import.
 """
 
 import os
+import errno
 import sys
 import shutil
 import warnings
@@ -16,11 +17,9 @@ import re
 import tempfile
 import pickle
 import importlib.util
-import random
-import string
-import pickle
-import yaml
 import time
+import json
+import hashlib
 
 userhome = os.path.expanduser('~')
 
@@ -31,6 +30,22 @@ def import_from_path(module_name, file_path):
     spec.loader.exec_module(module) # type: ignore
     return module
 
+def _canonical(value):
+    """`value` with dicts and sets sorted, so that pickling it gives the same bytes for equal values
+
+    The pickle of a set depends on the order of its elements (which depends on string hashing, 
+    different in every interpreter), the pickle of a dict depends on the insertion order.
+    """
+    if isinstance(value, dict):
+        return ('dict', tuple(sorted(((_canonical(k), _canonical(v)) for k, v in value.items()),
+                                     key=lambda item: repr(item[0]))))
+    if isinstance(value, (set, frozenset)):
+        return ('set', tuple(sorted((_canonical(v) for v in value), key=repr)))
+    if isinstance(value, (list, tuple)):
+        return (type(value).__name__, tuple(_canonical(v) for v in value))
+    return value
+
+
 class Config(object):
     """Collection of variables which define the experiment
 
@@ -68,6 +83,8 @@ class Config(object):
         dir_archive (str): E.g. '/jetfs/home/lkugler/data/sim_archive/<exp>/'
         dir_wrf_run (str): E.g. '/jetfs/home/lkugler/data/run_WRF/<exp>/<ens>/'
         dir_dart_run (str): E.g. '/jetfs/home/lkugler/data/run_DART/<exp>/'
+        dir_dart_scratch (str, optional): Node-local directory where ./filter reads priors and writes 
+            filter_restart files, e.g. '$TMPDIR/<exp>/' (default: not used)
         
         geo_em_forecast (str): file path to geo_em containing coordinates of the forecast model
         geo_em_nature (str): file path to geo_em containing coordinates of the nature simulation
@@ -159,7 +176,7 @@ class Config(object):
         self.use_pickle = True
         self.f_cfg_current = self.generate_name()
         self.to_file(self.f_cfg_current)
-        
+
     def __contains__(self, key):
         return hasattr(self, key)
     
@@ -170,9 +187,32 @@ class Config(object):
         except AttributeError:
             raise AttributeError(f'Attribute `{name}` not found in Config object. Did you set it?')
 
+    def content_hash(self) -> str:
+        """Hash of all settings (except the name of the config file itself)
+        
+        Configs with equal settings have equal hashes, 
+        so they are stored only once in `f_cfg_base`.
+        Dicts and sets are sorted before hashing (see `_canonical`), 
+        their order does not change the hash.
+        """
+        d = {key: self.__dict__[key] for key in self.__dict__ if key != 'f_cfg_current'}
+        return hashlib.sha1(pickle.dumps(_canonical(d), protocol=4)).hexdigest()[:16]
+
     def generate_name(self):
-        random_str = ''.join(random.choices(string.ascii_uppercase + string.digits, k=4))
-        return self.f_cfg_base+'/cfg_'+random_str+'.yaml'
+        return self.f_cfg_base+'/cfg_'+self.content_hash()+'.pkl'
+
+    def add_to_index(self, jobname: str, job_id=None):
+        """Record which config snapshot a job used in `<f_cfg_base>/index.jsonl`
+        
+        Args:
+            jobname (str): name of the job
+            job_id (int or None): SLURM or local job ID
+        """
+        record = dict(time=dt.datetime.now().isoformat(timespec='seconds'), job=jobname,
+                      job_id=job_id, cfg=os.path.basename(self.f_cfg_current))
+        os.makedirs(self.f_cfg_base, exist_ok=True)
+        with open(self.f_cfg_base+'/index.jsonl', 'a') as f:
+            f.write(json.dumps(record)+'\n')
 
     def update(self, **kwargs):
         """Update the configuration with new values
@@ -191,29 +231,52 @@ class Config(object):
     
     @staticmethod
     def from_file(fname: str) -> 'Config':
-        """Read a configuration from a file"""
-        if True:
+        """Read a configuration from a file
+        
+        Does not write anything, `f_cfg_current` stays the file that was read.
+        The format is detected from the content, config files named `*.yaml`
+        are pickles too if they were written with `use_pickle`.
+        """
+        if _is_pickle(fname):
             d = read_pickle(fname)
         else:
             d = read_yaml(fname)
-        return Config(**d)
+        cfg = Config.__new__(Config)
+        cfg.__dict__.update(d)
+        return cfg
 
     def to_file(self, filename: str):
-        """Write itself to a python file"""
+        """Write itself to a python file
+        
+        Config files named by their content (see `generate_name`)
+        are not written again if they exist. Other files are overwritten.
+        """
+        if os.path.exists(filename) and filename == self.generate_name():
+            return
         os.makedirs(os.path.dirname(filename), exist_ok=True)
         d = self.__dict__
         
+        # write to a temporary file first, other jobs might read this config
+        f_tmp = filename + '.' + str(os.getpid()) + '.tmp'
         if self.use_pickle:
-            with open(filename, 'wb') as handle:
+            with open(f_tmp, 'wb') as handle:
                 pickle.dump(d, handle, protocol=pickle.HIGHEST_PROTOCOL)
         else:
-            with open(filename, 'w') as f:
+            import yaml
+            with open(f_tmp, 'w') as f:
                 yaml.dump(d, f)
+        os.replace(f_tmp, filename)
         
         if self.debug:
             print('Wrote config to', filename)
 
 
+def _is_pickle(filename: str) -> bool:
+    """Pickles of protocol 2 and higher start with the PROTO opcode"""
+    with open(filename, 'rb') as handle:
+        return handle.read(1) == pickle.PROTO
+
+
 def read_pickle(filename: str) -> dict:
     """Read a dictionary from a python file,
     return as Config object
@@ -222,6 +285,7 @@ def read_pickle(filename: str) -> dict:
         return pickle.load(handle)
     
 def read_yaml(filename: str) -> dict:
+        import yaml
         with open(filename, 'r') as f:
             return yaml.load(f, Loader=yaml.FullLoader)
 
@@ -229,30 +293,371 @@ def display_config(filename: str) -> None:
     d = read_pickle(filename)
     pprint(d)
 
-def shell(args, pythonpath=None):
+def run_process(cmd, cwd=None, timeout=None, log_file=None, metrics_file=None, name=None,
+                check=True, max_log_bytes=100 << 20, n_log_backups=3):
+    """Run a bash command, stream its output to a log file and record its resource usage
+
+    The command runs in its own process group, so that on timeout 
+    all processes (e.g. MPI ranks started by mpirun) are killed.
+
+    Args:
+        cmd (str): Bash command(s)
+        cwd (str, optional): working directory
+        timeout (float, optional): wall-clock limit in seconds
+        log_file (str, optional): stdout+stderr are written to this file, 
+            an existing log is rotated to `log_file.1`, `log_file.2`, ...
+            If None, output is printed.
+        metrics_file (str, optional): append one JSON line with 
+            name, command, return code, wall time and max. resident memory (of the largest process)
+        name (str, optional): name of the step in `metrics_file`, defaults to the command
+        check (bool): raise an error if the command fails or times out
+
+    Returns:
+        int: return code of the command (-9 or -15 if killed on timeout)
+    """
+    import signal
+    import threading
+    import logging
+    from logging.handlers import RotatingFileHandler
+
+    if log_file:
+        logger = logging.getLogger('dartwrf.run_process.'+os.path.abspath(log_file))
+        logger.propagate = False
+        logger.setLevel(logging.INFO)
+        handler = RotatingFileHandler(log_file, maxBytes=max_log_bytes, backupCount=n_log_backups)
+        handler.setFormatter(logging.Formatter('%(message)s'))
+        if os.path.getsize(log_file) > 0:
+            handler.doRollover()  # keep the log of the previous run
+        logger.addHandler(handler)
+        write_line = logger.info
+    else:
+        write_line = print
+
+    t_start = time.time()
+    proc = subprocess.Popen(cmd, shell=True, executable='/bin/bash', cwd=cwd,
+                            stdout=subprocess.PIPE, stderr=subprocess.STDOUT,
+                            text=True, errors='replace', start_new_session=True)
+
+    def _stream_output():
+        for line in proc.stdout:
+            write_line(line.rstrip('\n'))
+
+    reader = threading.Thread(target=_stream_output, daemon=True)
+    reader.start()
+
+    # wait for the process, wait4 gives us the resource usage
+    timed_out = False
+    killed_at = None
+    while True:
+        pid, status, rusage = os.wait4(proc.pid, os.WNOHANG)
+        if pid != 0:
+            break
+        elapsed = time.time() - t_start
+        if timeout and elapsed > timeout:
+            if not timed_out:
+                print('timeout after', int(elapsed), 's, terminating:', cmd)
+                timed_out = True
+                killed_at = time.time()
+                os.killpg(proc.pid, signal.SIGTERM)
+            elif time.time() - killed_at > 10:
+                os.killpg(proc.pid, signal.SIGKILL)
+        time.sleep(0.1)
+
+    returncode = os.waitstatus_to_exitcode(status)
+    proc.returncode = returncode  # we reaped the process ourselves
+    wall_s = time.time() - t_start
+    reader.join(timeout=10)
+    if log_file:
+        logger.removeHandler(handler)
+        handler.close()
+
+    if metrics_file:
+        os.makedirs(os.path.dirname(os.path.abspath(metrics_file)), exist_ok=True)
+        record = dict(name=name or cmd, cmd=cmd, cwd=cwd, returncode=returncode,
+                      timed_out=timed_out, start=dt.datetime.fromtimestamp(t_start).isoformat(),
+                      wall_s=round(wall_s, 3), maxrss_MB=round(rusage.ru_maxrss/1024, 1))
+        with open(metrics_file, 'a') as f:
+            f.write(json.dumps(record)+'\n')
+
+    if check:
+        if timed_out:
+            raise TimeoutError('Command timed out after '+str(timeout)+' s >>> '+cmd)
+        if returncode != 0:
+            msg = 'Error (return code '+str(returncode)+') running command >>> '+cmd
+            if log_file:
+                msg += ' ; see log file '+log_file
+            raise RuntimeError(msg)
+    return returncode
+
+
+def shell(args, pythonpath=None, **kwargs):
+    """Run a bash command, raise an error if it fails
+
+    Keyword arguments are passed to `run_process`, e.g. timeout, log_file, metrics_file.
+    """
     print(args)
-    os.system(args)
-    # if pythonpath:
-    #     env = os.environ.copy()
-    #     env['PYTHONPATH'] = pythonpath
-    #     subprocess.check_output(args.split(' '), env=env)
-    # else:
-    #     subprocess.check_output(args.split(' '))
+    return run_process(args, **kwargs)
 
 
 def print(*args):
     __builtin__.print(*args, flush=True)
 
 
-def copy(src, dst, remove_if_exists=True):
+# Linux ioctl request code to clone a file (copy-on-write), see ioctl_ficlone(2)
+FICLONE = 0x40049409
+
+# files larger than this are copied in parallel chunks (see `copy`)
+large_file_bytes = 1 << 30
+
+
+def _hash_sample(f, size, n_bytes=1 << 20):
+    """Hash the head, middle and tail of a file
+    """
+    h = hashlib.blake2b(digest_size=16)
+    with open(f, 'rb') as fh:
+        for offset in sorted({0, max(0, size//2 - n_bytes//2), max(0, size - n_bytes)}):
+            fh.seek(offset)
+            h.update(fh.read(n_bytes))
+    return h.hexdigest()
+
+
+def _contents_equal(src, dst, block_size=16 << 20):
+    """Compare two files byte by byte, stop at the first difference
+    """
+    with open(src, 'rb') as fsrc, open(dst, 'rb') as fdst:
+        while True:
+            block = fsrc.read(block_size)
+            if block != fdst.read(block_size):
+                return False
+            if not block:
+                return True
+
+
+def files_identical(src, dst):
+    """Check if `dst` is an unmodified copy of `src`
+
+    Compares size and modification time, then the whole content of both files.
+    Reading both files is still cheaper than writing `dst` again.
+    Relies on the copy preserving the mtime (see `copy`).
+
+    Returns:
+        bool
+    """
+    try:
+        st_src = os.stat(src)
+        st_dst = os.stat(dst)
+    except FileNotFoundError:
+        return False
+    if st_src.st_size != st_dst.st_size or int(st_src.st_mtime) != int(st_dst.st_mtime):
+        return False
+    return _contents_equal(src, dst)
+
+
+def _check_not_same_file(src, dst):
+    """Raise shutil.SameFileError if `dst` is `src` (or a link to it), opening it for writing would truncate `src`
+    """
+    if os.path.exists(dst) and os.path.samefile(src, dst):
+        raise shutil.SameFileError(src+' and '+dst+' are the same file')
+
+
+def _reflink(src, dst):
+    """Try to clone `src` to `dst` (copy-on-write), return True on success
+
+    Works on filesystems with reflink support (e.g. XFS, btrfs), no data is copied.
+    """
+    _check_not_same_file(src, dst)
+    try:
+        import fcntl
+        with open(src, 'rb') as fsrc, open(dst, 'wb') as fdst:
+            fcntl.ioctl(fdst.fileno(), FICLONE, fsrc.fileno())
+        return True
+    except (OSError, ImportError):
+        try_remove(dst)
+        return False
+
+
+def _parallel_chunked_copy(src, dst, n_threads=4, chunk_size=256 << 20):
+    """Copy a large file with multiple threads, each copying one chunk at a time
+
+    Uses `os.copy_file_range` if possible, otherwise (e.g. between filesystems, EXDEV)
+    reads and writes the chunks.
+    """
+    from concurrent.futures import ThreadPoolExecutor
+    _check_not_same_file(src, dst)
+    size = os.path.getsize(src)
+    fd_src = os.open(src, os.O_RDONLY)
+    fd_dst = os.open(dst, os.O_WRONLY | os.O_CREAT | os.O_TRUNC, 0o644)
+    try:
+        os.ftruncate(fd_dst, size)
+
+        use_copy_file_range = [hasattr(os, 'copy_file_range')]
+
+        def copy_chunk(offset):
+            n = min(chunk_size, size - offset)
+            while n > 0:
+                n_copied = None
+                if use_copy_file_range[0]:
+                    try:
+                        n_copied = os.copy_file_range(fd_src, fd_dst, n, offset, offset)
+                    except OSError as e:
+                        if e.errno not in (errno.EXDEV, errno.ENOSYS, errno.EOPNOTSUPP, errno.EINVAL):
+                            raise
+                        use_copy_file_range[0] = False
+                if n_copied is None:
+                    n_copied = os.pwrite(fd_dst, os.pread(fd_src, n, offset), offset)
+                if n_copied == 0:
+                    raise IOError('could not copy '+src+' to '+dst)
+                offset += n_copied
+                n -= n_copied
+
+        with ThreadPoolExecutor(max_workers=n_threads) as executor:
+            list(executor.map(copy_chunk, range(0, size, chunk_size)))
+    finally:
+        os.close(fd_src)
+        os.close(fd_dst)
+
+
+def copy(src, dst, remove_if_exists=True, skip_if_identical=False):
+    """Copy a file, using the fastest available method
+
+    Strategies (in this order):
+    1) skip, if `skip_if_identical` and `dst` is an unmodified copy of `src` (see `files_identical`)
+    2) clone the file (reflink/copy-on-write), if the filesystem supports it
+    3) parallel chunked copy for large files
+    4) regular copy
+
+    File permissions are copied, like `shutil.copy`.
+    With `skip_if_identical`, the modification time is preserved as well (like `shutil.copy2`),
+    so that the next call can recognize the copy.
+
+    Args:
+        src (str): source file
+        dst (str): destination file or directory
+        remove_if_exists (bool): remove `dst` before copying
+        skip_if_identical (bool): do not copy if `dst` is an identical copy of `src`
+    """
     if src == dst:
         return  # the link already exists, nothing to do
+    if os.path.isdir(dst):
+        dst = os.path.join(dst, os.path.basename(src))
+
+    if skip_if_identical and files_identical(src, dst):
+        print(dst, 'is identical to', src, ', not copying')
+        return
+
+    if not (remove_if_exists and os.path.islink(dst)):  # a link to src is removed below
+        _check_not_same_file(src, dst)
     if remove_if_exists:
         try:
             os.remove(dst)
         except:
             pass
-    shutil.copy(src, dst)
+
+    if not _reflink(src, dst):
+        if os.path.getsize(src) > large_file_bytes:
+            _parallel_chunked_copy(src, dst)
+        else:
+            shutil.copyfile(src, dst)
+    if skip_if_identical:
+        shutil.copystat(src, dst)
+    else:
+        shutil.copymode(src, dst)
+
+
+def _sha1(path):
+    h = hashlib.sha1()
+    with open(path, 'rb') as f:
+        for block in iter(lambda: f.read(1 << 20), b''):
+            h.update(block)
+    return h.hexdigest()
+
+
+def sync_tree(src, dst, ignore=None, f_manifest=None):
+    """Copy files from directory `src` to `dst` which are new or changed
+
+    A file counts as unchanged if size and modification time are equal,
+    or if the content hash is equal (then only the modification time is updated).
+    Files copied by a previous sync which no longer exist in `src` are removed.
+
+    Args:
+        src (str): source directory
+        dst (str): destination directory
+        ignore (callable, optional): e.g. shutil.ignore_patterns('*.git', 'tests/')
+        f_manifest (str, optional): path of the manifest (JSON with size, mtime and sha1 of each file),
+            default: `<dst>/manifest.json`
+
+    Returns:
+        dict: lists of 'copied', 'unchanged' and 'removed' files (relative paths)
+    """
+    src = os.path.abspath(src)
+    f_manifest = f_manifest or os.path.join(dst, 'manifest.json')
+    try:
+        with open(f_manifest) as f:
+            manifest_old = json.load(f)['files']
+    except (OSError, ValueError, KeyError):
+        manifest_old = {}
+
+    result = dict(copied=[], unchanged=[], removed=[])
+    manifest = {}
+    for dirpath, dirnames, filenames in os.walk(src):
+        if ignore:
+            ignored = ignore(dirpath, dirnames + filenames)
+            dirnames[:] = [d for d in dirnames if d not in ignored]
+            filenames = [f for f in filenames if f not in ignored]
+
+        for fname in filenames:
+            f_src = os.path.join(dirpath, fname)
+            rel = os.path.relpath(f_src, src)
+            f_dst = os.path.join(dst, rel)
+            st_src = os.stat(f_src)
+            try:
+                st_dst = os.stat(f_dst)
+            except FileNotFoundError:
+                st_dst = None
+
+            sha1 = None
+            if st_dst and st_src.st_size == st_dst.st_size \
+                    and int(st_src.st_mtime) == int(st_dst.st_mtime):
+                changed = False
+                old = manifest_old.get(rel)
+                if old and old['size'] == st_src.st_size and int(old['mtime']) == int(st_src.st_mtime):
+                    sha1 = old['sha1']
+            elif st_dst and st_src.st_size == st_dst.st_size:
+                sha1 = _sha1(f_src)
+                changed = sha1 != _sha1(f_dst)
+                if not changed:
+                    shutil.copystat(f_src, f_dst)
+            else:
+                changed = True
+
+            if changed:
+                os.makedirs(os.path.dirname(f_dst), exist_ok=True)
+                shutil.copy2(f_src, f_dst)
+                result['copied'].append(rel)
+            else:
+                result['unchanged'].append(rel)
+            manifest[rel] = dict(size=st_src.st_size, mtime=st_src.st_mtime,
+                                 sha1=sha1 or _sha1(f_src))
+
+    for rel in manifest_old:
+        if rel not in manifest:
+            try_remove(os.path.join(dst, rel))
+            result['removed'].append(rel)
+
+    # which version was archived
+    try:
+        git_commit = subprocess.run(['git', '-C', src, 'rev-parse', 'HEAD'], capture_output=True, 
+                                    text=True, timeout=10).stdout.strip() or None
+    except (OSError, subprocess.SubprocessError):
+        git_commit = None
+
+    os.makedirs(os.path.dirname(os.path.abspath(f_manifest)), exist_ok=True)
+    with open(f_manifest + '.tmp', 'w') as f:
+        json.dump(dict(source=src, git_commit=git_commit, 
+                       time=dt.datetime.now().isoformat(timespec='seconds'),
+                       files=manifest), f, indent=1)
+    os.replace(f_manifest + '.tmp', f_manifest)
+    return result
 
 
 def try_remove(f):
@@ -262,7 +667,7 @@ def try_remove(f):
         pass
 
 def mkdir(path):
-    os.system('mkdir -p '+path)
+    os.makedirs(path, exist_ok=True)
 
 
 def script_to_str(path):
@@ -270,7 +675,19 @@ def script_to_str(path):
 
 
 def copy_contents(src, dst):
-    os.system('cp -rf '+src+'/* '+dst+'/')
+    """Copy all files and directories in `src` (except hidden ones) into `dst`, like `cp -rf src/* dst/`
+    """
+    os.makedirs(dst, exist_ok=True)
+    for name in os.listdir(src):
+        if name.startswith('.'):
+            continue
+        s, d = os.path.join(src, name), os.path.join(dst, name)
+        if os.path.isdir(s) and not os.path.islink(s):
+            shutil.copytree(s, d, symlinks=True, dirs_exist_ok=True, copy_function=shutil.copy)
+        else:
+            if os.path.lexists(d) and not os.path.isdir(d):
+                os.remove(d)
+            shutil.copy(s, d, follow_symlinks=False)
 
 
 def symlink(src, dst, check_if_source_exists=False):
@@ -380,30 +797,15 @@ def load_dict(fpath):
 def obskind_read(dart_srcdir: str) -> dict:
     """Read dictionary of observation types + ID numbers ("kind") 
     from DART f90 script and return it as python dictionary
+
+    The result is cached, see `dartwrf.obs.obskind`.
+
+    Returns:
+        dartwrf.obs.obskind.ObsKindRegistry: dict of type (str) => number (int),
+            `.name(number)` returns the type
     """
-    definitionfile = dart_srcdir + \
-        '/../../../assimilation_code/modules/observations/obs_kind_mod.f90'
-    with open(definitionfile, 'r') as f:
-        kind_def_f = f.readlines()
-
-    obskind_nrs = {}
-    for i, line in enumerate(kind_def_f):
-        if 'Integer definitions for DART OBS TYPES' in line:
-            # data starts below this line
-            i_start = i
-            break
-    for line in kind_def_f[i_start+1:]:
-        if 'MAX_DEFINED_TYPES_OF_OBS' in line:
-            # end of data
-            break
-        if '::' in line:
-            # a line looks like this
-            # integer, parameter, public ::       MSG_4_SEVIRI_TB =   261
-            data = line.split('::')[-1].split('=')
-            kind_str = data[0].strip()
-            kind_nr = int(data[1].strip())
-            obskind_nrs[kind_str] = kind_nr
-    return obskind_nrs
+    from dartwrf.obs import obskind
+    return obskind.read(dart_srcdir)
 
 def run_bash_command_in_directory(command, directory):
     """Runs a Bash command in the specified directory.
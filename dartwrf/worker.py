@@ -0,0 +1,175 @@
+"""Long-lived worker process which runs DART-WRF steps without Python startup cost
+
+Every step (e.g. `assimilate.py cfg.pkl`) usually starts a new Python interpreter,
+which imports numpy, pandas, xarray, netCDF4, ... again.
+The worker imports these modules once and then waits for step requests in a queue directory.
+Each request runs in a forked child process, so a failing step (or `os.chdir`, `sys.exit`)
+does not affect the worker.
+
+Start the worker (with the same PYTHONPATH as the jobs):
+    python -m dartwrf.worker /path/to/queue_dir
+
+or let WorkFlows start it by setting `use_worker=True` in the Config.
+The worker stops after `idle_timeout_s` seconds without requests.
+"""
+import os
+import sys
+import json
+import time
+import uuid
+import glob
+import traceback
+import importlib
+
+from dartwrf.utils import print
+
+# script name -> (module, function), the function is called with a Config object
+STEPS = {
+    'assimilate.py': ('dartwrf.assimilate', 'main'),
+    'prep_IC_prior.py': ('dartwrf.prep_IC_prior', 'main'),
+    'update_IC.py': ('dartwrf.update_IC', 'update_initials_in_WRF_rundir'),
+    'prepare_namelist.py': ('dartwrf.prepare_namelist', 'run'),
+    'create_obsseq_out.py': ('dartwrf.obs.create_obsseq_out', 'main'),
+}
+
+heartbeat_file = 'heartbeat'
+max_heartbeat_age_s = 30
+
+
+def worker_is_alive(dir_queue):
+    """Check if a worker is serving `dir_queue`"""
+    try:
+        return time.time() - os.path.getmtime(dir_queue+'/'+heartbeat_file) < max_heartbeat_age_s
+    except FileNotFoundError:
+        return False
+
+
+def _touch(path):
+    with open(path, 'a'):
+        os.utime(path)
+
+
+def step_from_cmd(cmd):
+    """Find the step and config file in a command like `python /path/assimilate.py /path/cfg.pkl`
+
+    Returns:
+        (str, str) or (None, None) if the command is not a known step
+    """
+    words = cmd.split()
+    if len(words) < 2:
+        return None, None
+    script = os.path.basename(words[-2])
+    if script in STEPS:
+        return script, words[-1]
+    return None, None
+
+
+def _run_request(f_request):
+    """Run one request in a forked child process, write the result file
+    """
+    with open(f_request) as f:
+        request = json.load(f)
+    f_base = f_request[:-len('.running')]
+    t_start = time.time()
+
+    pid = os.fork()
+    if pid == 0:  # child
+        returncode = 1
+        try:
+            log = open(f_base+'.log', 'w')
+            os.dup2(log.fileno(), 1)
+            os.dup2(log.fileno(), 2)
+            from dartwrf.utils import Config
+            module_name, func_name = STEPS[request['step']]
+            func = getattr(importlib.import_module(module_name), func_name)
+            func(Config.from_file(request['f_cfg']))
+            returncode = 0
+        except SystemExit as e:
+            returncode = e.code if isinstance(e.code, int) else (0 if e.code is None else 1)
+        except BaseException:
+            traceback.print_exc()
+        finally:
+            sys.stdout.flush()
+            sys.stderr.flush()
+            os._exit(returncode)
+
+    while True:
+        pid_done, status = os.waitpid(pid, os.WNOHANG)
+        if pid_done != 0:
+            break
+        _touch(os.path.dirname(f_request)+'/'+heartbeat_file)
+        time.sleep(0.05)
+    result = dict(returncode=os.waitstatus_to_exitcode(status), wall_s=round(time.time()-t_start, 3))
+    with open(f_base+'.tmp', 'w') as f:
+        json.dump(result, f)
+    os.replace(f_base+'.tmp', f_base+'.result')
+    os.remove(f_request)
+
+
+def serve(dir_queue, idle_timeout_s=3600, poll_interval_s=0.05):
+    """Import all step modules, then run requests from `dir_queue` until idle for `idle_timeout_s`
+    """
+    os.makedirs(dir_queue, exist_ok=True)
+    for module_name, _ in STEPS.values():
+        importlib.import_module(module_name)
+    print('worker ready, waiting for requests in', dir_queue)
+
+    t_last_request = time.time()
+    while time.time() - t_last_request < idle_timeout_s:
+        _touch(dir_queue+'/'+heartbeat_file)
+
+        for f_request in sorted(glob.glob(dir_queue+'/*.request')):
+            f_running = f_request[:-len('.request')]+'.running'
+            try:
+                os.rename(f_request, f_running)  # claim the request
+            except FileNotFoundError:
+                continue  # claimed by another worker
+            _run_request(f_running)
+            t_last_request = time.time()
+        time.sleep(poll_interval_s)
+    print('worker idle for', idle_timeout_s, 's, stopping')
+
+
+def submit(dir_queue, step, f_cfg, timeout=None):
+    """Run a step in the worker and wait for it, like `WorkFlows.run_job` without SLURM
+
+    The output of the step is printed after it finished.
+
+    Args:
+        dir_queue (str): queue directory of a running worker
+        step (str): key of `STEPS`, e.g. 'assimilate.py'
+        f_cfg (str): path to Config file
+        timeout (float, optional): seconds to wait for the result
+
+    Returns:
+        None
+    """
+    if not worker_is_alive(dir_queue):
+        raise RuntimeError('No worker is serving '+dir_queue)
+
+    f_base = dir_queue+'/'+time.strftime('%Y%m%d_%H%M%S')+'_'+uuid.uuid4().hex[:8]
+    with open(f_base+'.tmp', 'w') as f:
+        json.dump(dict(step=step, f_cfg=f_cfg), f)
+    os.replace(f_base+'.tmp', f_base+'.request')
+
+    t_start = time.time()
+    while not os.path.exists(f_base+'.result'):
+        if timeout and time.time() - t_start > timeout:
+            raise TimeoutError('worker did not finish '+step+' within '+str(timeout)+' s')
+        if not worker_is_alive(dir_queue):
+            raise RuntimeError('worker serving '+dir_queue+' stopped while running '+step)
+        time.sleep(0.02)
+
+    with open(f_base+'.result') as f:
+        result = json.load(f)
+    if os.path.exists(f_base+'.log'):
+        with open(f_base+'.log') as f:
+            sys.stdout.write(f.read())
+
+    if result['returncode'] != 0:
+        raise RuntimeError('Error running step '+step+' '+f_cfg+' in worker, see '+f_base+'.log')
+    print(step, 'finished in worker after', result['wall_s'], 's')
+
+
+if __name__ == '__main__':
+    serve(sys.argv[1])
@@ -11,11 +11,119 @@ import shutil
 import warnings
 import datetime as dt
 import inspect
+import subprocess
+import time
 
-from dartwrf.utils import script_to_str, shell
+from dartwrf.utils import script_to_str, shell, run_process, sync_tree
+from dartwrf import worker
+from dartwrf.cycle_state import CycleState, mark_command
+from dartwrf import resources
 from dartwrf.utils import Config
 
 
+def wrf_run_succeeded(dir_wrf_run, success_msg='SUCCESS COMPLETE WRF'):
+    """Check the end of `rsl.out.0000` for the success message of WRF
+
+    Args:
+        dir_wrf_run (str): WRF run directory of one member
+        success_msg (str): e.g. 'SUCCESS COMPLETE WRF' or 'SUCCESS COMPLETE IDEAL INIT'
+
+    Returns:
+        bool
+    """
+    try:
+        with open(dir_wrf_run + '/rsl.out.0000', 'rb') as f:
+            f.seek(0, os.SEEK_END)
+            f.seek(max(0, f.tell() - 4096))
+            return success_msg in f.read().decode(errors='replace')
+    except FileNotFoundError:
+        return False
+
+
+def run_ensemble_locally(cfg, exe='./wrf.exe', nproc=None, total_cores=None,
+                         success_msg='SUCCESS COMPLETE WRF', check=True, max_retries=None):
+    """Run an executable for all ensemble members on this machine, packed onto the available cores
+
+    Members run in a work queue: the machine is divided into slots of `nproc` cores,
+    each slot is pinned to its cores and starts the next member as soon as its previous member finished.
+    Failed members are put back into the queue up to `max_retries` times, 
+    the status of every member is written to `<dir_log>/member_status.<exe>.json`.
+
+    Note:
+        Pinning uses `taskset` and `I_MPI_PIN_PROCESSOR_LIST` (Intel MPI).
+        For OpenMPI, set ``cfg.mpirun = 'mpirun --bind-to none'``.
+
+    Args:
+        exe (str): executable in the WRF run directory, e.g. './wrf.exe' or './ideal.exe'
+        nproc (int, optional): MPI processes per member, default: `cfg.max_nproc_for_each_ensemble_member`
+        total_cores (int, optional): cores to use, default: `cfg.local_cpus` or all cores
+        success_msg (str): expected at the end of `rsl.out.0000`
+        check (bool): raise an error if any member failed
+        max_retries (int, optional): reruns of a failed member, default: `cfg.WRF_max_retries` or 0
+
+    Returns:
+        dict: member number -> True if successful
+    """
+    import threading
+    import queue
+    import json
+
+    cpus = sorted(os.sched_getaffinity(0))
+    total_cores = int(total_cores or getattr(cfg, 'local_cpus', None) or len(cpus))
+    cpus = cpus[:total_cores]
+    nproc = min(int(nproc or cfg.max_nproc_for_each_ensemble_member), len(cpus))
+    n_slots = len(cpus) // nproc
+    mpirun = getattr(cfg, 'mpirun', 'mpirun')
+    if max_retries is None:
+        max_retries = getattr(cfg, 'WRF_max_retries', 0)
+
+    members = queue.Queue()
+    for iens in range(1, cfg.ensemble_size+1):
+        members.put(iens)
+
+    print('running', exe, 'for', cfg.ensemble_size, 'members with', nproc, 
+          'processes each,', n_slots, 'members at a time')
+    success = {}
+    attempts = {iens: 0 for iens in range(1, cfg.ensemble_size+1)}
+
+    def _slot(i_slot):
+        cpu_list = ','.join(str(c) for c in cpus[i_slot*nproc:(i_slot+1)*nproc])
+        while True:
+            try:
+                iens = members.get_nowait()
+            except queue.Empty:
+                return
+            dir_wrf_run = cfg.dir_wrf_run.replace('<exp>', cfg.name).replace('<ens>', str(iens))
+            cmd = '; '.join([cfg.wrf_modules or 'true', 'cd '+dir_wrf_run, 'rm -f rsl.out.0* rsl.error.0*',
+                             'export I_MPI_PIN_PROCESSOR_LIST='+cpu_list,
+                             'taskset -c '+cpu_list+' '+mpirun+' -np '+str(nproc)+' '+exe])
+            run_process(cmd, log_file=dir_wrf_run+'/log.'+os.path.basename(exe), check=False,
+                        metrics_file=cfg.dir_log+'/process_metrics.jsonl', name=exe+'-'+str(iens))
+            attempts[iens] += 1
+            success[iens] = wrf_run_succeeded(dir_wrf_run, success_msg)
+            print(dir_wrf_run, success_msg if success[iens] else 'FAILED')
+            if not success[iens] and attempts[iens] <= max_retries:
+                print('retrying member', iens, '- attempt', attempts[iens]+1)
+                members.put(iens)
+
+    threads = [threading.Thread(target=_slot, args=(i,)) for i in range(n_slots)]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+
+    failed = sorted(iens for iens, ok in success.items() if not ok)
+    status = dict(time=cfg.time.strftime('%Y-%m-%d_%H:%M') if getattr(cfg, 'time', None) else None, exe=exe,
+                  members={iens: dict(success=success[iens], attempts=attempts[iens]) for iens in sorted(success)})
+    os.makedirs(cfg.dir_log, exist_ok=True)
+    with open(cfg.dir_log+'/member_status.'+os.path.basename(exe)+'.json', 'w') as f:
+        json.dump(status, f, indent=1)
+
+    if check and failed:
+        raise RuntimeError(exe+' failed for members '+str(failed))
+    return success
+
+
 class WorkFlows(object):
     def __init__(self, cfg: Config):
         """Create the archive directory, copy scripts to archive
@@ -32,15 +140,12 @@ class WorkFlows(object):
         
         ############### ARCHIVE SCRIPTS AND CONFIGS
         # Copy scripts and config files to `self.archivedir` folder
-        dirs_exist_ok = False
-        if os.path.exists(cfg.dir_archive+'/DART-WRF/'):
-            if input('The experiment name already exists! Overwrite existing scripts? (Y/n) ') in ['Y', 'y']:
-                dirs_exist_ok = True
-
-        shutil.copytree(cfg.dir_dartwrf_dev,
-                        cfg.dir_archive+'/DART-WRF/',
-                        ignore=shutil.ignore_patterns('*.git','config/','__*','tests/'),
-                        dirs_exist_ok=dirs_exist_ok)
+        # only changed files are copied, see DART-WRF/manifest.json for the archived version
+        synced = sync_tree(cfg.dir_dartwrf_dev,
+                           cfg.dir_archive+'/DART-WRF/',
+                           ignore=shutil.ignore_patterns('*.git','config/','__*','tests/'))
+        print('>>> Archived scripts:        ', len(synced['copied']), 'files updated,',
+              len(synced['unchanged']), 'unchanged,', len(synced['removed']), 'removed')
         
         
         ################# INFORM USER
@@ -57,6 +162,16 @@ class WorkFlows(object):
         if self.use_slurm:
             print(" ")
             print('>>> Using SLURM, see logs in "'+self.dir_log+'"')
+
+        # run jobs concurrently on this machine?
+        self.executor = None
+        if not self.use_slurm and getattr(cfg, 'use_local_executor', False):
+            from dartwrf.local_executor import LocalExecutor
+            self.executor = LocalExecutor(self.dir_log, 
+                                          n_cpus=getattr(cfg, 'local_cpus', None),
+                                          mem_GB=getattr(cfg, 'local_mem_GB', None))
+            print(" ")
+            print('>>> Running jobs locally with', self.executor.n_cpus, 'CPUs, see logs in "'+self.dir_log+'"')
         print('------------------------------------------------------')
         
         # use this python path
@@ -64,45 +179,123 @@ class WorkFlows(object):
         self.dir_dartwrf_run = cfg.dir_dartwrf_run
         self.python = 'export PYTHONPATH=' +pythonpath_archive+ '; '+cfg.python
 
-    def run_job(self, cmd, cfg, depends_on=None, **kwargs):
+        # which stages of which cycle finished, see resume()
+        self.state = CycleState(cfg.dir_archive+'/cycle_state.sqlite')
+        self._resuming = False
+
+        # run python steps in a persistent worker process?
+        self.dir_worker = None
+        if not self.use_slurm and getattr(cfg, 'use_worker', False):
+            self.dir_worker = self.dir_log + '/worker/'
+            self._start_worker()
+
+    def _start_worker(self):
+        """Start a worker process (see dartwrf/worker.py) unless one is running already
+        """
+        if worker.worker_is_alive(self.dir_worker):
+            return
+        os.makedirs(self.dir_worker, exist_ok=True)
+        subprocess.Popen(self.python+' -m dartwrf.worker '+self.dir_worker
+                         +' > '+self.dir_worker+'/worker.log 2>&1',
+                         shell=True, start_new_session=True)
+        for _ in range(600):
+            if worker.worker_is_alive(self.dir_worker):
+                print('>>> Worker started, see "'+self.dir_worker+'worker.log"')
+                return
+            time.sleep(0.1)
+        raise RuntimeError('Worker did not start, see '+self.dir_worker+'worker.log')
+
+    def run_job(self, cmd, cfg, depends_on=None, stage=None, outputs=None, depends_how='afterok', **kwargs):
         """Run scripts in a shell
 
         If not using SLURM: calls scripts through shell
         if using SLURM: uses slurmpy to submit jobs, keep certain default kwargs and only update some with kwarg `overwrite_these_configurations`
+        if using the local executor (cfg.use_local_executor): jobs run in the background as soon as 
+            their dependencies finished and enough CPUs (kwarg `ntasks`) and memory (kwarg `mem`) are free
 
         Args:
             cmd (str): Bash command(s) to run
             jobname (str, optional): Name of SLURM job
             cfg_update (dict): The config keywords will be overwritten with values
             depends_on (int or None): SLURM job id of dependency, job will start after this id finished.
+            depends_how (str): 'afterok' (start only if the dependencies succeeded) or 'afterany'
+            stage (str, optional): name of the stage in the cycle state (default: name of calling function)
+            outputs (list of str, optional): glob patterns of output files, 
+                recorded with checksums in the cycle state when the job finished
 
         Returns 
-            None
+            job ID (SLURM or local executor) or None
         """
+        # name of calling function
+        path_to_script = inspect.stack()[1].function
+        if 'time' in cfg:
+            jobname = path_to_script.split('/')[-1]+'-'+cfg.time.strftime('%H:%M')
+        else:
+            jobname = path_to_script.split('/')[-1]+'-'+cfg.name
+
+        # the job records in the cycle state that it finished
+        stage = stage or path_to_script
+        cmd_marked = cmd
+        if 'time' in cfg:
+            cmd_marked += mark_command(self.python, self.state.f_db, cfg.time, stage,
+                                       array='array' in kwargs, outputs=outputs)
+
         if self.use_slurm:
             from slurmpy import Slurm
-            # name of calling function
-            path_to_script = inspect.stack()[1].function
-            if 'time' in cfg:
-                jobname = path_to_script.split('/')[-1]+'-'+cfg.time.strftime('%H:%M')
-            else:
-                jobname = path_to_script.split('/')[-1]+'-'+cfg.name
             print('> SLURM job:', jobname)
             
             slurm_kwargs = cfg.slurm_kwargs.copy()
             for key, value in kwargs.items():
                 slurm_kwargs[key] = value
                 
-            return Slurm(jobname,
+            run_kwargs = dict(depends_on=depends_on)
+            if depends_how != 'afterok':
+                run_kwargs['depends_how'] = depends_how
+            job_id = Slurm(jobname,
                         slurm_kwargs=slurm_kwargs,
                         log_dir=self.dir_log, 
                         scripts_dir=self.dir_slurm,
-                        ).run(cmd, depends_on=depends_on)
+                        ).run(cmd_marked, **run_kwargs)
+        elif self.executor:
+            job_id = self.executor.submit(cmd_marked, jobname, depends_on=depends_on,
+                                        ntasks=kwargs.get('ntasks', 1), mem=kwargs.get('mem'),
+                                        array=kwargs.get('array'), depends_how=depends_how)
+        elif self.dir_worker and worker.step_from_cmd(cmd)[0]:
+            step, f_cfg = worker.step_from_cmd(cmd)
+            print('> worker:', step, f_cfg)
+            self._start_worker()  # in case it stopped after being idle
+            worker.submit(self.dir_worker, step, f_cfg)
+            if 'time' in cfg:
+                self.state.mark(cfg.time, stage, outputs=outputs)
+            job_id = None
         else:
             print(cmd)
-            returncode = os.system(cmd)
-            if returncode != 0:
-                raise Exception('Error running command >>> '+cmd)
+            run_process(cmd_marked, metrics_file=self.dir_log+'/process_metrics.jsonl', name=jobname)
+            job_id = None
+
+        # which config snapshot was used by which job
+        cfg.add_to_index(jobname, job_id)
+        return job_id
+
+    def _sized_job(self, cfg, job_type, cmd, features, slurm_kwargs, 
+                   default_time_min, default_mem, scale=1.):
+        """Set SLURM `time` and `mem` from the history of similar jobs (see dartwrf/resources.py)
+        and record the resources used by this job
+
+        Args:
+            slurm_kwargs (dict): is updated with `time` and `mem`
+            default_time_min (int or None), default_mem (str or None): used if there is no history
+
+        Returns:
+            str: command which records runtime and memory when it finished
+        """
+        if not self.use_slurm:
+            return cmd
+        f_db = getattr(cfg, 'resource_db', resources.default_db)
+        slurm_kwargs.update(resources.slurm_resources(f_db, job_type, features, 
+                                                      default_time_min, default_mem, scale=scale))
+        return resources.wrap_command(self.python, f_db, job_type, features, cmd, scale=scale,
+                                      time_min=slurm_kwargs.get('time'), mem=slurm_kwargs.get('mem'))
 
 ###########################################################
 # USER FUNCTIONS
@@ -124,20 +317,29 @@ class WorkFlows(object):
         shell(cmd)
 
 
-    def generate_obsseq_out(self, cfg, depends_on=None):
+    def generate_obsseq_out(self, cfg, depends_on=None, times=None):
         """Creates observations from a nature run for a list of times
 
         Args:
-            times (list): list of datetime objects
+            times (list, optional): list of datetime objects, all generated in one job.
+                Default: `cfg.time` only
 
         Returns:
             str: job ID of the submitted job
         """
+        if times or getattr(cfg, 'obs_times', None):
+            cfg.update(obs_times=list(times) if times else None)
         path_to_script = self.dir_dartwrf_run + '/obs/create_obsseq_out.py'
         cmd = ' '.join([self.python, path_to_script, cfg.f_cfg_current])
 
-        id = self.run_job(cmd, cfg, depends_on=[depends_on],
-                          **{"ntasks": "20", "mem": "200G", "ntasks-per-node": "20"})
+        slurm_kwargs = {"ntasks": "20", "mem": "200G", "ntasks-per-node": "20"}
+        features = dict(obs=resources.obs_signature(cfg), nproc=20,
+                        nature=str(getattr(cfg, 'nature_wrfout_pattern', '')))
+        cmd = self._sized_job(cfg, 'generate_obsseq_out', cmd, features, slurm_kwargs,
+                              default_time_min=None, default_mem="200G",
+                              scale=len(times) if times else 1)
+
+        id = self.run_job(cmd, cfg, depends_on=[depends_on], **slurm_kwargs)
         return id
 
 
@@ -186,6 +388,11 @@ class WorkFlows(object):
             hist_interval_s (int): history output frequency in seconds;
             restart: whether it uses a restart file;
             restart_interval: interval in minutes to write restart files;
+
+            Optionally, to rerun failed members:
+            WRF_max_retries (int): reruns of a failed member within its job (default 0);
+            WRF_max_resubmit (int): resubmissions of the job array (default 0), 
+            only members which did not finish (see dartwrf/cycle_state.py) are run again
             
         Returns:
             str: job ID of the submitted job
@@ -207,11 +414,12 @@ class WorkFlows(object):
                             ).replace('<dir_wrf_run>', cfg.dir_wrf_run.replace('<ens>', '$IENS')
                             ).replace('<wrf_modules>', cfg.wrf_modules,
                             ).replace('<WRF_number_of_processors>', str(cfg.max_nproc_for_each_ensemble_member),
+                            ).replace('<WRF_max_retries>', str(getattr(cfg, 'WRF_max_retries', 0)),
                                       )
         # prepare namelist
         path_to_script = self.dir_dartwrf_run + '/prepare_namelist.py'
         cmd = ' '.join([self.python, path_to_script, cfg.f_cfg_current])
-        id = self.run_job(cmd, cfg, depends_on=[depends_on])
+        id = self.run_job(cmd, cfg, depends_on=[depends_on], stage='prepare_namelist')
 
         # run WRF ensemble
         time_in_simulation_hours = (end-start).total_seconds()/3600
@@ -221,7 +429,27 @@ class WorkFlows(object):
         # if runtime_wallclock_mins_expected > 30:  # this means jobs will mostly take < 15 mins
         slurm_kwargs.update({"constraint": "zen4"})
 
-        id = self.run_job(wrf_cmd, cfg, depends_on=[id], **slurm_kwargs)
+        # or predict from previous runs (runtime per simulated hour)
+        features = dict(nproc=cfg.max_nproc_for_each_ensemble_member, model_dx=cfg.model_dx,
+                        grid=resources.wrf_grid(cfg), hist_interval_s=getattr(cfg, 'hist_interval_s', 300))
+        wrf_cmd = self._sized_job(cfg, 'run_WRF', wrf_cmd, features, slurm_kwargs,
+                                  runtime_wallclock_mins_expected, slurm_kwargs['mem'],
+                                  scale=max(time_in_simulation_hours, 1/60))
+
+        # restart files for the next cycle
+        outputs = [cfg.dir_archive+start.strftime('/%Y-%m-%d_%H:%M/')+'$SLURM_ARRAY_TASK_ID/wrfrst_d01_*']
+        id = self.run_job(wrf_cmd, cfg, depends_on=[id], outputs=outputs, **slurm_kwargs)
+
+        # resubmit the array, members which finished exit immediately
+        # the last resubmission succeeds only if all members succeeded
+        if 'time' in cfg:
+            check = ' '.join([self.python, '-m dartwrf.cycle_state --check', self.state.f_db,
+                              cfg.time.strftime('%Y-%m-%d_%H:%M'), 'run_WRF', '$SLURM_ARRAY_TASK_ID'])
+            rerun_cmd = ('if ('+check+'); then echo "member $SLURM_ARRAY_TASK_ID finished before"; exit 0; fi\n'
+                         + wrf_cmd)
+            for _ in range(getattr(cfg, 'WRF_max_resubmit', 0)):
+                id = self.run_job(rerun_cmd, cfg, depends_on=[id], depends_how='afterany',
+                                  stage='run_WRF', outputs=outputs, **slurm_kwargs)
         return id
 
     def assimilate(self, cfg, depends_on=None):
@@ -233,11 +461,19 @@ class WorkFlows(object):
         path_to_script = self.dir_dartwrf_run + '/assimilate.py'
         cmd = ' '.join([self.python, path_to_script, cfg.f_cfg_current])
 
-        id = self.run_job(cmd, cfg, depends_on=[depends_on], 
-                          **{"ntasks": str(cfg.max_nproc), "time": "30", 
-                             "mem": "110G", "partition": "devel",
-                             "ntasks-per-node": str(cfg.max_nproc), "ntasks-per-core": "1"}, 
-                     )
+        # archived analysis, input for update_IC
+        dir_out = cfg.dir_archive + cfg.time.strftime(getattr(cfg, 'pattern_init_time', '/%Y-%m-%d_%H:%M/'))
+        outputs = [dir_out+'/filter_restart_d01.*', dir_out+'/increment_d01.*']
+
+        slurm_kwargs = {"ntasks": str(cfg.max_nproc), "time": "30", 
+                        "mem": "110G", "partition": "devel",
+                        "ntasks-per-node": str(cfg.max_nproc), "ntasks-per-core": "1"}
+        features = dict(ensemble_size=cfg.ensemble_size, nproc=cfg.max_nproc, model_dx=cfg.model_dx,
+                        grid=resources.wrf_grid(cfg), obs=resources.obs_signature(cfg))
+        cmd = self._sized_job(cfg, 'assimilate', cmd, features, slurm_kwargs,
+                              default_time_min=30, default_mem="110G")
+
+        id = self.run_job(cmd, cfg, depends_on=[depends_on], outputs=outputs, **slurm_kwargs)
         return id
 
     def prepare_IC_from_prior(self, cfg: Config, depends_on=None):
@@ -319,4 +555,117 @@ class WorkFlows(object):
         # id = self.run_job(cmd, 'linpost'+self.cfg.name, cfg_update={"ntasks": "16", "mem": "80G", "ntasks-per-node": "16", "ntasks-per-core": "2",
         #                                                                        "time": "15", "mail-type": "FAIL"},
         #                           depends_on=[id])
-        return id
\ No newline at end of file
+        return id
+
+    def compress_archive(self, cfg, depends_on=None):
+        """Compress the netCDF files archived for the cycle at `cfg.time` (see dartwrf/compress_archive.py)
+
+        Returns:
+            str: job ID of the submitted job
+        """
+        path_to_script = self.dir_dartwrf_run + '/compress_archive.py'
+        cmd = ' '.join([self.python, path_to_script, cfg.f_cfg_current])
+
+        id = self.run_job(cmd, cfg, depends_on=depends_on,
+                          **{"ntasks": "8", "mem": "30G", "time": "60"})
+        return id
+
+    def _stage(self, name, cfg, depends_on=None, critical=True, n_members=None):
+        """Run the method `name` for a cycle, unless resuming and it finished before
+
+        While resuming, critical stages are skipped until the first one that did not finish,
+        from then on all stages are run.
+
+        Returns:
+            job ID of the submitted job, or `depends_on` if skipped
+        """
+        if self._resuming and self.state.is_done(cfg.time, name, n_members=n_members):
+            print('>>> resume: skipping', name, cfg.time.strftime('%Y-%m-%d %H:%M'), '(finished before)')
+            return depends_on if critical else None
+        if critical and self._resuming:
+            print('>>> resume: continuing with', name, cfg.time.strftime('%Y-%m-%d %H:%M'))
+            self._resuming = False
+        return getattr(self, name)(cfg, depends_on=depends_on)
+
+    def cycle(self, cfg, assim_times, timedelta_integrate, first_prior, depends_on=None,
+              run_RTTOV=False, evaluate=False, compress=False):
+        """Cycled data assimilation, with diagnostics and archiving off the critical path
+
+        The critical path of each cycle is
+        assimilate -> prepare_IC_from_prior -> update_IC_from_DA -> run_WRF,
+        the next cycle only waits for these jobs.
+        Optional jobs only depend on the critical jobs of their cycle, nothing depends on them:
+            - RTTOV on the forecast (`run_RTTOV`)
+            - observation-space evaluation of the posterior (`evaluate`)
+            - compression of the archived output (`compress`), 
+              after the next cycle has read the forecast as its prior
+
+        Args:
+            assim_times (list of dt.datetime): assimilation times
+            timedelta_integrate (dt.timedelta): forecast length after each assimilation,
+                usually the time until the next assimilation
+            first_prior (dict): `prior_init_time` and `prior_path_exp` for the first assimilation
+            depends_on (str, optional): job ID of a previous job after which to start
+
+        Returns:
+            (str, list): job ID of the last critical job, job IDs of the optional jobs
+        """
+        id = depends_on
+        side_ids = []
+        id_rttov = None
+        cfg_prev = None
+        n = cfg.ensemble_size
+
+        for i, t in enumerate(assim_times):
+            if i == 0:
+                cfg.update(time=t, prior_valid_time=t, **first_prior)
+            else:
+                cfg.update(time=t, prior_init_time=assim_times[i-1], prior_valid_time=t,
+                           prior_path_exp=cfg.dir_archive)
+
+            id_assim = self._stage('assimilate', cfg, depends_on=id)
+            id = self._stage('prepare_IC_from_prior', cfg, depends_on=id_assim)
+            id = self._stage('update_IC_from_DA', cfg, depends_on=id)
+
+            if evaluate:
+                side_ids.append(self._stage('evaluate_obs_posterior_after_analysis', cfg,
+                                            depends_on=id, critical=False))
+
+            if compress and cfg_prev:
+                # the previous forecast was read by this assimilation
+                side_ids.append(self._stage('compress_archive', cfg_prev, critical=False,
+                    depends_on=[d for d in [id_assim, id_rttov] if d is not None]))
+
+            id_rttov = None
+            if i < len(assim_times) - 1:
+                restart_interval = (assim_times[i+1] - t).total_seconds()/60  # in minutes
+                cfg.update(WRF_start=t,
+                           WRF_end=t+timedelta_integrate,
+                           restart=True,
+                           restart_interval=restart_interval)
+                id = self._stage('run_WRF', cfg, depends_on=id, n_members=n)
+
+                if run_RTTOV:
+                    id_rttov = self._stage('run_RTTOV', cfg, depends_on=id, critical=False, n_members=n)
+                    side_ids.append(id_rttov)
+
+            cfg_prev = Config.from_file(cfg.f_cfg_current)
+
+        if compress and cfg_prev:
+            side_ids.append(self._stage('compress_archive', cfg_prev, critical=False,
+                depends_on=[d for d in [id, id_rttov] if d is not None]))
+        self._resuming = False
+        return id, [d for d in side_ids if d is not None]
+
+    def resume(self, cfg, assim_times, timedelta_integrate, first_prior, **kwargs):
+        """Continue a cycled experiment (see `cycle`) after it stopped, e.g. due to a node failure
+
+        Stages which finished in a previous run and whose outputs did not change are skipped 
+        (see dartwrf/cycle_state.py), the experiment continues with the first stage that did not finish.
+        Call it with the same arguments as `cycle`.
+
+        Returns:
+            (str, list): job ID of the last critical job, job IDs of the optional jobs
+        """
+        self._resuming = True
+        return self.cycle(cfg, assim_times, timedelta_integrate, first_prior, **kwargs)
@@ -8,9 +8,9 @@ example call:
     ./wrfinput_add_geo.py geo_em.d01.nc wrfinput_d01
 
 """
-import os, sys
+import sys
 import netCDF4 as nc
-from dartwrf.utils import Config
+from dartwrf.utils import Config, shell
 
 def run(cfg: Config) -> None:
     
@@ -38,7 +38,7 @@ def run(cfg: Config) -> None:
     geo_ds.close()
 
     # overwrite attributes
-    os.system(cfg.ncks+' -A -x '+cfg.geo_data_file+' '+cfg.wrfinput_file)
+    shell(cfg.ncks+' -A -x '+cfg.geo_data_file+' '+cfg.wrfinput_file)
 
 
 if __name__ == '__main__':
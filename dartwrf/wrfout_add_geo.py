@@ -1,6 +1,6 @@
-import os
 import netCDF4 as nc
 import argparse
+from dartwrf.utils import run_process
 
 fields_old = ["XLAT_M",   "XLONG_M",]
              # "XLONG_U",  "XLONG_V",     
@@ -58,7 +58,7 @@ def run(geo_data_file: str,
     geo_ds.close()
 
     # overwrite attributes
-    os.system(path_ncks+' -A -x '+geo_data_file+' '+wrfout_file)
+    run_process(path_ncks+' -A -x '+geo_data_file+' '+wrfout_file)
 
 if __name__ == '__main__':
     parser = argparse.ArgumentParser(description="Add geogrid data to a wrfout file for DART.")
@@ -8,17 +8,27 @@ RUNDIR=<dir_wrf_run>
 echo "ENSEMBLE NR: "$IENS" in "$RUNDIR
 
 cd $RUNDIR
-rm -rf rsl.out.0*
-echo "mpirun -np <WRF_number_of_processors> ./wrf.exe"
-mpirun -np <WRF_number_of_processors> ./wrf.exe
 
+# rerun a failed member up to <WRF_max_retries> times
+success=0
+for attempt in $(seq 0 <WRF_max_retries>); do
+   rm -rf rsl.out.0*
+   echo "mpirun -np <WRF_number_of_processors> ./wrf.exe (attempt "$attempt")"
+   mpirun -np <WRF_number_of_processors> ./wrf.exe
 
-# error checking
-line=`tail -n 2 rsl.out.0000`
-if [[ $line == *"SUCCESS COMPLETE WRF"* ]]; 
+   # error checking
+   line=`tail -n 2 rsl.out.0000`
+   if [[ $line == *"SUCCESS COMPLETE WRF"* ]]; 
+   then 
+      success=1
+      break
+   fi
+   echo $RUNDIR $line
+done
+
+if [ $success -eq 1 ];
 then 
    echo $RUNDIR 'SUCCESS COMPLETE WRF'
 else  
-   echo $RUNDIR $line
    exit 1
 fi
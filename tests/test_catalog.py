@@ -0,0 +1,49 @@
+import os, tempfile, types
+import datetime as dt
+
+from dartwrf import catalog
+
+
+def _touch(f):
+    os.makedirs(os.path.dirname(f), exist_ok=True)
+    with open(f, 'w') as fh:
+        fh.write('x')
+
+
+def test_catalog():
+    """Glob patterns are answered from the catalog, changed directories are rescanned"""
+    with tempfile.TemporaryDirectory() as tmp:
+        archive = tmp+'/sim_archive'
+        for init in ['2008-07-30_06:00', '2008-07-30_12:00']:
+            for iens in [1, 2]:
+                _touch(archive+'/nature/'+init+'/'+str(iens)+'/wrfout_d01_2008-07-30_12:00:00')
+        cat = catalog.Catalog(tmp+'/catalog.sqlite')
+
+        pattern = dt.datetime(2008, 7, 30, 12).strftime(archive+'/nature/*/1/wrfout_d01_%Y-%m-%d_%H:%M:%S')
+        expected = [archive+'/nature/2008-07-30_06:00/1/wrfout_d01_2008-07-30_12:00:00',
+                    archive+'/nature/2008-07-30_12:00/1/wrfout_d01_2008-07-30_12:00:00']
+        assert cat.glob(pattern) == expected
+        assert cat.query(init_time=dt.datetime(2008, 7, 30, 6), member=2, file_type='wrfout_d01') == \
+            [archive+'/nature/2008-07-30_06:00/2/wrfout_d01_2008-07-30_12:00:00']
+
+        # nothing changed: no directory is listed again
+        assert cat.scan(archive+'/nature') == 0
+
+        # a new file is found by rescanning only the changed directory
+        f_new = archive+'/nature/2008-07-30_12:00/1/wrfout_d01_2008-07-30_12:15:00'
+        _touch(f_new)
+        cfg = types.SimpleNamespace(catalog_db=tmp+'/catalog.sqlite')
+        assert catalog.find_files(cfg, archive+'/nature/*/1/wrfout_d01_2008-07-30_12:15:00') == [f_new]
+        assert cat.scan(archive+'/nature') == 0
+
+        # a deleted file is not returned, the catalog is rescanned
+        os.remove(expected[0])
+        assert catalog.find_files(cfg, pattern) == expected[1:]
+        assert cat.query(init_time=dt.datetime(2008, 7, 30, 6), member=1) == []
+
+        # without catalog: glob
+        assert catalog.find_files(types.SimpleNamespace(), pattern) == expected[1:]
+
+
+if __name__ == '__main__':
+    test_catalog()
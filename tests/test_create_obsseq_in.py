@@ -0,0 +1,56 @@
+import tempfile
+import datetime as dt
+import numpy as np
+
+from dartwrf.obs import create_obsseq_in as osi
+
+obs_kind_nrs = {'RADAR_REFLECTIVITY': 37, 'SYNOP_TEMPERATURE': 94, 'MSG_4_SEVIRI_TB': 261}
+
+
+def _reference(time_dt, list_obscfg):
+    """obs_seq.in text as built observation by observation"""
+    time_dt = osi._add_timezone_UTC(time_dt)
+    dart_date_day, secs_thatday = osi.get_dart_date(time_dt)
+    txt = ''
+    i_obs_total = 0
+    for i_cfg, obscfg in enumerate(list_obscfg):
+        kind = obscfg['kind']
+        sat_channel = obscfg.get('sat_channel', False)
+        vert_coord_sys, vert_coords = osi._determine_vert_coords(sat_channel, kind, obscfg)
+        coords = osi._append_hgt_to_coords(obscfg['obs_locations'], vert_coords)
+        obserr_std = np.zeros(len(coords)) + obscfg["error_generate"]
+        sat_info = osi.write_sat_angle_appendix(sat_channel, osi.lat0, osi.lon0, time_dt)
+        for i_obs in range(len(coords)):
+            i_obs_total += 1
+            last = (i_obs == len(coords)-1) and (i_cfg == len(list_obscfg)-1)
+            txt += osi.write_section(dict(i=i_obs_total, kind_nr=obs_kind_nrs[kind],
+                                          dart_date_day=dart_date_day, secs_thatday=secs_thatday,
+                                          lon=coords[i_obs][1], lat=coords[i_obs][0],
+                                          vert_coord=coords[i_obs][2], vert_coord_sys=vert_coord_sys,
+                                          obserr_var=obserr_std[i_obs]**2, appendix=sat_info),
+                                     last=last)
+    return osi.preamble(i_obs_total, [a['kind'] for a in list_obscfg], obs_kind_nrs) + txt
+
+
+def test_write_obs_seq_in():
+    """The file is identical to joining write_section of every observation"""
+    rng = np.random.default_rng(1)
+    lats, lons = rng.uniform(40, 50, 30), rng.uniform(-20, 20, 30)
+    list_obscfg = [
+        # single precision, as read from geo_em files
+        dict(kind='RADAR_REFLECTIVITY', heights=[2000, 3000, 4000.5], error_generate=2.5,
+             obs_locations=[(np.float32(lat), np.float32(lon)) for lat, lon in zip(lats, lons)]),
+        dict(kind='SYNOP_TEMPERATURE', error_generate=0.2,
+             obs_locations=[(float(lat), float(lon)) for lat, lon in zip(lats, lons)]),
+        dict(kind='MSG_4_SEVIRI_TB', sat_channel=6, error_generate=1.,
+             obs_locations=[(45, -10), (46.5, 3)]),
+        ]
+    time_dt = dt.datetime(2008, 7, 30, 12, 30)
+    with tempfile.TemporaryDirectory() as tmp:
+        osi.write_obs_seq_in(tmp+'/obs_seq.in', time_dt, list_obscfg, obs_kind_nrs, chunk_size=7)
+        with open(tmp+'/obs_seq.in') as f:
+            assert f.read() == _reference(time_dt, list_obscfg)
+
+
+if __name__ == '__main__':
+    test_write_obs_seq_in()
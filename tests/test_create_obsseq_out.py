@@ -0,0 +1,136 @@
+import os, re, shutil, tempfile, threading
+import datetime as dt
+from types import SimpleNamespace
+
+from dartwrf.obs import create_obsseq_out, obskind
+from dartwrf import dart_nml, dart_ranks
+
+f_obs_seq_out = os.path.dirname(__file__)+'/test_input/obs_seq.out'
+
+
+def _setup(tmp, times):
+    """Config, nature files, obs_seq.in and a run_DART directory as prepared by `main`"""
+    dart_srcdir = tmp+'/DART/models/wrf/work'
+    f_def = obskind.definition_file(dart_srcdir)
+    os.makedirs(dart_srcdir)
+    os.makedirs(os.path.dirname(f_def))
+    with open(f_def, 'w') as f:
+        f.write('! Integer definitions for DART OBS TYPES\n'
+                + 'integer, parameter, public ::     MSG_4_SEVIRI_BDRF =   256\n'
+                + 'integer, parameter, public ::       MSG_4_SEVIRI_TB =   261\n'
+                + 'integer, parameter, public :: MAX_DEFINED_TYPES_OF_OBS = 2\n')
+
+    cfg = SimpleNamespace(name='exp', max_nproc=6, obs_batch_parallel=3, dir_dart_src=dart_srcdir,
+                          dir_dart_run=tmp+'/run_DART', dir_log=tmp+'/logs', dart_modules='true',
+                          nature_wrfout_pattern=tmp+'/nature/wrfout_d01_%Y-%m-%d_%H:%M:%S',
+                          geo_em_nature=None, use_this_obs_seq_in=tmp+'/obs_seq.in',
+                          pattern_obs_seq_out=tmp+'/archive/%Y-%m-%d_%H:%M_obs_seq.out',
+                          dart_performance_history=tmp+'/performance.jsonl',
+                          assimilate_these_observations=[])
+    os.makedirs(tmp+'/nature')
+    for time in times:
+        with open(time.strftime(cfg.nature_wrfout_pattern), 'w') as f:
+            f.write('nature '+time.strftime('%H:%M'))
+    with open(cfg.use_this_obs_seq_in, 'w') as f:
+        f.write('obs_seq.in')
+    os.makedirs(cfg.dir_dart_run)
+    os.makedirs(cfg.dir_log)
+    with open(cfg.dir_dart_run+'/input.nml', 'w') as f:
+        f.write('shared namelist')
+    with open(tmp+'/perfect_model_obs', 'w') as f:
+        f.write('executable')
+    os.symlink(tmp+'/perfect_model_obs', cfg.dir_dart_run+'/perfect_model_obs')
+    return cfg
+
+
+def test_generate_obsseq_out_batch():
+    """One subdirectory per time, max_nproc split between the runs, obs_seq.out copied to the archive"""
+    times = [dt.datetime(2008, 7, 30, 12) + dt.timedelta(minutes=15*i) for i in range(3)]
+    calls = []
+    lock = threading.Lock()
+
+    def fake_shell(cmd, cwd=None, **kwargs):
+        """perfect_model_obs: check the run directory, write obs_seq.out"""
+        with lock:
+            calls.append((cwd, cmd))
+        assert open(cwd+'/obs_seq.in').read() == 'obs_seq.in'
+        assert os.path.realpath(cwd+'/perfect_model_obs').endswith('/perfect_model_obs')
+        shutil.copy(f_obs_seq_out, cwd+'/obs_seq.out')
+
+    shell, dir_cache = create_obsseq_out.shell, obskind.dir_cache
+    with tempfile.TemporaryDirectory() as tmp:
+        cfg = _setup(tmp, times)
+        create_obsseq_out.shell = fake_shell
+        obskind.dir_cache = tmp+'/cache'
+        try:
+            create_obsseq_out.generate_obsseq_out_batch(cfg, times)
+        finally:
+            create_obsseq_out.shell, obskind.dir_cache = shell, dir_cache
+
+        assert sorted(cwd for cwd, _ in calls) == [cfg.dir_dart_run+t.strftime('/obs_%Y-%m-%d_%H:%M')
+                                                  for t in times]
+        assert all(re.search(r'mpirun -np 2 ', cmd) for _, cmd in calls)  # 6 processors, 3 runs
+        for time in times:
+            dir_run = cfg.dir_dart_run+time.strftime('/obs_%Y-%m-%d_%H:%M')
+            assert open(dir_run+'/wrfout_d01').read() == 'nature '+time.strftime('%H:%M')
+            assert os.path.islink(dir_run+'/input.nml')
+            assert os.path.isfile(time.strftime(cfg.pattern_obs_seq_out))
+
+
+def test_perfect_model_obs_namelist_in_run_dir():
+    """With auto_nproc, the namelist is written in the run directory, not in the shared one"""
+    time = dt.datetime(2008, 7, 30, 12)
+    written = []
+
+    def fake_shell(cmd, cwd=None, **kwargs):
+        shutil.copy(f_obs_seq_out, cwd+'/obs_seq.out')
+
+    def fake_write_namelist(cfg, nproc=None, dir_dart_run=None, **kwargs):
+        written.append((nproc, dir_dart_run))
+
+    saved = create_obsseq_out.shell, dart_ranks.select_nproc, dart_nml.write_namelist
+    with tempfile.TemporaryDirectory() as tmp:
+        cfg = _setup(tmp, [time])
+        cfg.auto_nproc = True
+        dir_run = cfg.dir_dart_run+'/obs_sub'
+        os.makedirs(dir_run)
+        shutil.copy(cfg.use_this_obs_seq_in, dir_run+'/obs_seq.in')
+        create_obsseq_out.shell = fake_shell
+        dart_ranks.select_nproc = lambda *args, **kwargs: 3
+        dart_nml.write_namelist = fake_write_namelist
+        try:
+            create_obsseq_out.run_perfect_model_obs(cfg, dir_run)
+        finally:
+            create_obsseq_out.shell, dart_ranks.select_nproc, dart_nml.write_namelist = saved
+        assert written == [(3, dir_run)]
+
+
+def test_cache_hit_prepares_nature():
+    """Observations from the cache: the nature file for the time is still prepared in run_DART"""
+    times = [dt.datetime(2008, 7, 30, 12), dt.datetime(2008, 7, 30, 12, 15)]
+    calls = []
+
+    def fake_shell(cmd, cwd=None, **kwargs):
+        calls.append(cwd)
+        shutil.copy(f_obs_seq_out, cwd+'/obs_seq.out')
+
+    shell, dir_cache = create_obsseq_out.shell, obskind.dir_cache
+    with tempfile.TemporaryDirectory() as tmp:
+        cfg = _setup(tmp, times)
+        cfg.dir_obs_cache = tmp+'/obs_cache'
+        create_obsseq_out.shell = fake_shell
+        obskind.dir_cache = tmp+'/cache'
+        try:
+            for time in [times[0], times[1], times[0]]:
+                cfg.time = time
+                create_obsseq_out.generate_new_obsseq_out(cfg)
+                assert open(cfg.dir_dart_run+'/wrfout_d01').read() == 'nature '+time.strftime('%H:%M')
+        finally:
+            create_obsseq_out.shell, obskind.dir_cache = shell, dir_cache
+        assert len(calls) == 2  # the third call used the cache
+
+
+if __name__ == '__main__':
+    test_generate_obsseq_out_batch()
+    test_perfect_model_obs_namelist_in_run_dir()
+    test_cache_hit_prepares_nature()
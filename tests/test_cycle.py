@@ -0,0 +1,69 @@
+import atexit, tempfile
+import datetime as dt
+
+from dartwrf.workflows import WorkFlows
+from dartwrf.local_executor import LocalExecutor
+from dartwrf.utils import Config
+
+critical_stages = ['assimilate', 'prepare_IC_from_prior', 'update_IC_from_DA', 'run_WRF']
+side_stages = ['run_RTTOV', 'evaluate_obs_posterior_after_analysis', 'compress_archive']
+
+
+class StubWorkFlows(WorkFlows):
+    """WorkFlows whose stages only sleep and record when they finished, run by a LocalExecutor"""
+    def __init__(self, dir_log, sleep_side_s):
+        self.executor = LocalExecutor(dir_log, n_cpus=8)
+        atexit.unregister(self.executor.wait)
+        self.f_log = dir_log + '/finished.txt'
+        self._resuming = False
+        self.jobs = {}  # id -> (stage, time, depends_on)
+        for name in critical_stages + side_stages:
+            setattr(self, name, self._stub(name, sleep_side_s if name in side_stages else 0.01))
+
+    def _stub(self, name, sleep_s):
+        def stage(cfg, depends_on=None):
+            if not isinstance(depends_on, list):
+                depends_on = [depends_on]
+            depends_on = [d for d in depends_on if d is not None]
+            label = name + '@' + cfg.time.strftime('%H:%M')
+            id = self.executor.submit('sleep '+str(sleep_s)+'; echo '+label+' >> '+self.f_log,
+                                      label, depends_on=depends_on)
+            self.jobs[id] = (name, cfg.time, depends_on)
+            return id
+        return stage
+
+
+def test_cycle_side_jobs_off_critical_path():
+    """Slow side jobs do not delay the next cycles: the critical path finishes first"""
+    with tempfile.TemporaryDirectory() as tmp:
+        cfg = Config(name='test', model_dx=2000, ensemble_size=2, dir_archive=tmp+'/<exp>/',
+                     update_vars=['THM'], dart_nml={'&a': {}})
+        wf = StubWorkFlows(tmp+'/logs', sleep_side_s=2)
+        times = [dt.datetime(2008, 7, 30, 12) + dt.timedelta(minutes=15*i) for i in range(3)]
+        first_prior = dict(prior_init_time=dt.datetime(2008, 7, 30, 8), prior_path_exp=tmp+'/prior')
+
+        id_last, side_ids = wf.cycle(cfg, times, dt.timedelta(minutes=15), first_prior,
+                                     run_RTTOV=True, evaluate=True, compress=True)
+
+        # no critical job depends on a side job
+        for name, _, depends_on in wf.jobs.values():
+            if name in critical_stages:
+                assert not set(depends_on) & set(side_ids), name
+        assert {wf.jobs[i][0] for i in side_ids} == set(side_stages)
+        assert wf.jobs[id_last][0] == 'update_IC_from_DA' and wf.jobs[id_last][1] == times[-1]
+
+        # compressing a cycle waits for the next assimilation, which reads its forecast
+        for i in side_ids:
+            name, time, depends_on = wf.jobs[i]
+            if name == 'compress_archive' and time < times[-1]:
+                assert any(wf.jobs[d][0] == 'assimilate' and wf.jobs[d][1] > time for d in depends_on)
+
+        wf.executor.wait()
+        finished = open(wf.f_log).read().split()
+        critical = [j for j in finished if j.split('@')[0] in critical_stages]
+        assert finished[:len(critical)] == critical  # all critical jobs before any side job
+        assert len(critical) == 3*3 + 2
+
+
+if __name__ == '__main__':
+    test_cycle_side_jobs_off_critical_path()
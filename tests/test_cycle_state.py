@@ -0,0 +1,55 @@
+import os, tempfile, subprocess, sys
+import datetime as dt
+
+from dartwrf.cycle_state import CycleState, mark_command
+
+
+def test_cycle_state():
+    """Stages are done once marked, per member for arrays, and only while outputs are unchanged"""
+    with tempfile.TemporaryDirectory() as tmp:
+        state = CycleState(tmp+'/cycle_state.sqlite')
+        t = dt.datetime(2008, 7, 30, 11)
+        f_out = tmp+'/filter_restart_d01.0001'
+        with open(f_out, 'w') as f:
+            f.write('analysis')
+
+        assert not state.is_done(t, 'assimilate')
+        state.mark(t, 'assimilate', outputs=[tmp+'/filter_restart_d01.*'])
+        assert state.is_done(t, 'assimilate')
+
+        with open(f_out, 'w') as f:
+            f.write('modified')
+        assert not state.is_done(t, 'assimilate')
+        assert state.is_done(t, 'assimilate', verify=False)
+
+        state.mark(t, 'run_WRF', member=1)
+        assert not state.is_done(t, 'run_WRF', n_members=2)
+        state.mark(t, 'run_WRF', member=2)
+        assert state.is_done(t, 'run_WRF', n_members=2)
+        assert state.members_done(t, 'run_WRF') == {1, 2}
+
+
+def test_mark_command():
+    """The stage is only marked if the job succeeded"""
+    with tempfile.TemporaryDirectory() as tmp:
+        f_db = tmp+'/cycle_state.sqlite'
+        t = dt.datetime(2008, 7, 30, 11)
+        python = 'export PYTHONPATH='+os.path.dirname(os.path.dirname(os.path.abspath(__file__)))+'; '+sys.executable
+
+        subprocess.run('false' + mark_command(python, f_db, t, 'failing'), shell=True, executable='/bin/bash')
+        subprocess.run('true' + mark_command(python, f_db, t, 'working'), shell=True, executable='/bin/bash')
+
+        state = CycleState(f_db)
+        assert not state.is_done(t, 'failing')
+        assert state.is_done(t, 'working')
+
+        # check per member, as in resubmitted WRF arrays
+        state.mark(t, 'run_WRF', member=2)
+        check = python+' -m dartwrf.cycle_state --check '+f_db+' '+t.strftime('%Y-%m-%d_%H:%M')+' run_WRF '
+        assert subprocess.run(check+'1', shell=True, executable='/bin/bash').returncode == 1
+        assert subprocess.run(check+'2', shell=True, executable='/bin/bash').returncode == 0
+
+
+if __name__ == '__main__':
+    test_cycle_state()
+    test_mark_command()
@@ -0,0 +1,41 @@
+import os, tempfile, types
+import datetime as dt
+
+from dartwrf import dart_log
+
+f_obsseq = os.path.dirname(__file__) + '/test_input/obs_seq.out'
+
+log_filter = """ initialize_mpi_utilities: Running with            8  MPI processes.
+ filter TIME: 2024/05/13 10:12:01 Before reading in ensemble restart files
+ filter TIME: 2024/05/13 10:12:09 After  reading in ensemble restart files
+ filter TIME: 2024/05/13 10:12:09 Before computing prior observation values
+ filter TIME: 2024/05/13 10:12:40 After  computing prior observation values
+ filter TIME: 2024/05/13 10:12:40 Before observation assimilation
+ filter TIME: 2024/05/13 10:14:00 After  observation assimilation
+ filter TIME: 2024/05/13 10:14:00 Before writing output
+ filter TIME: 2024/05/13 10:14:05 After  writing output
+"""
+
+
+def test_dart_log():
+    """Stage durations, MPI tasks and obs count end up in the history"""
+    parsed = dart_log.parse_log(log_filter)
+    assert parsed['n_mpi_tasks'] == 8
+    assert parsed['total_s'] == 124
+    assert parsed['categories'] == dict(read=8, forward_operators=31, assimilation=80, write=5)
+
+    assert dart_log.count_obs(f_obsseq) == 961
+
+    with tempfile.TemporaryDirectory() as tmp:
+        with open(tmp+'/log.filter', 'w') as f:
+            f.write(log_filter)
+        cfg = types.SimpleNamespace(name='exp', ensemble_size=4, dart_performance_history=tmp+'/perf.jsonl',
+                                    time=dt.datetime(2008, 7, 30, 12))
+        dart_log.record_run(cfg, 'filter', tmp+'/log.filter', f_obsseq, nproc=8, wall_s=130.)
+        records = dart_log.read_history(tmp+'/perf.jsonl', program='filter')
+        assert len(records) == 1
+        assert records[0]['n_obs'] == 961 and records[0]['time'] == '2008-07-30_12:00'
+
+
+if __name__ == '__main__':
+    test_dart_log()
@@ -0,0 +1,31 @@
+import tempfile, types
+
+from dartwrf import dart_log, dart_ranks
+
+
+def test_select_nproc():
+    """Few tasks for few observations, the fastest task count once there is a history"""
+    with tempfile.TemporaryDirectory() as tmp:
+        cfg = types.SimpleNamespace(max_nproc=20, ensemble_size=40, auto_nproc=True,
+                                    dart_performance_history=tmp+'/perf.jsonl',
+                                    WRF_namelist_template=tmp+'/does_not_exist')
+        assert dart_ranks.select_nproc(cfg, 'filter', 100, just_prior_values=True) == 1
+        assert dart_ranks.select_nproc(cfg, 'filter', 50000) == 20
+
+        for nproc, wall_s in [(4, 100.), (4, 110.), (8, 60.), (8, 62.), (16, 58.), (16, 57.)]:
+            dart_log.append_history(dict(program='filter', just_prior_values=False, ensemble_size=40,
+                                         n_obs=1000, n_mpi_tasks=nproc, wall_s=wall_s), tmp+'/perf.jsonl')
+        # 8 tasks are within 10% of the fastest
+        assert dart_ranks.select_nproc(cfg, 'filter', 1100) == 8
+        # no history for evaluations
+        assert dart_ranks.select_nproc(cfg, 'filter', 1100, just_prior_values=True) == 1
+
+        cfg.auto_nproc = False
+        assert dart_ranks.select_nproc(cfg, 'filter', 1100) is None
+
+    assert dart_ranks.ensemble_manager_nml(40, 20) == dict(layout=2, tasks_per_node=20)
+    assert dart_ranks.ensemble_manager_nml(8, 20) == dict(layout=1, tasks_per_node=8)
+
+
+if __name__ == '__main__':
+    test_select_nproc()
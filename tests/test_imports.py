@@ -0,0 +1,34 @@
+import os, sys, json, subprocess
+
+dir_repo = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+heavy_modules = ['pandas', 'scipy', 'pysolar', 'xarray', 'matplotlib']
+
+# modules run as jobs by WorkFlows -> heavy modules they need at import
+entry_points = {'dartwrf.assimilate': [],
+                'dartwrf.prep_IC_prior': [],
+                'dartwrf.update_IC': [],
+                'dartwrf.prepare_namelist': [],
+                'dartwrf.prepare_wrfrundir': [],
+                'dartwrf.obs.create_obsseq_out': ['pandas'],  # obsseq is used in every run
+                }
+
+
+def _imported(module):
+    """Heavy modules in sys.modules after importing `module` in a new interpreter"""
+    code = ('import sys, json, ' + module + '; '
+            'print(json.dumps([m for m in ' + repr(heavy_modules) + ' if m in sys.modules]))')
+    env = dict(os.environ, PYTHONPATH=dir_repo + os.pathsep + os.environ.get('PYTHONPATH', ''))
+    out = subprocess.run([sys.executable, '-c', code], env=env, capture_output=True, text=True, check=True)
+    return json.loads(out.stdout.strip().splitlines()[-1])
+
+
+def test_heavy_imports_deferred():
+    """Job scripts import pandas, scipy, pysolar, ... only in the functions which use them"""
+    for module, allowed in entry_points.items():
+        unexpected = set(_imported(module)) - set(allowed)
+        assert not unexpected, module + ' imports ' + ', '.join(sorted(unexpected))
+
+
+if __name__ == '__main__':
+    test_heavy_imports_deferred()
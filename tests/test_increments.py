@@ -0,0 +1,118 @@
+import os, tempfile
+import datetime as dt
+from types import SimpleNamespace
+import numpy as np
+import netCDF4 as nc
+
+from dartwrf import increments, update_IC
+
+
+def _write_wrf(f, seed, two_levels=False):
+    """Small WRF-like file with THM (or THM_1, THM_2) and U"""
+    rng = np.random.default_rng(seed)
+    with nc.Dataset(f, 'w') as ds:
+        ds.createDimension('Time', None)
+        ds.createDimension('bottom_top', 3)
+        ds.createDimension('south_north', 4)
+        ds.createDimension('west_east', 5)
+        dims = ('Time', 'bottom_top', 'south_north', 'west_east')
+        for var in ['THM', 'U']:
+            data = 300 + rng.normal(size=(1, 3, 4, 5))
+            for name in ([var+'_1', var+'_2'] if two_levels and var == 'THM' else [var]):
+                ds.createVariable(name, 'f4', dims)[:] = data
+
+
+def _read(f, var):
+    with nc.Dataset(f) as ds:
+        return np.ma.getdata(ds.variables[var][:])
+
+
+def test_increment_roundtrip():
+    """prior + increment from the compressed file equals the posterior (float32 precision)"""
+    with tempfile.TemporaryDirectory() as tmp:
+        _write_wrf(tmp+'/prior', 1)
+        _write_wrf(tmp+'/post', 2)
+        increments.write_increment(tmp+'/prior', tmp+'/post', tmp+'/inc.nc', ['THM', 'U'])
+
+        with nc.Dataset(tmp+'/inc.nc') as ds:
+            assert ds.variables['THM'].dtype == np.float32
+            assert ds.variables['THM'].filters()['zlib']
+
+        increments.add_increment(tmp+'/inc.nc', tmp+'/prior')
+        for var in ['THM', 'U']:
+            np.testing.assert_allclose(_read(tmp+'/prior', var), _read(tmp+'/post', var), atol=1e-4)
+
+
+def test_add_increment_twice():
+    """Adding the same increment again does not change the file"""
+    with tempfile.TemporaryDirectory() as tmp:
+        _write_wrf(tmp+'/prior', 1)
+        _write_wrf(tmp+'/post', 2)
+        _write_wrf(tmp+'/wrfrst', 1, two_levels=True)
+        increments.write_increment(tmp+'/prior', tmp+'/post', tmp+'/inc.nc', ['THM', 'U'])
+
+        assert increments.add_increment(tmp+'/inc.nc', tmp+'/wrfrst')
+        once = _read(tmp+'/wrfrst', 'THM_2')
+        assert not increments.add_increment(tmp+'/inc.nc', tmp+'/wrfrst')
+        np.testing.assert_array_equal(_read(tmp+'/wrfrst', 'THM_2'), once)
+        np.testing.assert_allclose(once, _read(tmp+'/post', 'THM'), atol=1e-4)
+
+
+def test_add_increment_other_scale():
+    """A different scale is refused on a file with the increment, but works on the prior"""
+    with tempfile.TemporaryDirectory() as tmp:
+        _write_wrf(tmp+'/prior', 1)
+        _write_wrf(tmp+'/post', 2)
+        _write_wrf(tmp+'/wrfrst', 1)
+        increments.write_increment(tmp+'/prior', tmp+'/post', tmp+'/inc.nc', ['THM', 'U'])
+
+        assert increments.add_increment(tmp+'/inc.nc', tmp+'/wrfrst', scale=1.)
+        try:
+            increments.add_increment(tmp+'/inc.nc', tmp+'/wrfrst', scale=0.5)
+            raise AssertionError('should have failed')
+        except ValueError:
+            pass
+        np.testing.assert_allclose(_read(tmp+'/wrfrst', 'U'), _read(tmp+'/post', 'U'), atol=1e-4)
+
+        u_prior = _read(tmp+'/prior', 'U')
+        assert increments.add_increment(tmp+'/inc.nc', tmp+'/prior', scale=0.5)
+        assert not increments.add_increment(tmp+'/inc.nc', tmp+'/prior', scale=0.5)
+        np.testing.assert_allclose(_read(tmp+'/prior', 'U'), (u_prior + _read(tmp+'/post', 'U')) / 2, atol=1e-4)
+
+
+def test_archive_increments_and_update_IC():
+    """Archive increments of all members, then run update_IC twice: same result as once
+    (with a custom `pattern_init_time`, update_IC finds the increments where they were written)"""
+    time = dt.datetime(2008, 7, 30, 12)
+    with tempfile.TemporaryDirectory() as tmp:
+        cfg = SimpleNamespace(name='exp', time=time, ensemble_size=2, update_vars=['THM', 'U'],
+                              dir_archive=tmp+'/archive', pattern_init_time='/%Y%m%d_%H%M/cycle/',
+                              dir_dart_run=tmp+'/run_DART', dir_wrf_run=tmp+'/run_WRF/<exp>/<ens>/',
+                              archive_increments=True)
+        f_rst = time.strftime('/wrfrst_d01_%Y-%m-%d_%H:%M:%S')
+        for iens in [1, 2]:
+            os.makedirs(cfg.dir_dart_run+'/prior_ens'+str(iens))
+            os.makedirs(tmp+'/run_WRF/exp/'+str(iens))
+            _write_wrf(cfg.dir_dart_run+'/prior_ens'+str(iens)+'/wrfout_d01', iens)
+            _write_wrf(cfg.dir_dart_run+'/filter_restart_d01.'+str(iens).zfill(4), 10+iens)
+            _write_wrf(tmp+'/run_WRF/exp/'+str(iens)+f_rst, iens, two_levels=True)
+
+        increments.archive_increments(cfg, time)
+        for iens in [1, 2]:
+            assert os.path.isfile(tmp+'/archive/20080730_1200/cycle/increment_d01.000'+str(iens)+'.nc')
+
+        update_IC.update_initials_in_WRF_rundir(cfg)
+        once = [_read(tmp+'/run_WRF/exp/'+str(iens)+f_rst, 'THM_1') for iens in [1, 2]]
+        update_IC.update_initials_in_WRF_rundir(cfg)
+        for iens in [1, 2]:
+            thm = _read(tmp+'/run_WRF/exp/'+str(iens)+f_rst, 'THM_1')
+            np.testing.assert_array_equal(thm, once[iens-1])
+            np.testing.assert_allclose(thm, _read(cfg.dir_dart_run+'/filter_restart_d01.'+str(iens).zfill(4),
+                                                  'THM'), atol=1e-4)
+
+
+if __name__ == '__main__':
+    test_increment_roundtrip()
+    test_add_increment_twice()
+    test_add_increment_other_scale()
+    test_archive_increments_and_update_IC()
@@ -0,0 +1,83 @@
+import os, json, atexit, tempfile
+
+from dartwrf.local_executor import LocalExecutor, _parse_array, _parse_mem_GB
+
+
+def _executor(dir_state, **kwargs):
+    ex = LocalExecutor(dir_state, **kwargs)
+    atexit.unregister(ex.wait)  # failures are tested explicitly
+    return ex
+
+
+def test_parse():
+    assert _parse_array('1-3,5%2') == [1, 2, 3, 5]
+    assert _parse_array(None) == [None]
+    assert _parse_mem_GB('500M') == 0.5 and _parse_mem_GB('2G') == 2. and _parse_mem_GB(None) == 0.
+
+
+def test_dependencies():
+    """Jobs start after their dependencies, array tasks run concurrently within the CPU budget"""
+    with tempfile.TemporaryDirectory() as tmp:
+        ex = _executor(tmp+'/state', n_cpus=2)
+        f = tmp+'/order'
+        a = ex.submit('sleep 0.3; echo a >> '+f, 'a')
+        b = ex.submit('echo b$SLURM_ARRAY_TASK_ID >> '+f, 'b', depends_on=[a], array='1-3')
+        c = ex.submit('echo c >> '+f, 'c', depends_on=[b, None])
+        ex.wait()
+        lines = open(f).read().split()
+        assert lines[0] == 'a' and lines[-1] == 'c'
+        assert sorted(lines[1:4]) == ['b1', 'b2', 'b3']
+        assert all(ex.jobs[i]['status'] == 'done' for i in (a, b, c))
+
+        try:
+            ex.submit('true', 'd', depends_on=[99])
+            raise AssertionError('should have failed')
+        except ValueError:
+            pass
+
+
+def test_failure():
+    """A failed job cancels its 'afterok' dependents, 'afterany' dependents still run"""
+    with tempfile.TemporaryDirectory() as tmp:
+        ex = _executor(tmp+'/state', n_cpus=2)
+        a = ex.submit('exit 1', 'a')
+        b = ex.submit('touch '+tmp+'/b', 'b', depends_on=[a])
+        c = ex.submit('touch '+tmp+'/c', 'c', depends_on=[b])
+        d = ex.submit('touch '+tmp+'/d', 'd', depends_on=[a], depends_how='afterany')
+        try:
+            ex.wait()
+            raise AssertionError('should have failed')
+        except RuntimeError as e:
+            assert 'a' in str(e) and 'b' in str(e)
+        assert [ex.jobs[i]['status'] for i in (a, b, c, d)] == ['failed', 'cancelled', 'cancelled', 'done']
+        assert not os.path.exists(tmp+'/b') and os.path.exists(tmp+'/d')
+        ex.wait([d])  # does not raise
+
+
+def test_restart_skips_finished_jobs():
+    """Jobs which finished in a previous run (same command and dependencies) are not run again"""
+    with tempfile.TemporaryDirectory() as tmp:
+        f = tmp+'/count'
+        ex = _executor(tmp+'/state')
+        a = ex.submit('echo a >> '+f, 'a')
+        ex.submit('exit 1', 'b', depends_on=[a])
+        try:
+            ex.wait()
+        except RuntimeError:
+            pass
+        state = json.load(open(tmp+'/state/local_jobs.json'))
+        assert [job['status'] for job in state.values()] == ['done', 'failed']
+
+        ex = _executor(tmp+'/state')
+        a = ex.submit('echo a >> '+f, 'a')
+        b = ex.submit('echo b >> '+f, 'b', depends_on=[a])  # changed command runs
+        ex.wait()
+        assert open(f).read().split() == ['a', 'b']
+        assert ex.jobs[a]['status'] == ex.jobs[b]['status'] == 'done'
+
+
+if __name__ == '__main__':
+    test_parse()
+    test_dependencies()
+    test_failure()
+    test_restart_skips_finished_jobs()
@@ -0,0 +1,46 @@
+import os, tempfile, time
+import datetime as dt
+
+from dartwrf.monitor import parse_rsl, member_status
+
+
+def _write_rsl(dir_run, n_steps, elapsed=0.5, complete=False):
+    os.makedirs(dir_run, exist_ok=True)
+    t0 = dt.datetime(2008, 7, 30, 11)
+    with open(dir_run+'/rsl.out.0000', 'w') as f:
+        f.write(' Ntasks in X            4 , ntasks in Y            5\n')
+        for i in range(n_steps):
+            t = (t0 + dt.timedelta(seconds=10*(i+1))).strftime('%Y-%m-%d_%H:%M:%S')
+            f.write('Timing for main: time '+t+' on domain   1:    '+str(elapsed)+' elapsed seconds\n')
+            if i == 2:
+                f.write('Timing for Writing wrfout_d01_'+t+' for domain        1:    0.20000 elapsed seconds\n')
+        if complete:
+            f.write('d01 '+t+' wrf: SUCCESS COMPLETE WRF\n')
+
+
+def test_monitor():
+    """Speed and ETA from timing lines; finished, stalled and missing members are recognized"""
+    start, end = dt.datetime(2008, 7, 30, 11), dt.datetime(2008, 7, 30, 11, 10)
+    with tempfile.TemporaryDirectory() as tmp:
+        _write_rsl(tmp+'/1', n_steps=30)
+        steps = parse_rsl(open(tmp+'/1/rsl.out.0000').read())
+        assert len(steps) == 30 and steps[-1][0] == dt.datetime(2008, 7, 30, 11, 5)
+
+        s = member_status(tmp+'/1', start, end)
+        assert s['status'] == 'running'
+        assert s['progress'] == 0.5
+        assert s['speed'] == 20.  # 10 simulated s in 0.5 wallclock s
+        assert s['eta_s'] == 15.  # 300 simulated s left
+
+        s = member_status(tmp+'/1', start, end, stall_s=60, now=time.time()+120)
+        assert s['status'] == 'stalled'
+
+        _write_rsl(tmp+'/2', n_steps=60, complete=True)
+        s = member_status(tmp+'/2', start, end)
+        assert s['status'] == 'complete' and s['progress'] == 1.
+
+        assert member_status(tmp+'/3', start, end)['status'] == 'not started'
+
+
+if __name__ == '__main__':
+    test_monitor()
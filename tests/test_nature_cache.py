@@ -0,0 +1,38 @@
+import os, tempfile
+import numpy as np
+import netCDF4 as nc
+
+from dartwrf.obs import nature_cache
+
+
+def _write(f, var, value):
+    with nc.Dataset(f, 'w') as ds:
+        ds.createDimension('Time', 1)
+        ds.createDimension('south_north', 2)
+        ds.createDimension('west_east', 2)
+        for v in var:
+            ds.createVariable(v, 'f4', ('Time', 'south_north', 'west_east'))[:] = value
+
+
+def test_prepared_nature():
+    """The nature with geo_em coordinates is created once and reused, the source stays unchanged"""
+    with tempfile.TemporaryDirectory() as tmp:
+        f_nature, f_geo = tmp+'/wrfout_d01_2008-07-30_12:00:00', tmp+'/geo_em.d01.nc'
+        _write(f_nature, ['XLAT', 'XLONG'], 0.)
+        _write(f_geo, ['XLAT_M', 'XLONG_M'], 45.)
+
+        # ncks only copies global attributes, not needed here
+        f1 = nature_cache.prepared_nature(f_nature, f_geo, tmp+'/cache', ncks='true')
+        with nc.Dataset(f1) as ds:
+            assert np.all(ds.variables['XLAT'][:] == 45.)
+        with nc.Dataset(f_nature) as ds:
+            assert np.all(ds.variables['XLAT'][:] == 0.)
+
+        mtime = os.path.getmtime(f1)
+        f2 = nature_cache.prepared_nature(f_nature, f_geo, tmp+'/cache', ncks='false')  # would fail if run
+        assert f2 == f1 and os.path.getmtime(f2) >= mtime
+        assert not os.access(f1, os.W_OK) or os.geteuid() == 0
+
+
+if __name__ == '__main__':
+    test_prepared_nature()
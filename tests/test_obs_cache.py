@@ -0,0 +1,77 @@
+import os, tempfile, time, types
+import datetime as dt
+
+from dartwrf.obs import obs_cache
+
+
+def test_obs_cache():
+    """Equal nature and obs settings share cached observations, old files are evicted"""
+    with tempfile.TemporaryDirectory() as tmp:
+        f_nature = tmp+'/wrfout_d01_2008-07-30_12:00:00'
+        with open(f_nature, 'w') as f:
+            f.write('nature')
+        obs = dict(kind='MSG_4_SEVIRI_TB', sat_channel=6, km_between_obs=12, skip_border_km=8.,
+                   error_generate=1., error_assimilate=2., loc_horiz_km=12)
+        cfg = types.SimpleNamespace(dir_obs_cache=tmp+'/cache', dir_dart_src=tmp,
+                                    assimilate_these_observations=[obs])
+        t = dt.datetime(2008, 7, 30, 12)
+        key = obs_cache.cache_key(cfg, t, f_nature)
+
+        # settings which only affect the assimilation do not change the key
+        cfg2 = types.SimpleNamespace(**vars(cfg))
+        cfg2.assimilate_these_observations = [dict(obs, error_assimilate=4., loc_horiz_km=20)]
+        assert obs_cache.cache_key(cfg2, t, f_nature) == key
+        cfg2.assimilate_these_observations = [dict(obs, error_generate=2.)]
+        assert obs_cache.cache_key(cfg2, t, f_nature) != key
+        assert obs_cache.cache_key(cfg, t + dt.timedelta(minutes=15), f_nature) != key
+
+        assert not obs_cache.fetch(cfg, key, tmp+'/obs_seq.out')
+        with open(tmp+'/generated', 'w') as f:
+            f.write('x'*1000)
+        obs_cache.store(cfg, key, tmp+'/generated')
+        assert obs_cache.fetch(cfg, key, tmp+'/obs_seq.out')
+        assert open(tmp+'/obs_seq.out').read() == 'x'*1000
+
+        # least recently used file goes first
+        older = tmp+'/cache/old.obs_seq.out'
+        with open(older, 'w') as f:
+            f.write('y'*1000)
+        os.utime(older, (time.time()-100, time.time()-100))
+        assert obs_cache.evict(tmp+'/cache', max_bytes=1500) == 1
+        assert not os.path.exists(older) and obs_cache.fetch(cfg, key, tmp+'/obs_seq.out')
+
+
+def test_cache_key_namelists():
+    """Forward operator namelists change the key, other namelist sections do not"""
+    with tempfile.TemporaryDirectory() as tmp:
+        f_nature = tmp+'/wrfout_d01_2008-07-30_12:00:00'
+        f_rttov = tmp+'/obs_def_rttov.VIS.nml'
+        for f in [f_nature, f_rttov]:
+            with open(f, 'w') as fh:
+                fh.write('&obs_def_rttov_nml\n   rttov_sensor_db_file = "rttov_sensor_db.csv"\n/\n')
+        obs = dict(kind='MSG_4_SEVIRI_TB', sat_channel=6, km_between_obs=12, error_generate=1.)
+        cfg = types.SimpleNamespace(dir_dart_src=tmp, assimilate_these_observations=[obs],
+                                    rttov_nml=f_rttov,
+                                    dart_nml={'&filter_nml': dict(ens_size=40),
+                                              '&obs_def_radar_mod_nml': dict(use_variable_mean_fall_velocity=False)})
+        t = dt.datetime(2008, 7, 30, 12)
+        key = obs_cache.cache_key(cfg, t, f_nature)
+
+        cfg.dart_nml = {'&filter_nml': dict(ens_size=20),
+                        '&obs_def_radar_mod_nml': dict(use_variable_mean_fall_velocity=False)}
+        assert obs_cache.cache_key(cfg, t, f_nature) == key
+
+        cfg.dart_nml = {'&filter_nml': dict(ens_size=40),
+                        '&obs_def_radar_mod_nml': dict(use_variable_mean_fall_velocity=True)}
+        assert obs_cache.cache_key(cfg, t, f_nature) != key
+
+        cfg.dart_nml = {'&filter_nml': dict(ens_size=40),
+                        '&obs_def_radar_mod_nml': dict(use_variable_mean_fall_velocity=False)}
+        with open(f_rttov, 'a') as fh:
+            fh.write('&obs_def_visir_nml\n   use_zeeman = .true.\n/\n')
+        assert obs_cache.cache_key(cfg, t, f_nature) != key
+
+
+if __name__ == '__main__':
+    test_obs_cache()
+    test_cache_key_namelists()
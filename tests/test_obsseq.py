@@ -88,5 +88,47 @@ def test_concat_obsseq():
     os.remove(f_output)
 
 
+def test_remove_obs_of_type():
+    """Observation types are looked up in the header of the obs_seq file"""
+    f = os.path.dirname(__file__) + '/test_input/obs_seq.T2m+WV73.out'
+    oso = obsseq.ObsSeq(f)
+    n_obs = len(oso.df)
+
+    oso.remove_obs_of_type(kind_str='SYNOP_TEMPERATURE')
+    assert (oso.df.kind == 261).all()
+    assert 0 < len(oso.df) < n_obs
+    assert oso.obstypes == [(261, 'MSG_4_SEVIRI_TB')]
+
+
+def test_obskind_registry():
+    """obs_kind_mod.f90 is parsed once and cached"""
+    import tempfile
+    from dartwrf.obs import obskind
+
+    with tempfile.TemporaryDirectory() as tmp:
+        dart_srcdir = tmp + '/DART/models/wrf/work'
+        f_def = obskind.definition_file(dart_srcdir)
+        os.makedirs(dart_srcdir)
+        os.makedirs(os.path.dirname(f_def))
+        with open(f_def, 'w') as f:
+            f.write('! Integer definitions for DART OBS TYPES\n'
+                    + 'integer, parameter, public ::     SYNOP_TEMPERATURE =   102\n'
+                    + 'integer, parameter, public ::       MSG_4_SEVIRI_TB =   261\n'
+                    + 'integer, parameter, public :: MAX_DEFINED_TYPES_OF_OBS = 2\n')
+
+        obskind.dir_cache = tmp + '/cache'
+        kinds = obskind.read(dart_srcdir)
+        assert kinds['MSG_4_SEVIRI_TB'] == 261
+        assert kinds.name(102) == 'SYNOP_TEMPERATURE'
+        assert obskind.read(dart_srcdir) is kinds
+        assert len(os.listdir(tmp + '/cache')) == 1
+
+        # read from the JSON cache in a new process
+        obskind._memo.clear()
+        assert obskind.read(dart_srcdir) == kinds
+
+
 if __name__ == '__main__':
-    test_concat_obsseq()
\ No newline at end of file
+    test_concat_obsseq()
+    test_remove_obs_of_type()
+    test_obskind_registry()
\ No newline at end of file
@@ -0,0 +1,103 @@
+import os, sys, tempfile, subprocess
+
+from dartwrf import resources
+
+
+def test_predict():
+    """Without history the defaults are used, with history the quantile times a margin"""
+    with tempfile.TemporaryDirectory() as tmp:
+        f_db = tmp+'/resources.sqlite'
+        features = dict(ensemble_size=40, nproc=20)
+        assert resources.slurm_resources(f_db, 'assimilate', features, 30, '110G') == {'time': '30', 'mem': '110G'}
+
+        for wall_s in [600, 660, 720]:
+            resources.record(f_db, 'run_WRF', features, wall_s, 4000, scale=2.)  # 2 simulated hours
+        wall_s, mem_MB = resources.predict(f_db, 'run_WRF', features, scale=1.)
+        assert 300 <= wall_s <= 360 and mem_MB == 4000
+
+        sized = resources.slurm_resources(f_db, 'run_WRF', features, 80, '100G', scale=1.)
+        assert sized == {'time': '8', 'mem': '6G'}
+
+        # other features: no history
+        assert resources.predict(f_db, 'run_WRF', dict(ensemble_size=10, nproc=20)) is None
+
+
+def test_wrap_command():
+    """Wrapped commands are recorded with their exit state"""
+    with tempfile.TemporaryDirectory() as tmp:
+        f_db = tmp+'/resources.sqlite'
+        python = 'export PYTHONPATH='+os.path.dirname(os.path.dirname(os.path.abspath(__file__)))+'; '+sys.executable
+        for cmd in ['echo "$HOME" > '+tmp+'/out', 'exit 3']:
+            wrapped = resources.wrap_command(python, f_db, 'test', dict(a=1), cmd)
+            subprocess.run(wrapped, shell=True, executable='/bin/bash')
+        assert open(tmp+'/out').read().strip() == os.environ['HOME']
+
+        for _ in range(2):
+            subprocess.run(wrapped, shell=True, executable='/bin/bash')
+        assert resources.predict(f_db, 'test', dict(a=1), min_samples=1) is not None
+        states = [r[0] for r in resources._execute(f_db, 'SELECT exit_state FROM runs')]
+        assert sorted(states) == ['COMPLETED', 'FAILED', 'FAILED', 'FAILED']
+
+        # SIGTERM (from SLURM) at the time limit: recorded as TIMEOUT, with the limit as runtime
+        import time, signal
+        for name, time_limit_s in [('slow', '1'), ('cancelled', '60')]:
+            wrapped = (python+' -m dartwrf.resources '+f_db+' '+name+" '{}' 1 "+time_limit_s+" - <<'EOF'\n"
+                       "sleep 30\nEOF")
+            proc = subprocess.Popen(wrapped, shell=True, executable='/bin/bash', start_new_session=True)
+            time.sleep(1.5)
+            os.killpg(proc.pid, signal.SIGTERM)
+            proc.wait()
+        rows = resources._execute(f_db, "SELECT job_type, exit_state, wall_s_per_unit FROM runs "
+                                        "WHERE job_type IN ('slow', 'cancelled')")
+        assert rows[0] == ('slow', 'TIMEOUT', 1.)
+        assert rows[1][:2] == ('cancelled', 'FAILED')  # long before the limit, e.g. scancel
+
+
+def test_limit_failures():
+    """A job which ran out of time or memory raises the next request above its limit"""
+    with tempfile.TemporaryDirectory() as tmp:
+        f_db = tmp+'/resources.sqlite'
+        features = dict(ensemble_size=40)
+        assert resources.exit_state(0, 10, 10, 60, 100) == 'COMPLETED'
+        assert resources.exit_state(137, 10, 95, 60, 100) == 'OUT_OF_MEMORY'
+        assert resources.exit_state(137, 10, 10, 60, 100, oom_killed=True) == 'OUT_OF_MEMORY'
+        assert resources.exit_state(1, 10, 95, 60, 100) == 'FAILED'
+
+        # no successful runs yet: the limit that failed is raised, the other value stays the default
+        resources.record(f_db, 'assimilate', features, 30*60, 5000, exit_state='TIMEOUT')
+        sized = resources.slurm_resources(f_db, 'assimilate', features, 30, '110G', margin=1.)
+        assert sized == {'time': '45', 'mem': '110G'}
+
+        # successful runs which used less than a memory limit that failed
+        for _ in range(3):
+            resources.record(f_db, 'run_WRF', features, 600, 4000)
+        resources.record(f_db, 'run_WRF', features, 100, 6000, exit_state='OUT_OF_MEMORY')
+        wall_s, mem_MB = resources.predict(f_db, 'run_WRF', features)
+        assert wall_s == 600 and mem_MB == 9000
+
+        # other failures do not change the prediction
+        resources.record(f_db, 'run_WRF', dict(b=1), 600, 4000)
+        resources.record(f_db, 'run_WRF', dict(b=1), 1, 10, exit_state='FAILED')
+        assert resources.predict(f_db, 'run_WRF', dict(b=1), min_samples=1) == (600, 4000)
+
+
+def test_old_database():
+    """Databases without the exit_state column are upgraded, their runs count as completed"""
+    import sqlite3
+    with tempfile.TemporaryDirectory() as tmp:
+        f_db = tmp+'/resources.sqlite'
+        con = sqlite3.connect(f_db)
+        with con:
+            con.execute("""CREATE TABLE runs (job_type TEXT, features TEXT, wall_s_per_unit REAL,
+                                              maxrss_MB REAL, finished TEXT)""")
+            con.execute("INSERT INTO runs VALUES ('t', '{}', 10, 20, '2024-01-01T00:00:00')")
+        con.close()
+        assert resources.predict(f_db, 't', {}, min_samples=1) == (10, 20)
+        resources.record(f_db, 't', {}, 10, 20)
+
+
+if __name__ == '__main__':
+    test_predict()
+    test_wrap_command()
+    test_limit_failures()
+    test_old_database()
@@ -0,0 +1,75 @@
+import os, json, stat, tempfile
+import datetime as dt
+from types import SimpleNamespace
+
+from dartwrf import workflows
+
+# stands in for wrf.exe: records its CPUs and run time, member 3 fails on the first attempt
+fake_exe = """#!/bin/bash
+echo "$I_MPI_PIN_PROCESSOR_LIST $(date +%s.%N)" > cpus
+sleep 0.3
+echo "$(date +%s.%N)" >> cpus
+if [ "$(basename $PWD)" = 3 ] && [ ! -e failed_once ]; then touch failed_once; exit 1; fi
+echo 'd01 SUCCESS COMPLETE WRF' > rsl.out.0000
+"""
+
+
+def _write_script(path, text):
+    with open(path, 'w') as f:
+        f.write(text)
+    os.chmod(path, os.stat(path).st_mode | stat.S_IEXEC)
+
+
+def test_run_ensemble_locally():
+    """Members are packed onto slots of nproc cores, at most one member per slot at a time,
+    failed members are retried"""
+    with tempfile.TemporaryDirectory() as tmp:
+        # this machine may have a single CPU: pretend to have 4, taskset and mpirun only run the command
+        os.makedirs(tmp+'/bin')
+        _write_script(tmp+'/bin/taskset', '#!/bin/bash\nshift 2\nexec "$@"\n')
+        _write_script(tmp+'/bin/mpirun', '#!/bin/bash\nshift 2\nexec "$@"\n')
+        path, getaffinity = os.environ['PATH'], os.sched_getaffinity
+        os.environ['PATH'] = tmp+'/bin:' + path
+        os.sched_getaffinity = lambda pid: {0, 1, 2, 3}
+
+        cfg = SimpleNamespace(name='exp', ensemble_size=5, dir_wrf_run=tmp+'/run_WRF/<exp>/<ens>',
+                              dir_log=tmp+'/logs', wrf_modules=None, max_nproc_for_each_ensemble_member=2,
+                              time=dt.datetime(2008, 7, 30, 12))
+        for iens in range(1, 6):
+            os.makedirs(tmp+'/run_WRF/exp/'+str(iens))
+            _write_script(tmp+'/run_WRF/exp/'+str(iens)+'/wrf.exe', fake_exe)
+        try:
+            success = workflows.run_ensemble_locally(cfg, max_retries=1)
+        finally:
+            os.environ['PATH'], os.sched_getaffinity = path, getaffinity
+
+        assert success == {iens: True for iens in range(1, 6)}
+        status = json.load(open(tmp+'/logs/member_status.wrf.exe.json'))
+        assert status['members']['3']['attempts'] == 2 and status['members']['1']['attempts'] == 1
+
+        runs = {}
+        for iens in range(1, 6):
+            lines = open(tmp+'/run_WRF/exp/'+str(iens)+'/cpus').read().split()
+            runs[iens] = (lines[0], float(lines[1]), float(lines[2]))
+        assert {cpus for cpus, _, _ in runs.values()} == {'0,1', '2,3'}
+        for cpus in ['0,1', '2,3']:
+            # members in the same slot do not overlap
+            intervals = sorted((t0, t1) for c, t0, t1 in runs.values() if c == cpus)
+            assert all(t1 <= t0_next for (_, t1), (t0_next, _) in zip(intervals, intervals[1:]))
+
+        # without retries, failures raise
+        os.remove(tmp+'/run_WRF/exp/3/failed_once')
+        os.remove(tmp+'/run_WRF/exp/3/rsl.out.0000')
+        os.environ['PATH'] = tmp+'/bin:' + path
+        os.sched_getaffinity = lambda pid: {0, 1, 2, 3}
+        try:
+            workflows.run_ensemble_locally(cfg)
+            raise AssertionError('should have failed')
+        except RuntimeError as e:
+            assert '[3]' in str(e)
+        finally:
+            os.environ['PATH'], os.sched_getaffinity = path, getaffinity
+
+
+if __name__ == '__main__':
+    test_run_ensemble_locally()
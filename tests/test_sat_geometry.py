@@ -0,0 +1,66 @@
+import tempfile
+import datetime as dt
+import numpy as np
+
+from dartwrf.obs import sat_geometry
+from dartwrf.obs import create_obsseq_in as osi
+
+
+def test_solar_position():
+    """Close to pysolar (which also corrects for refraction) when the sun is high"""
+    from pysolar.solar import get_altitude, get_azimuth
+
+    time_dt = dt.datetime(2008, 7, 30, 11, 17, tzinfo=dt.timezone.utc)
+    lats, lons = np.array([45., 48.3, 40.1, 52.]), np.array([0., 16.4, -5.2, 10.])
+    sun_az, sun_zen = sat_geometry.solar_position(time_dt, lats, lons)
+    for i in range(len(lats)):
+        assert abs(sun_az[i] - get_azimuth(lats[i], lons[i], time_dt)) < 0.5
+        assert abs(sun_zen[i] - (90 - get_altitude(lats[i], lons[i], time_dt))) < 0.5
+
+
+def test_geostationary_view():
+    sat_az, sat_zen = sat_geometry.geostationary_view([0., 45., 45., 45.], [0., 0., 10., -10.])
+    assert sat_zen[0] < 1e-6
+    assert abs(sat_az[1] - 180) < 1e-6 and 50 < sat_zen[1] < 53
+    assert 180 < sat_az[2] < 270 and 90 < sat_az[3] < 180  # satellite to the southwest / southeast
+    assert abs(sat_zen[2] - sat_zen[3]) < 1e-6
+
+    # the satellite moves with sat_lon
+    _, sat_zen = sat_geometry.geostationary_view([0.], [9.5], sat_lon=9.5)
+    assert sat_zen[0] < 1e-6
+
+
+def test_viewing_geometry_cached():
+    time_dt = dt.datetime(2008, 7, 30, 12)
+    a = sat_geometry.viewing_geometry(time_dt, [45., 46.], [0., 1.])
+    assert sat_geometry.viewing_geometry(time_dt, [45., 46.], [0., 1.]) is a
+    assert sat_geometry.viewing_geometry(time_dt, [45., 46.], [0., 2.]) is not a
+    assert sat_geometry.viewing_geometry(time_dt + dt.timedelta(minutes=15), [45., 46.], [0., 1.]) is not a
+
+
+def test_obs_seq_in_per_obs_geometry():
+    obscfg = dict(kind='MSG_4_SEVIRI_TB', sat_channel=1, error_generate=0.03, per_obs_geometry=True,
+                  obs_locations=[(45., -10.), (48., 10.)])
+    time_dt = dt.datetime(2008, 7, 30, 12)
+    with tempfile.TemporaryDirectory() as tmp:
+        osi.write_obs_seq_in(tmp+'/obs_seq.in', time_dt, [obscfg], {'MSG_4_SEVIRI_TB': 261})
+        lines = open(tmp+'/obs_seq.in').read().split('\n')
+
+    angles = sat_geometry.viewing_geometry(osi._add_timezone_UTC(time_dt), [45., 48.], [-10., 10.])
+    i_visir = [i for i, line in enumerate(lines) if line == 'visir']
+    assert len(i_visir) == 2
+    for i_obs, i in enumerate(i_visir):
+        sat_az, sat_zen, sun_az = [float(v) for v in lines[i+1].split()]
+        sun_zen = float(lines[i+2])
+        assert abs(sat_az - angles['sat_az'][i_obs]) < 1e-3
+        assert abs(sat_zen - angles['sat_zen'][i_obs]) < 1e-3
+        assert abs(sun_az - angles['sun_az'][i_obs]) < 1e-3
+        assert abs(sun_zen - angles['sun_zen'][i_obs]) < 1e-3
+        assert lines[i+3].split()[-1] == '1'
+
+
+if __name__ == '__main__':
+    test_solar_position()
+    test_geostationary_view()
+    test_viewing_geometry_cached()
+    test_obs_seq_in_per_obs_geometry()
@@ -0,0 +1,91 @@
+import os, tempfile
+from types import SimpleNamespace
+
+from dartwrf import assimilate, utils
+
+
+def _setup(tmp, dir_scratch):
+    cfg = SimpleNamespace(name='exp', ensemble_size=3, dir_dart_run=tmp+'/run_DART',
+                          dir_dart_scratch=dir_scratch, max_copy_threads=2)
+    for iens in range(1, 4):
+        os.makedirs(tmp+'/prior/'+str(iens))
+        with open(tmp+'/prior/'+str(iens)+'/wrfout_d01', 'w') as f:
+            f.write('prior '+str(iens))
+        os.makedirs(cfg.dir_dart_run+'/prior_ens'+str(iens))
+        os.symlink(tmp+'/prior/'+str(iens)+'/wrfout_d01',
+                   cfg.dir_dart_run+'/prior_ens'+str(iens)+'/wrfout_d01')
+    return cfg
+
+
+def test_stage_and_fetch_scratch():
+    """Prior files are copied to scratch, the file lists point there,
+    filter output is moved back and scratch is cleaned up"""
+    with tempfile.TemporaryDirectory() as tmp:
+        cfg = _setup(tmp, tmp+'/scratch/<exp>')
+
+        assimilate.stage_prior_to_scratch(cfg)
+        dir_scratch = tmp+'/scratch/exp'
+        files_in = open(cfg.dir_dart_run+'/input_list.txt').read().split()
+        files_out = open(cfg.dir_dart_run+'/output_list.txt').read().split()
+        assert files_in == [dir_scratch+'/prior_ens'+str(i)+'/wrfout_d01' for i in range(1, 4)]
+        assert files_out == [dir_scratch+'/filter_restart_d01.'+str(i).zfill(4) for i in range(1, 4)]
+        for iens, f in enumerate(files_in, start=1):
+            assert not os.path.islink(f) and open(f).read() == 'prior '+str(iens)
+
+        # ./filter writes to scratch
+        for iens, f in enumerate(files_out, start=1):
+            with open(f, 'w') as fo:
+                fo.write('posterior '+str(iens))
+
+        for future in assimilate.fetch_filter_output_from_scratch(cfg):
+            future.result()
+        for iens in range(1, 4):
+            assert open(cfg.dir_dart_run+'/filter_restart_d01.'+str(iens).zfill(4)).read() == 'posterior '+str(iens)
+        assert not any(os.path.isfile(f) for f in files_in + files_out)
+        # the prior in the run directory is untouched
+        assert open(cfg.dir_dart_run+'/prior_ens1/wrfout_d01').read() == 'prior 1'
+
+
+def test_stage_across_devices():
+    """Staging to tmpfs (another device) works for files copied in chunks"""
+    if not os.path.isdir('/dev/shm'):
+        return
+    large_file_bytes = utils.large_file_bytes
+    utils.large_file_bytes = 4
+    try:
+        with tempfile.TemporaryDirectory() as tmp, tempfile.TemporaryDirectory(dir='/dev/shm') as shm:
+            cfg = _setup(tmp, shm+'/<exp>')
+            assimilate.stage_prior_to_scratch(cfg)
+            files_in = open(cfg.dir_dart_run+'/input_list.txt').read().split()
+            for iens, f in enumerate(files_in, start=1):
+                assert f.startswith(shm) and open(f).read() == 'prior '+str(iens)
+
+            for iens in range(1, 4):
+                with open(shm+'/exp/filter_restart_d01.'+str(iens).zfill(4), 'w') as fo:
+                    fo.write('posterior '+str(iens))
+            for future in assimilate.fetch_filter_output_from_scratch(cfg):
+                future.result()
+            assert open(cfg.dir_dart_run+'/filter_restart_d01.0002').read() == 'posterior 2'
+    finally:
+        utils.large_file_bytes = large_file_bytes
+
+
+def test_unstage_scratch():
+    """After a failed filter, the file lists point to run_DART again and scratch is removed"""
+    with tempfile.TemporaryDirectory() as tmp:
+        cfg = _setup(tmp, tmp+'/scratch/<exp>')
+        assimilate.stage_prior_to_scratch(cfg)
+        assimilate.unstage_scratch(cfg)
+
+        assert not os.path.exists(tmp+'/scratch/exp')
+        files_in = open(cfg.dir_dart_run+'/input_list.txt').read().split()
+        files_out = open(cfg.dir_dart_run+'/output_list.txt').read().split()
+        assert files_in == ['./prior_ens'+str(i)+'/wrfout_d01' for i in range(1, 4)]
+        assert files_out == ['./filter_restart_d01.'+str(i).zfill(4) for i in range(1, 4)]
+        assert open(cfg.dir_dart_run+'/prior_ens1/wrfout_d01').read() == 'prior 1'
+
+
+if __name__ == '__main__':
+    test_stage_and_fetch_scratch()
+    test_stage_across_devices()
+    test_unstage_scratch()
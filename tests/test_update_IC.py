@@ -0,0 +1,52 @@
+import tempfile
+import numpy as np
+import netCDF4 as nc
+
+from dartwrf import update_IC
+
+
+def test_blocks_equal():
+    a = np.arange(12, dtype='f4').reshape(3, 4)
+    assert update_IC._blocks_equal(a, a.copy())
+    assert not update_IC._blocks_equal(a, a[:2])
+    b = a.copy()
+    b[0, 0] += 0.01
+    assert not update_IC._blocks_equal(a, b)
+    assert update_IC._blocks_equal(a, b, tolerance=0.1)
+
+    # NaN equals NaN, integers are compared exactly
+    a[1, 1] = b[1, 1] = np.nan
+    assert update_IC._blocks_equal(a, b, tolerance=0.1)
+    assert update_IC._blocks_equal(np.arange(3), np.arange(3))
+    assert not update_IC._blocks_equal(np.arange(3), np.arange(1, 4))
+
+
+def test_write_changed_blocks():
+    """Only levels which changed are written, the result equals the new data"""
+    rng = np.random.default_rng(0)
+    old = rng.normal(size=(1, 4, 3, 5)).astype('f4')
+    new = old.copy()
+    new[0, 2] += 1.
+    with tempfile.TemporaryDirectory() as tmp:
+        with nc.Dataset(tmp+'/f.nc', 'w') as ds:
+            for name, size in zip(['Time', 'bottom_top', 'south_north', 'west_east'], old.shape):
+                ds.createDimension(name, size)
+            ds.createVariable('T', 'f4', ('Time', 'bottom_top', 'south_north', 'west_east'))[:] = old
+            ds.createVariable('MU', 'f4', ('Time', 'west_east'))[:] = old[:, 0, 0]
+
+        with nc.Dataset(tmp+'/f.nc', 'r+') as ds:
+            n_written, n_skipped = update_IC.write_changed_blocks(ds.variables['T'], new)
+            assert n_written == new[:, 2].nbytes and n_skipped == 3*new[:, 2].nbytes
+
+            # 2D variable: one block
+            assert update_IC.write_changed_blocks(ds.variables['MU'], old[:, 0, 0]) == (0, old[:, 0, 0].nbytes)
+            assert update_IC.write_changed_blocks(ds.variables['MU'], old[:, 0, 0]+1)[0] > 0
+
+        with nc.Dataset(tmp+'/f.nc') as ds:
+            np.testing.assert_array_equal(ds.variables['T'][:], new)
+            np.testing.assert_array_equal(ds.variables['MU'][:], old[:, 0, 0]+1)
+
+
+if __name__ == '__main__':
+    test_blocks_equal()
+    test_write_changed_blocks()
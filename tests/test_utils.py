@@ -0,0 +1,269 @@
+import os, tempfile, filecmp
+
+from dartwrf import utils
+
+
+def test_copy():
+    """Copy a file, then copy again: the second copy is skipped,
+    unless the destination was modified."""
+    with tempfile.TemporaryDirectory() as tmp:
+        src = tmp+'/src'
+        dst = tmp+'/dst'
+        with open(src, 'wb') as f:
+            f.write(os.urandom(3 << 20))
+
+        utils.copy(src, dst, skip_if_identical=True)
+        assert filecmp.cmp(src, dst, shallow=False)
+        assert utils.files_identical(src, dst)
+
+        # modify destination in place
+        with open(dst, 'r+b') as f:
+            f.write(b'0000')
+        assert not utils.files_identical(src, dst)
+
+        utils.copy(src, dst, skip_if_identical=True)
+        assert filecmp.cmp(src, dst, shallow=False)
+
+
+def test_files_identical():
+    """A difference anywhere in the file is detected, even with equal size and mtime"""
+    with tempfile.TemporaryDirectory() as tmp:
+        src = tmp+'/src'
+        dst = tmp+'/dst'
+        with open(src, 'wb') as f:
+            f.write(os.urandom(5 << 20))
+        utils.copy(src, dst, skip_if_identical=True)
+        assert utils.files_identical(src, dst)
+
+        with open(dst, 'r+b') as f:
+            f.seek(3 << 19)
+            f.write(b'0000')
+        st = os.stat(src)
+        os.utime(dst, ns=(st.st_atime_ns, st.st_mtime_ns))
+        assert not utils.files_identical(src, dst)
+
+        utils.copy(src, dst, skip_if_identical=True)
+        assert filecmp.cmp(src, dst, shallow=False)
+
+
+def test_copy_same_file():
+    """Copying a file onto itself raises and leaves the file intact"""
+    import shutil
+    with tempfile.TemporaryDirectory() as tmp:
+        src = tmp+'/src'
+        with open(src, 'wb') as f:
+            f.write(b'data')
+        os.symlink(src, tmp+'/link')
+
+        for dst, kwargs in [(tmp+'/./src', {}), (tmp+'/link', dict(remove_if_exists=False))]:
+            try:
+                utils.copy(src, dst, **kwargs)
+                raise AssertionError('should have failed')
+            except shutil.SameFileError:
+                pass
+            assert open(src, 'rb').read() == b'data'
+
+        # the link is replaced by a copy
+        utils.copy(src, tmp+'/link')
+        assert not os.path.islink(tmp+'/link') and open(tmp+'/link', 'rb').read() == b'data'
+
+
+def test_parallel_chunked_copy():
+    with tempfile.TemporaryDirectory() as tmp:
+        src = tmp+'/src'
+        dst = tmp+'/dst'
+        with open(src, 'wb') as f:
+            f.write(os.urandom((5 << 20) + 123))
+
+        utils._parallel_chunked_copy(src, dst, chunk_size=1 << 20)
+        assert filecmp.cmp(src, dst, shallow=False)
+
+
+def test_copy_across_devices():
+    """Large files are copied between filesystems (copy_file_range fails with EXDEV there)"""
+    if not os.path.isdir('/dev/shm'):
+        return
+    large_file_bytes = utils.large_file_bytes
+    utils.large_file_bytes = 1 << 20
+    try:
+        with tempfile.TemporaryDirectory() as tmp, tempfile.TemporaryDirectory(dir='/dev/shm') as shm:
+            src = tmp+'/src'
+            with open(src, 'wb') as f:
+                f.write(os.urandom((3 << 20) + 123))
+
+            utils.copy(src, shm+'/dst')
+            assert filecmp.cmp(src, shm+'/dst', shallow=False)
+            utils._parallel_chunked_copy(shm+'/dst', tmp+'/back', chunk_size=1 << 20)
+            assert filecmp.cmp(src, tmp+'/back', shallow=False)
+    finally:
+        utils.large_file_bytes = large_file_bytes
+
+
+def test_run_process():
+    """Output goes to a (rotated) log file, metrics are recorded, failures raise"""
+    import json
+    with tempfile.TemporaryDirectory() as tmp:
+        log = tmp+'/log.test'
+        metrics = tmp+'/metrics.jsonl'
+        utils.run_process('echo first', log_file=log, metrics_file=metrics, name='first')
+        utils.run_process('echo second >&2', log_file=log, metrics_file=metrics)
+
+        assert open(log).read() == 'second\n'
+        assert open(log+'.1').read() == 'first\n'
+
+        records = [json.loads(line) for line in open(metrics)]
+        assert records[0]['name'] == 'first'
+        assert records[1]['returncode'] == 0
+
+        try:
+            utils.run_process('exit 3')
+            raise AssertionError('should have failed')
+        except RuntimeError:
+            pass
+        assert utils.run_process('exit 3', check=False) == 3
+
+        try:
+            utils.run_process('sleep 10', timeout=0.3)
+            raise AssertionError('should have timed out')
+        except TimeoutError:
+            pass
+
+
+def test_config_store():
+    """Equal configs share one file, loading a config does not write a new one"""
+    import glob
+    with tempfile.TemporaryDirectory() as tmp:
+        cfg = utils.Config(name='test', model_dx=2000, ensemble_size=4,
+                           dir_archive=tmp+'/<exp>/', update_vars=['THM'], dart_nml={'&a': {}})
+        cfg2 = utils.Config(name='test', model_dx=2000, ensemble_size=4,
+                            dir_archive=tmp+'/<exp>/', update_vars=['THM'], dart_nml={'&a': {}})
+        assert cfg.f_cfg_current == cfg2.f_cfg_current
+        assert len(glob.glob(cfg.f_cfg_base+'/cfg_*.pkl')) == 1
+
+        loaded = utils.Config.from_file(cfg.f_cfg_current)
+        assert loaded.__dict__ == cfg.__dict__
+        assert len(glob.glob(cfg.f_cfg_base+'/cfg_*.pkl')) == 1
+
+        loaded.update(ensemble_size=8)
+        assert loaded.f_cfg_current != cfg.f_cfg_current
+        assert utils.Config.from_file(loaded.f_cfg_current).ensemble_size == 8
+
+        loaded.add_to_index('assimilate-12:00', 123)
+        assert '"job_id": 123' in open(cfg.f_cfg_base+'/index.jsonl').read()
+
+        # an explicit path is written even if the file exists
+        f_explicit = tmp+'/explicit.pkl'
+        cfg.to_file(f_explicit)
+        loaded.to_file(f_explicit)
+        assert utils.Config.from_file(f_explicit).ensemble_size == 8
+
+
+def test_config_from_file_formats():
+    """Older experiments stored pickles as cfg_*.yaml, both formats load regardless of the file name"""
+    import pickle, yaml
+    with tempfile.TemporaryDirectory() as tmp:
+        d = dict(name='test', model_dx=2000, ensemble_size=4, update_vars=['THM'], use_pickle=True)
+        f_pickled = tmp+'/cfg_0123abcd.yaml'
+        with open(f_pickled, 'wb') as handle:
+            pickle.dump(d, handle, protocol=pickle.HIGHEST_PROTOCOL)
+        assert utils.Config.from_file(f_pickled).__dict__ == d
+
+        f_yaml = tmp+'/config.yaml'
+        with open(f_yaml, 'w') as f:
+            yaml.dump(dict(d, use_pickle=False), f)
+        assert utils.Config.from_file(f_yaml).use_pickle is False
+
+
+def test_config_hash_canonical():
+    """The hash does not depend on the order of dicts and sets (sets differ between interpreters)"""
+    import sys, subprocess
+    code = ("import sys; from dartwrf import utils; "
+            "cfg = utils.Config(name='test', model_dx=2000, ensemble_size=4, dir_archive=sys.argv[1], "
+            "update_vars=['THM'], dart_nml={'&a': {'x': 1, 'y': 2}, '&b': {}}, "
+            "kinds={'RADAR_REFLECTIVITY', 'MSG_4_SEVIRI_TB', 'SYNOP_TEMPERATURE', 'RADIOSONDE_U_WIND_COMPONENT'}); "
+            "print(cfg.content_hash())")
+    env = dict(os.environ, PYTHONPATH=os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+    hashes = set()
+    with tempfile.TemporaryDirectory() as tmp:
+        for seed in ['1', '2', '3']:
+            env['PYTHONHASHSEED'] = seed
+            out = subprocess.run([sys.executable, '-c', code, tmp+'/'], env=env, capture_output=True,
+                                 text=True, check=True)
+            hashes.add(out.stdout.split()[-1])
+    assert len(hashes) == 1
+
+    assert utils._canonical({'b': 1, 'a': {2, 1}}) == utils._canonical({'a': {1, 2}, 'b': 1})
+    assert utils._canonical([1, 2]) != utils._canonical((1, 2))
+
+
+def test_sync_tree():
+    """Only new or changed files are copied, deleted files are removed"""
+    import shutil, json
+    with tempfile.TemporaryDirectory() as tmp:
+        src = tmp+'/src'
+        dst = tmp+'/dst'
+        os.makedirs(src+'/sub')
+        os.makedirs(src+'/.git')
+        for f in ['a.py', 'sub/b.py', '.git/HEAD']:
+            with open(src+'/'+f, 'w') as fh:
+                fh.write(f)
+        ignore = shutil.ignore_patterns('.git')
+
+        res = utils.sync_tree(src, dst, ignore=ignore)
+        assert sorted(res['copied']) == ['a.py', 'sub/b.py']
+        assert not os.path.exists(dst+'/.git')
+
+        res = utils.sync_tree(src, dst, ignore=ignore)
+        assert res['copied'] == [] and len(res['unchanged']) == 2
+
+        # same content, new mtime: not copied
+        os.utime(src+'/a.py', (0, 0))
+        with open(src+'/sub/b.py', 'w') as fh:
+            fh.write('changed')
+        res = utils.sync_tree(src, dst, ignore=ignore)
+        assert res['copied'] == ['sub/b.py']
+        assert int(os.stat(dst+'/a.py').st_mtime) == 0
+
+        os.remove(src+'/a.py')
+        res = utils.sync_tree(src, dst, ignore=ignore)
+        assert res['removed'] == ['a.py'] and not os.path.exists(dst+'/a.py')
+
+        manifest = json.load(open(dst+'/manifest.json'))
+        assert list(manifest['files']) == ['sub/b.py']
+
+
+def test_copy_contents():
+    with tempfile.TemporaryDirectory() as tmp:
+        os.makedirs(tmp+'/src/sub')
+        for f in ['/src/a', '/src/sub/b', '/src/.hidden']:
+            with open(tmp+f, 'w') as fo:
+                fo.write(f)
+        os.symlink('a', tmp+'/src/link')
+        utils.mkdir(tmp+'/dst/x')
+        utils.mkdir(tmp+'/dst/x')  # exists already
+
+        utils.copy_contents(tmp+'/src', tmp+'/dst')
+        utils.copy_contents(tmp+'/src', tmp+'/dst')  # overwrites
+        assert open(tmp+'/dst/sub/b').read() == '/src/sub/b'
+        assert os.readlink(tmp+'/dst/link') == 'a'
+        assert not os.path.exists(tmp+'/dst/.hidden')
+
+        try:
+            utils.copy_contents(tmp+'/missing', tmp+'/dst')
+            raise AssertionError('should have failed')
+        except FileNotFoundError:
+            pass
+
+
+if __name__ == '__main__':
+    test_copy()
+    test_files_identical()
+    test_copy_same_file()
+    test_parallel_chunked_copy()
+    test_copy_across_devices()
+    test_run_process()
+    test_config_store()
+    test_config_from_file_formats()
+    test_config_hash_canonical()
+    test_sync_tree()
+    test_copy_contents()
@@ -0,0 +1,56 @@
+import sys, glob, json, time, pickle, tempfile, threading
+
+from dartwrf import worker
+
+
+def _step(cfg):
+    """Step run by the worker: writes a file, then exits with `cfg.returncode`"""
+    with open(cfg.f_out, 'w') as f:
+        f.write(cfg.name)
+    if cfg.returncode == 'raise':
+        raise ValueError('step failed')
+    sys.exit(cfg.returncode)
+
+
+def _write_cfg(path, **d):
+    with open(path, 'wb') as f:
+        pickle.dump(d, f)
+    return path
+
+
+def test_worker_submit():
+    """Steps run in the worker, their return code is passed back to `submit`"""
+    steps = worker.STEPS
+    worker.STEPS = {'step.py': (__name__, '_step')}
+    with tempfile.TemporaryDirectory() as tmp:
+        dir_queue = tmp+'/queue'
+        server = threading.Thread(target=worker.serve, args=(dir_queue,),
+                                  kwargs=dict(idle_timeout_s=2, poll_interval_s=0.01))
+        server.start()
+        try:
+            while not worker.worker_is_alive(dir_queue):
+                time.sleep(0.01)
+
+            f_cfg = _write_cfg(tmp+'/ok.pkl', name='ok', f_out=tmp+'/ok', returncode=0)
+            assert worker.step_from_cmd('python /some/dir/step.py '+f_cfg) == ('step.py', f_cfg)
+            assert worker.step_from_cmd('python other.py '+f_cfg) == (None, None)
+
+            worker.submit(dir_queue, 'step.py', f_cfg, timeout=30)
+            assert open(tmp+'/ok').read() == 'ok'
+
+            for returncode in [3, 'raise']:
+                f_cfg = _write_cfg(tmp+'/fail.pkl', name='fail', f_out=tmp+'/fail', returncode=returncode)
+                try:
+                    worker.submit(dir_queue, 'step.py', f_cfg, timeout=30)
+                    raise AssertionError('should have failed')
+                except RuntimeError as e:
+                    assert 'step.py' in str(e)
+            results = [json.load(open(f))['returncode'] for f in sorted(glob.glob(dir_queue+'/*.result'))]
+            assert sorted(results) == [0, 1, 3]
+        finally:
+            server.join()  # stops after being idle
+            worker.STEPS = steps
+
+
+if __name__ == '__main__':
+    test_worker_submit()
@@ -5,44 +5,20 @@ from dartwrf.utils import Timer
 with Timer('imports'):
     import datetime as dt
     import pandas as pd
-    from dartwrf.workflows import WorkFlows
-    from dartwrf.utils import Config, run_bash_command_in_directory
+    from dartwrf.workflows import WorkFlows, run_ensemble_locally
+    from dartwrf.utils import Config
 
     # import default config for jet
     from config.jet import cluster_defaults
     from config.defaults import dart_nml
 
 def runWRF(cfg):
-    cmd = cfg.wrf_modules +'; '
-    
-    for iens in range(1, cfg.ensemble_size+1):
-        dir_wrf_run = cfg.dir_wrf_run.replace('<exp>', cfg.name).replace('<ens>', str(iens))
-
-        cmd += 'cd ' + dir_wrf_run + '; '
-        cmd += 'echo "'+dir_wrf_run+'"; '
-        cmd += 'mpirun -np 4 ./wrf.exe & '
-
-    cmd += 'wait; '
-    cmd += 'echo "WRF run completed."'
-
-    # Run the command in the specified directory
-    run_bash_command_in_directory(cmd, dir_wrf_run)
+    # pack members onto the cores of this machine
+    run_ensemble_locally(cfg, './wrf.exe')
     
 def runIdeal(cfg):
-    cmd = cfg.wrf_modules +'; '
-    
-    for iens in range(1, cfg.ensemble_size+1):
-        dir_wrf_run = cfg.dir_wrf_run.replace('<exp>', cfg.name).replace('<ens>', str(iens))
-
-        cmd += 'cd ' + dir_wrf_run + '; '
-        cmd += 'echo "'+dir_wrf_run+'"; '
-        cmd += 'mpirun -np 1 ./ideal.exe & '
-
-    cmd += 'wait; '
-    cmd += 'echo "ideal.exe completed."'
-
-    # Run the command in the specified directory
-    run_bash_command_in_directory(cmd, dir_wrf_run)
+    run_ensemble_locally(cfg, './ideal.exe', nproc=1, 
+                         success_msg='SUCCESS COMPLETE IDEAL INIT')
     
 ###############################
 